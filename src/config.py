@@ -10,15 +10,135 @@ class Settings:
     HF_EMBEDDING_MODEL = os.getenv("HF_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # openai|hf
     LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    # Fallback LLM (OpenAI-compatible Groq endpoint), used when OpenAI fails or has no key
+    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+    GROQ_API_URL = os.getenv("GROQ_API_URL") or "https://api.groq.com/openai/v1/chat/completions"
+    GROQ_MODEL = os.getenv("GROQ_MODEL", "")
+    # LLM calls: seconds per call including retries, per HTTP attempt, retries,
+    # backoff, calls in flight per provider and pooled connections
+    LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 120))
+    LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 90))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8.0))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+    # Provider routing: latency samples kept per provider/model; with LLM_HEDGE a second provider
+    # is called once the first has taken its p95 (LLM_HEDGE_DELAY until measured)
+    LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+    LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 10.0))
+    # A provider is skipped for LLM_BREAKER_COOLDOWN seconds after LLM_BREAKER_ERRORS failed
+    # attempts within LLM_BREAKER_WINDOW seconds
+    LLM_BREAKER_ERRORS = int(os.getenv("LLM_BREAKER_ERRORS", 5))
+    LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", 30.0))
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30.0))
     VECTORSTORE_PATH = os.getenv("VECTORSTORE_PATH", "./data/faiss_store")
+    # API: seconds between checks for a newly persisted store version (0 = never reload)
+    VECTORSTORE_RELOAD_INTERVAL = float(os.getenv("VECTORSTORE_RELOAD_INTERVAL", 2.0))
+    # Persistent cache of cloud embeddings (SQLite; empty path disables it)
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite")
+    EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", 1024))
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # float32|float16
+    # OpenAI-compatible API base (point it at a local stand-in server for testing)
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    # Cloud embedding requests: concurrency, batching, rate budget and retries
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 8))
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 128))
+    EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", 60000))
+    EMBED_RPM = float(os.getenv("EMBED_RPM", 3000))
+    EMBED_TPM = float(os.getenv("EMBED_TPM", 1000000))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 6))
+    EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", 0.5))
+    EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", 30.0))
+    EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", 60.0))
+    # In-process query caches (entries; 0 disables a layer) and their time-to-live in seconds
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+    QUERY_RESULT_CACHE_SIZE = int(os.getenv("QUERY_RESULT_CACHE_SIZE", 1024))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 600))
+    # Token budget for the evidence in a report prompt (0 = paste every chunk in full) and the
+    # word overlap above which a sentence counts as a near-duplicate of one already included
+    PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", 1200))
+    PROMPT_DEDUP_SIMILARITY = float(os.getenv("PROMPT_DEDUP_SIMILARITY", 0.8))
+    # Persistent cache of LLM report answers (SQLite; empty path disables it): size cap,
+    # time-to-live in seconds (0 = forever) and the question similarity of a semantic hit
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./data/response_cache.sqlite")
+    RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", 256))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.95))
+    # Retrieval backend: auto (FAISS with cloud embeddings, else tfidf) | tfidf | bm25 | faiss | hybrid
+    RETRIEVER = os.getenv("RETRIEVER", "auto")
+    BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+    BM25_B = float(os.getenv("BM25_B", 0.75))
+    # FAISS (dense) index: flat | ivf_flat | ivf_pq | hnsw, plus build/search knobs
+    FAISS_INDEX = os.getenv("FAISS_INDEX", "flat")
+    FAISS_NLIST = int(os.getenv("FAISS_NLIST", 1024))
+    FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 16))
+    FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", 8))
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+    FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", 200))
+    FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+    FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", 100000))
+    # Hybrid retrieval: lexical scorer, fusion (rrf|weighted), per-leg deadlines
+    HYBRID_LEXICAL = os.getenv("HYBRID_LEXICAL", "bm25")  # tfidf|bm25
+    HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 0.5))
+    HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", 20))  # candidates fetched per leg
+    HYBRID_LEXICAL_TIMEOUT_MS = int(os.getenv("HYBRID_LEXICAL_TIMEOUT_MS", 500))
+    HYBRID_DENSE_TIMEOUT_MS = int(os.getenv("HYBRID_DENSE_TIMEOUT_MS", 2000))
+    HYBRID_WORKERS = int(os.getenv("HYBRID_WORKERS", 8))
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+    # Local (no cloud key) embedder: size of the hashed TF-IDF feature space
+    LOCAL_HASH_FEATURES = int(os.getenv("LOCAL_HASH_FEATURES", 2 ** 20))
+    # Local store compaction: merge this many adjacent same-size-tier segments
+    LOCAL_COMPACTION_FANOUT = int(os.getenv("LOCAL_COMPACTION_FANOUT", 4))
+    # ...but never merge into a segment larger than this (merges happen in memory)
+    LOCAL_MAX_SEGMENT_DOCS = int(os.getenv("LOCAL_MAX_SEGMENT_DOCS", 20000))
+    # Streaming ingest: chunks per micro-batch, cap on chunk text buffered between
+    # the reader and the indexer, and how often (batches) to save the FAISS snapshot
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+    INGEST_MEMORY_LIMIT_MB = int(os.getenv("INGEST_MEMORY_LIMIT_MB", 64))
+    INGEST_COMMIT_EVERY = int(os.getenv("INGEST_COMMIT_EVERY", 20))
+    # micro-batches embedded ahead of the one being indexed (cloud embeddings only)
+    INGEST_EMBED_AHEAD = int(os.getenv("INGEST_EMBED_AHEAD", 2))
+    # POST /ingest jobs (run one at a time, each in its own subprocess): finished jobs
+    # kept for GET /ingest/{job_id}
+    INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", 200))
+    # PDF text extraction: worker processes (0 = one per CPU, 1 = in-process) and pages per task
+    PDF_WORKERS = int(os.getenv("PDF_WORKERS", 0))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
     # Web search / external context
     BING_API_KEY = os.getenv("BING_API_KEY", "")
     BING_ENDPOINT = os.getenv("BING_ENDPOINT", "https://api.bing.microsoft.com/v7.0/search")
     SERPAPI_KEY = os.getenv("SERPAPI_KEY", "")
+    SERPAPI_ENDPOINT = os.getenv("SERPAPI_ENDPOINT", "https://serpapi.com/search.json")
     # Google Programmable Search (Custom Search JSON API)
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
     GOOGLE_CX = os.getenv("GOOGLE_CX", "")
+    GOOGLE_ENDPOINT = os.getenv("GOOGLE_ENDPOINT", "https://www.googleapis.com/customsearch/v1")
+    # Persistent cache of web search results (empty path disables it): lifetime of results,
+    # lifetime of "no results" answers and of a failed provider being skipped, entry cap
+    WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "./data/web_cache.sqlite")
+    WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", 24 * 3600))
+    WEB_CACHE_NEGATIVE_TTL = float(os.getenv("WEB_CACHE_NEGATIVE_TTL", 60))
+    WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", 20000))
+    # Seconds to wait for web results (all providers are asked at once). Report generation
+    # drops the web evidence when it is not back by then.
+    WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", 5.0))
+    # Deadline for a whole report (queueing for admission, retrieval, web search and the LLM call)
+    REPORT_DEADLINE = float(os.getenv("REPORT_DEADLINE", 150))
+    # Admission control for /query and /query/stream (per API process): reports run at once
+    # (0 = no limit), requests allowed to wait for a slot, and how long (seconds) they may wait
+    QUERY_MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", 16))
+    QUERY_QUEUE_SIZE = int(os.getenv("QUERY_QUEUE_SIZE", 32))
+    QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", 15.0))
+    # Identical concurrent report requests share one computation; results are kept for
+    # REPORT_COALESCE_TTL seconds (0 = only coalesce requests in flight) for later duplicates
+    REPORT_COALESCE = os.getenv("REPORT_COALESCE", "true").lower() in ("1", "true", "yes")
+    REPORT_COALESCE_TTL = float(os.getenv("REPORT_COALESCE_TTL", 10))
+    REPORT_COALESCE_MAX_ENTRIES = int(os.getenv("REPORT_COALESCE_MAX_ENTRIES", 256))
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Recall-vs-latency report for the FAISS index types in src.utils.ann.
+
+Ground truth comes from an exact flat index; every configuration is scored on
+recall@k against it, mean single-query latency and index size in memory
+(serialised bytes). Vectors are synthetic clustered Gaussians by default, or
+the vectors of an existing persisted FAISS store (`--store`).
+
+Usage (from project root):
+  python -m src.eval.benchmark_ann --n 200000 --dim 384 --queries 200 --out ann_report.json
+  python -m src.eval.benchmark_ann --store ./data/faiss_store
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.utils import ann
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def store_vectors(path: str) -> np.ndarray:
+    import faiss
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _grid(nlist: int, pq_m: int):
+    yield "flat", {}, {}
+    for nprobe in (1, 4, 16, 64):
+        yield "ivf_flat", {"nlist": nlist}, {"nprobe": nprobe}
+    for nprobe in (1, 4, 16, 64):
+        yield "ivf_pq", {"nlist": nlist, "pq_m": pq_m}, {"nprobe": nprobe}
+    for ef in (16, 32, 64, 128):
+        yield "hnsw", {}, {"ef_search": ef}
+
+
+def run(base: np.ndarray, queries: np.ndarray, k: int = 10, nlist: int = 1024, pq_m: int = 16):
+    import faiss
+    base = np.ascontiguousarray(base, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = ann.build_index(base.shape[1], "flat")
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    built = {}
+    for name, build_kw, search_kw in _grid(min(nlist, max(1, len(base) // 39)), pq_m):
+        key = (name, tuple(sorted(build_kw.items())))
+        if key not in built:
+            start = time.perf_counter()
+            index = ann.build_index(base.shape[1], name, **build_kw)
+            ann.train_index(index, base)
+            index.add(base)
+            built[key] = (index, time.perf_counter() - start)
+        index, build_s = built[key]
+        ann.configure_search(index, **search_kw)
+        start = time.perf_counter()
+        found = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+        latency_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        recall = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+        row = {
+            "index": name,
+            **build_kw,
+            **search_kw,
+            "recall_at_k": recall,
+            "latency_ms": latency_ms,
+            "index_bytes": int(faiss.serialize_index(index).nbytes),
+            "build_s": build_s,
+        }
+        rows.append(row)
+        print(json.dumps(row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=None, help="Use vectors from a persisted FAISS store directory")
+    parser.add_argument("--n", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--out", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = store_vectors(args.store)
+    else:
+        vectors = synthetic_vectors(args.n + args.queries, args.dim)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    base = vectors if args.store else np.delete(vectors, picks, axis=0)
+
+    rows = run(base, queries, k=args.k, nlist=args.nlist, pq_m=args.pq_m)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
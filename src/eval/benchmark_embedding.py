@@ -0,0 +1,90 @@
+"""Embedding throughput against a rate-limited stand-in server.
+
+Starts src.eval.standin_server in-process (or uses --base-url), embeds
+synthetic chunks with src.utils.embedding_executor.EmbeddingExecutor at each
+concurrency level and reports tokens/minute as a fraction of the server's
+limit, plus retries and whether every vector came back in input order.
+
+Usage (from project root):
+  python -m src.eval.benchmark_embedding --texts 4000 --concurrency 1 4 8 16
+  python -m src.eval.benchmark_embedding --tpm 300000 --error-rate 0.05 --out embed_bench.json
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from src.eval.standin_server import StandinServer
+from src.utils.embedding_executor import EmbeddingExecutor, RateLimiter
+
+
+def synthetic_texts(n: int, chars: int = 1000, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"term{i}" for i in range(5000)]
+    out = []
+    for i in range(n):
+        text = f"{i} " + " ".join(rng.choices(words, k=chars // 9))
+        out.append(text[:chars])
+    return out
+
+
+def run(texts, concurrency_list, rpm: float, tpm: float, latency_ms: float, error_rate: float, window: float,
+        batch_size: int = None, base_url: str = None):
+    rows = []
+    for concurrency in concurrency_list:
+        server = None
+        if base_url is None:
+            server = StandinServer(rpm=rpm, tpm=tpm, latency_ms=latency_ms, error_rate=error_rate, window=window).start()
+        url = base_url or server.base_url
+        # client budget = the server's limits; empty buckets at the start, so the
+        # initial burst does not inflate throughput
+        limiter = RateLimiter(rpm, tpm, full=False)
+        executor = EmbeddingExecutor(model="standin", api_key="test", base_url=url, concurrency=concurrency,
+                                     batch_size=batch_size, limiter=limiter)
+        start = time.perf_counter()
+        vectors = executor.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        row = {"concurrency": concurrency, "texts": len(texts), "seconds": elapsed,
+               "requests": executor.requests, "retries": executor.retries}
+        if server is not None:
+            stats = server.stats()
+            expected = [server.vector(t) for t in texts]
+            row["in_order"] = bool(np.allclose(np.asarray(vectors), np.asarray(expected), atol=1e-6))
+            row["rate_limited"] = stats["rate_limited"]
+            row["errors"] = stats["errors"]
+            row["tpm_used"] = stats["tokens"] * 60.0 / elapsed
+            row["tpm_limit"] = tpm
+            row["fraction_of_limit"] = row["tpm_used"] / row["tpm_limit"]
+            server.stop()
+        rows.append(row)
+        print(json.dumps(row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000, help="Synthetic chunks to embed")
+    parser.add_argument("--chars", type=int, default=1000, help="Characters per chunk")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rpm", type=float, default=600, help="Stand-in request limit per minute")
+    parser.add_argument("--tpm", type=float, default=2000000, help="Stand-in token limit per minute")
+    parser.add_argument("--window", type=float, default=5.0, help="Sliding window (seconds) the stand-in enforces its limits over")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--base-url", default=None, help="Use an already running server instead")
+    parser.add_argument("--out", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.texts, args.chars)
+    rows = run(texts, args.concurrency, args.rpm, args.tpm, args.latency_ms, args.error_rate, args.window,
+               batch_size=args.batch_size, base_url=args.base_url)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
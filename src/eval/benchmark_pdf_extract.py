@@ -0,0 +1,89 @@
+"""Pages/sec of PDF text extraction against the number of worker processes.
+
+Runs src.utils.pdf_loader.iter_pdf_pages_parallel over the given PDFs (or a
+generated text-heavy PDF) once per worker count and reports throughput and
+speedup over a single in-process worker.
+
+Usage (from project root):
+  python -m src.eval.benchmark_pdf_extract --pdf docs/*.pdf --workers 1 2 4 8
+  python -m src.eval.benchmark_pdf_extract --synthetic-pages 2000 --out pdf_bench.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from src.utils.pdf_loader import iter_pdf_pages_parallel
+
+
+def synthetic_pdf(path: str, pages: int, lines_per_page: int = 60, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"term{i}" for i in range(5000)]
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n".join(" ".join(rng.choices(words, k=12)) for _ in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def run(paths, workers_list, pages_per_task: int = None, repeat: int = 1):
+    rows = []
+    base = None
+    for workers in workers_list:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pages = 0
+            chars = 0
+            for _, _, text in iter_pdf_pages_parallel(paths, workers=workers, pages_per_task=pages_per_task):
+                pages += 1
+                chars += len(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        pps = pages / best if best else 0.0
+        base = base or pps
+        row = {"workers": workers, "pages": pages, "chars": chars, "seconds": best,
+               "pages_per_sec": pps, "speedup": pps / base if base else 0.0}
+        rows.append(row)
+        print(json.dumps(row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", nargs="*", default=None, help="PDF files to extract")
+    parser.add_argument("--synthetic-pages", type=int, default=500, help="Pages of the generated PDF when --pdf is not given")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Worker counts (default: 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--pages-per-task", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per worker count (best time is kept)")
+    parser.add_argument("--out", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    workers_list = args.workers
+    if not workers_list:
+        cpus = os.cpu_count() or 1
+        workers_list = [1]
+        while workers_list[-1] * 2 <= cpus:
+            workers_list.append(workers_list[-1] * 2)
+        if workers_list[-1] != cpus:
+            workers_list.append(cpus)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.pdf
+        if not paths:
+            paths = [os.path.join(tmp, "synthetic.pdf")]
+            synthetic_pdf(paths[0], args.synthetic_pages)
+        rows = run(paths, workers_list, pages_per_task=args.pages_per_task, repeat=args.repeat)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
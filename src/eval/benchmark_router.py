@@ -0,0 +1,124 @@
+"""LLM call latency with in-order fallback vs. the latency-aware router.
+
+Starts two chat stand-ins (src.eval.standin_server) and sends the same calls
+through src.models.llm_client.AsyncLLMClient in three modes:
+
+- ordered: always provider "a" first, then "b" (the old fallback order)
+- routed: fastest healthy provider first, circuit breakers on
+- hedged: routed, plus a second provider once the first exceeds its p95
+
+Scenarios:
+
+- tail: "a" is fast but `--slow-rate` of its calls take `--slow-ms`; "b" is
+  steadily slower.
+- outage: "a" fails every call with 503; "b" is healthy.
+
+Reports p50/p95/p99 call latency, failures, hedges and breaker trips.
+
+Usage (from project root):
+  python -m src.eval.benchmark_router --calls 300 --concurrency 8
+  python -m src.eval.benchmark_router --scenario tail --slow-rate 0.1 --slow-ms 3000 --out router_bench.json
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from src.eval.standin_server import StandinServer
+from src.models.llm_client import AsyncLLMClient, LLMError, Provider
+from src.models.llm_router import ProviderRouter
+
+MODES = ["ordered", "routed", "hedged"]
+
+
+def _client(mode: str, url_a: str, url_b: str, hedge_delay: float) -> AsyncLLMClient:
+    providers = [Provider("a", url_a + "/chat/completions", "test", "standin"),
+                 Provider("b", url_b + "/chat/completions", "test", "standin")]
+    if mode == "ordered":
+        # never enough samples to reorder, and a breaker that never trips
+        router = ProviderRouter(min_samples=10 ** 9, breaker_errors=10 ** 9)
+    else:
+        router = ProviderRouter(hedge_delay=hedge_delay)
+    return AsyncLLMClient(providers, router=router, hedge=(mode == "hedged"))
+
+
+async def _calls(client: AsyncLLMClient, calls: int, concurrency: int, deadline: float):
+    latencies, failures = [], 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await client.chat_with_fallback(f"question {i}", max_tokens=50, deadline=deadline)
+            except LLMError:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    await client.aclose()
+    return latencies, failures
+
+
+def run(scenario: str, modes, calls: int, concurrency: int, latency_a: float, latency_b: float, slow_rate: float,
+        slow_ms: float, hedge_delay: float, deadline: float):
+    rows = []
+    for mode in modes:
+        if scenario == "outage":
+            a = StandinServer(rpm=1e9, tpm=1e12, chat_latency_ms=latency_a, error_rate=1.0).start()
+        else:
+            a = StandinServer(rpm=1e9, tpm=1e12, chat_latency_ms=latency_a, slow_rate=slow_rate, slow_ms=slow_ms).start()
+        b = StandinServer(rpm=1e9, tpm=1e12, chat_latency_ms=latency_b, seed=1).start()
+        client = _client(mode, a.base_url, b.base_url, hedge_delay)
+        start = time.perf_counter()
+        latencies, failures = asyncio.run(_calls(client, calls, concurrency, deadline))
+        elapsed = time.perf_counter() - start
+        values = np.asarray(latencies) if latencies else np.zeros(1)
+        router = client.router.stats()
+        row = {
+            "scenario": scenario, "mode": mode, "calls": calls, "seconds": elapsed, "failures": failures,
+            "p50": float(np.quantile(values, 0.5)), "p95": float(np.quantile(values, 0.95)),
+            "p99": float(np.quantile(values, 0.99)), "mean": float(values.mean()),
+            "answered_by": {"a": a.stats()["chat"], "b": b.stats()["chat"]},
+            "hedges": router["hedges"], "hedge_wins": router["hedge_wins"],
+            "breaker_trips": {name: b_["trips"] for name, b_ in router["breakers"].items()},
+            "retries": sum(s["retries"] for s in client.stats.values()),
+        }
+        a.stop()
+        b.stop()
+        rows.append(row)
+        print(json.dumps(row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=["tail", "outage", "both"], default="both")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-a-ms", type=float, default=100, help="Usual latency of provider a")
+    parser.add_argument("--latency-b-ms", type=float, default=300, help="Latency of provider b")
+    parser.add_argument("--slow-rate", type=float, default=0.1, help="Fraction of provider a calls in the slow tail")
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--hedge-delay", type=float, default=1.0, help="Hedge delay until a provider's p95 is known")
+    parser.add_argument("--deadline", type=float, default=30.0)
+    parser.add_argument("--out", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    scenarios = ["tail", "outage"] if args.scenario == "both" else [args.scenario]
+    rows = []
+    for scenario in scenarios:
+        rows += run(scenario, args.modes, args.calls, args.concurrency, args.latency_a_ms, args.latency_b_ms,
+                    args.slow_rate, args.slow_ms, args.hedge_delay, args.deadline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark local similarity search: dense scan + argsort vs inverted index + argpartition.
+
+Builds synthetic single-segment stores (Zipf-distributed hashed terms, so a few
+terms are common and most are rare, like real chunk text) and times both
+scorers on the same random queries. Peak allocations per query are measured
+with tracemalloc.
+
+Usage (from project root):
+  python -m src.eval.benchmark_search --sizes 1000 10000 100000 1000000 --queries 50
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.config import settings
+from src.utils.local_store import Segment
+
+
+def synthetic_matrix(n_docs: int, terms_per_doc: int, vocab: int, rng) -> csr_matrix:
+    cols = (rng.zipf(1.3, size=n_docs * terms_per_doc) % vocab).astype(np.int32)
+    rows = np.repeat(np.arange(n_docs, dtype=np.int32), terms_per_doc)
+    mat = csr_matrix((np.ones(len(cols), dtype=np.float32), (rows, cols)), shape=(n_docs, settings.LOCAL_HASH_FEATURES))
+    mat.sum_duplicates()
+    return mat
+
+
+def query_vector(cols: np.ndarray) -> csr_matrix:
+    cols = np.unique(cols).astype(np.int32)
+    data = np.full(len(cols), 1.0 / np.sqrt(len(cols)), dtype=np.float32)
+    return csr_matrix((data, cols, np.array([0, len(cols)])), shape=(1, settings.LOCAL_HASH_FEATURES))
+
+
+def dense_search(seg: Segment, qv, k: int):
+    """The previous scorer: score every chunk, then sort all of them.
+
+    Segments hold raw counts, so rows are L2-normalised here as the local
+    scorer does.
+    """
+    sims = (seg.matrix @ qv.T).toarray().ravel() / seg.doc_norm
+    idxs = np.argsort(sims)[::-1][:k]
+    return [(float(sims[int(i)]), int(i)) for i in idxs]
+
+
+def _measure(fn, seg, queries, k):
+    start = time.perf_counter()
+    for qv in queries:
+        fn(seg, qv, k)
+    latency_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+    tracemalloc.start()
+    for qv in queries[:5]:
+        fn(seg, qv, k)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency_ms, peak
+
+
+def run(sizes, n_queries: int = 50, k: int = 10, terms_per_doc: int = 120, vocab: int = 50000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            mat = synthetic_matrix(n, terms_per_doc, vocab, rng)
+            seg = Segment.write(os.path.join(tmp, f"seg_{n}"), mat, [b"{}"] * n)
+            # queries: a handful of keyword terms drawn uniformly, i.e. mostly from the rarer tail
+            queries = [query_vector(rng.integers(0, vocab, size=6)) for _ in range(n_queries)]
+            dense_ms, dense_peak = _measure(dense_search, seg, queries, k)
+            inv_ms, inv_peak = _measure(lambda s, q, kk: s.search(q, kk), seg, queries, k)
+            touched = np.mean([len(seg.postings(q.indices.astype(np.int64), q.data)[0]) for q in queries])
+            row = {
+                "n_docs": n,
+                "avg_postings_touched": float(touched),
+                "dense_ms": dense_ms,
+                "inverted_ms": inv_ms,
+                "speedup": dense_ms / inv_ms if inv_ms else None,
+                "dense_peak_bytes": dense_peak,
+                "inverted_peak_bytes": inv_peak,
+            }
+            rows.append(row)
+            print(json.dumps(row))
+            del seg
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--out", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+    rows = run(args.sizes, n_queries=args.queries, k=args.k)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import argparse
 import json
+import time
 from typing import Dict, List, Tuple
 import math
 
@@ -117,9 +118,11 @@ def evaluate(vs: VectorStore, queries: List[Tuple[str, str]], qrels: Dict[str, D
     sum_prec = 0.0
     sum_recall = 0.0
     n = 0
-    for qid, qtext in queries:
-        # run retrieval
-        hits = vs.similarity_search_with_scores(qtext, k=k)
+    # run retrieval for all queries in one batch; latency is amortised per query
+    start = time.perf_counter()
+    batch = vs.similarity_search_batch([qtext for _, qtext in queries], k=k)
+    total_ms = (time.perf_counter() - start) * 1000.0
+    for (qid, qtext), hits in zip(queries, batch):
         retrieved_ids = []
         for doc, score in hits:
             meta = getattr(doc, "metadata", {}) or {}
@@ -160,6 +163,7 @@ def evaluate(vs: VectorStore, queries: List[Tuple[str, str]], qrels: Dict[str, D
         "mean_mrr": (sum_mrr / n) if n else 0.0,
         "mean_precision": (sum_prec / n) if n else 0.0,
         "mean_recall": (sum_recall / n) if n else 0.0,
+        "mean_latency_ms": (total_ms / n) if n else 0.0,
     }
     return {"per_query": results, "summary": summary}
 
@@ -170,19 +174,31 @@ def main():
     parser.add_argument("--qrels", required=True, help="Path to qrels.tsv (qid\tdocid\trelevance)")
     parser.add_argument("--k", type=int, default=10, help="k for @k metrics")
     parser.add_argument("--out", default="eval_results.json", help="Output JSON file")
+    parser.add_argument(
+        "--retriever", nargs="+", default=None,
+        help="Backend(s) to evaluate (auto, tfidf, bm25, faiss, hybrid); several are compared side by side",
+    )
     args = parser.parse_args()
 
     qrels = load_qrels(args.qrels)
     queries = load_queries(args.queries)
 
-    vs = VectorStore()
-    if vs.is_empty():
-        print("Warning: vectorstore is empty. Run ingestion first or add sample docs.")
-
-    res = evaluate(vs, queries, qrels, k=args.k)
+    retrievers = args.retriever or [None]
+    results = {}
+    for name in retrievers:
+        vs = VectorStore(retriever=name)
+        if vs.is_empty():
+            print(f"Warning: vectorstore ({vs.retriever}) is empty. Run ingestion first or add sample docs.")
+        results[vs.retriever] = evaluate(vs, queries, qrels, k=args.k)
+
+    # a single backend keeps the original output shape
+    res = next(iter(results.values())) if len(retrievers) == 1 else results
     with open(args.out, "w", encoding="utf-8") as f:
         json.dump(res, f, indent=2)
-    print(json.dumps(res["summary"], indent=2))
+    if len(retrievers) == 1:
+        print(json.dumps(res["summary"], indent=2))
+    else:
+        print(json.dumps({name: r["summary"] for name, r in results.items()}, indent=2))
 
 
 if __name__ == "__main__":
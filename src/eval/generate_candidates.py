@@ -21,8 +21,8 @@ def generate(queries_path: str, out_path: str, top_n: int = 50):
         print("Warning: vectorstore empty. Seed or ingest documents first.")
 
     lines = []
-    for qid, qtext in queries:
-        hits = vs.similarity_search_with_scores(qtext, k=top_n)
+    batch = vs.similarity_search_batch([qtext for _, qtext in queries], k=top_n)
+    for (qid, qtext), hits in zip(queries, batch):
         for rank, (doc, score) in enumerate(hits, start=1):
             docid = docid_from_doc(doc)
             # TSV: qid \t docid \t rank \t score
@@ -8,6 +8,7 @@ import argparse
 import json
 import os
 import csv
+import time
 from typing import List, Tuple
 
 from src.report_generator import ReportGenerator
@@ -30,7 +31,8 @@ def docid_from_doc(doc) -> str:
     return str(docid)
 
 
-def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_web: bool = False):
+def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_web: bool = False,
+              response_cache: bool = True):
     os.makedirs(out_dir, exist_ok=True)
     reports_dir = os.path.join(out_dir, "reports")
     os.makedirs(reports_dir, exist_ok=True)
@@ -38,14 +40,17 @@ def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_
     qrels = load_qrels(qrels_path)
     queries = load_queries(queries_path)
 
-    rg = ReportGenerator()
+    # LLM answers are reused from earlier runs (and repeated queries coalesced) unless response_cache is off
+    make_generator = ReportGenerator if response_cache else (
+        lambda: ReportGenerator(response_cache=None, single_flight=None))
+    rg = make_generator()
     # Ensure the vectorstore has documents. If empty, try seeding with demo documents.
     if rg.vs.is_empty():
         try:
             from src.eval import seed_vectorstore
             print("VectorStore empty — running seed_vectorstore.seed() to populate demo documents.")
             seed_vectorstore.seed()
-            rg = ReportGenerator()  # re-init to pick up persisted store
+            rg = make_generator()  # re-init to pick up persisted store
         except Exception as e:
             print("Failed to seed vectorstore:", e)
     # If still empty, try to add the demo documents directly to the current vectorstore instance
@@ -62,13 +67,15 @@ def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_
     per_query = {}
     csv_rows: List[List] = []
     csv_header = ["qid", "ap", "ndcg", "mrr", "precision", "recall", "retrieved"]
+    started = time.perf_counter()
 
     for qid, qtext in queries:
         print(f"Running qid={qid}: {qtext}")
         # try to pass minimal patient container (ReportGenerator expects a dict)
         patient = {"name": None}
+        trace = {}
         try:
-            report, retrieved = rg.generate(patient, qtext, top_k=k, use_web=use_web, structured=False)
+            report, retrieved = rg.generate(patient, qtext, top_k=k, use_web=use_web, structured=False, trace=trace)
         except Exception as e:
             print(f"Error generating report for {qid}: {e}")
             report = str(e)
@@ -102,6 +109,8 @@ def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_
             "retrieved": retrieved_ids,
             "relevant": rels,
             "report_path": out_report_path,
+            "stages": trace.get("stages", {}),
+            "dropped_stages": trace.get("dropped", {}),
         }
 
         csv_rows.append([qid, ap, ndcg, rr, prec, rec, ";".join(retrieved_ids)])
@@ -118,6 +127,11 @@ def run_batch(queries_path: str, qrels_path: str, out_dir: str, k: int = 5, use_
         }
     else:
         summary = {"map": 0.0, "mean_ndcg": 0.0, "mean_mrr": 0.0, "mean_precision": 0.0, "mean_recall": 0.0}
+    summary["seconds"] = time.perf_counter() - started
+    summary["prompt_tokens"] = rg.prompt_token_stats()
+    if rg.response_cache is not None:
+        # counters are per process, i.e. this batch
+        summary["response_cache"] = rg.response_cache.stats()
 
     out_json = os.path.join(out_dir, "batch_metrics.json")
     with open(out_json, "w", encoding="utf-8") as f:
@@ -140,9 +154,11 @@ def main():
     parser.add_argument("--out-dir", default="src/eval/batch_reports", help="Output directory")
     parser.add_argument("--k", type=int, default=5, help="k for @k metrics and retrieval")
     parser.add_argument("--use-web", action="store_true", help="Allow web evidence in report generation")
+    parser.add_argument("--no-response-cache", action="store_true", help="Always call the LLM (ignore cached answers)")
     args = parser.parse_args()
 
-    run_batch(args.queries, args.qrels, args.out_dir, k=args.k, use_web=args.use_web)
+    run_batch(args.queries, args.qrels, args.out_dir, k=args.k, use_web=args.use_web,
+              response_cache=not args.no_response_cache)
 
 
 if __name__ == "__main__":
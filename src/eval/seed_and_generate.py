@@ -25,8 +25,8 @@ def main():
     # generate candidates
     queries = load_queries('src/eval/queries.jsonl')
     cand_lines = []
-    for qid, qtext in queries:
-        hits = vs.similarity_search_with_scores(qtext, k=50)
+    batch = vs.similarity_search_batch([qtext for _, qtext in queries], k=50)
+    for (qid, qtext), hits in zip(queries, batch):
         for rank, (doc, score) in enumerate(hits, start=1):
             docid = docid_from_doc(doc)
             cand_lines.append(f"{qid}\t{docid}\t{rank}\t{score}\n")
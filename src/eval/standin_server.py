@@ -0,0 +1,291 @@
+"""Local stand-in for an OpenAI-compatible API, for tests and benchmarks.
+
+Serves `POST /v1/embeddings` with deterministic vectors (derived from a hash
+of each input) and `POST /v1/chat/completions` with a canned report (JSON
+when the prompt asks for it), each after a configurable latency (chat
+completions can also have a slow tail: `slow_rate` of them take
+`slow_ms`). It also answers web searches in the formats of Google Custom
+Search (`GET /customsearch/v1`), Bing (`GET /v7.0/search`) and SerpAPI
+(`GET /search.json`), after `search_latency_ms`; providers named in
+`search_down` answer 503. It enforces its own
+request-per-minute and token-per-minute limits over a sliding window and
+answers 429 with Retry-After when they are exceeded, and fails a
+configurable fraction of requests with 503, so clients can be exercised
+against realistic rate limiting without a real key.
+
+Usage (from project root):
+  python -m src.eval.standin_server --port 8765 --rpm 600 --tpm 200000 --error-rate 0.05
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test python -m src.ingest ...
+  BING_API_KEY=test BING_ENDPOINT=http://127.0.0.1:8765/v7.0/search ...  (GOOGLE_/SERPAPI_ENDPOINT alike)
+
+Or in-process: `server = StandinServer(rpm=600).start()`, then use
+`server.base_url` and `server.stats()`; `server.stop()` when done.
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from src.utils.embedding_executor import estimate_tokens
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # many clients connect at once in benchmarks; the default backlog of 5 resets them
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # clients hang up mid-answer on purpose (cancelled hedges, stopped streams)
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StandinServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, rpm: float = 600, tpm: float = 200000,
+                 latency_ms: float = 50, error_rate: float = 0.0, dim: int = 64, window: float = 60.0, seed: int = 0,
+                 chat_latency_ms: float = None, token_delay_ms: float = 5, slow_rate: float = 0.0,
+                 slow_ms: float = 0.0, search_latency_ms: float = 100, search_down=()):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency_ms / 1000.0
+        self.chat_latency = self.latency if chat_latency_ms is None else chat_latency_ms / 1000.0
+        # streamed completions: the first piece comes after chat_latency, then one piece per token_delay
+        self.token_delay = token_delay_ms / 1000.0
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow = slow_ms / 1000.0
+        self.search_latency = search_latency_ms / 1000.0
+        self.search_down = set(search_down)
+        self.searches = {"google": 0, "bing": 0, "serpapi": 0}
+        self.dim = dim
+        # per-minute limits are enforced over a sliding window of this many seconds
+        self.window = window
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._log = deque()  # (time, tokens) of accepted requests inside the window
+        self.counts = {"ok": 0, "rate_limited": 0, "errors": 0, "inputs": 0, "tokens": 0, "chat": 0}
+        self.first = self.last = None
+        self._httpd = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return self.root_url + "/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counts)
+            elapsed = (self.last - self.first) if self.first is not None else 0.0
+            out["seconds"] = elapsed
+            out["tokens_per_minute"] = out["tokens"] * 60.0 / elapsed if elapsed else 0.0
+            out["searches"] = dict(self.searches)
+            return out
+
+    def vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def completion(self, prompt: str) -> str:
+        """Canned answer to `prompt`: a JSON report if it asks for JSON, else plain text."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        if "valid JSON" in prompt:
+            return json.dumps({
+                "title": f"Stand-in report {digest}",
+                "meta": {"author": "stand-in", "date": "1970-01-01"},
+                "executive_summary": "Summary of the provided context.",
+                "background": "Background.",
+                "methods": "Retrieved context was reviewed.",
+                "findings": ["Finding one.", "Finding two."],
+                "recommendations": ["Recommendation one."],
+                "references": ["[1]"],
+            })
+        return f"Stand-in answer {digest}."
+
+    def search_results(self, query: str, k: int) -> list:
+        """Canned (title, snippet, url) hits for `query`."""
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        return [(f"Result {i + 1} for {query}", f"Snippet {i + 1} ({digest}).", f"https://example.org/{digest}/{i + 1}")
+                for i in range(k)]
+
+    def _admit(self, tokens: int):
+        """None if the request fits the budget, else seconds until it would."""
+        now = time.monotonic()
+        rpw = self.rpm * self.window / 60.0
+        tpw = self.tpm * self.window / 60.0
+        with self._lock:
+            while self._log and self._log[0][0] <= now - self.window:
+                self._log.popleft()
+            used = sum(t for _, t in self._log)
+            if len(self._log) + 1 > rpw or used + tokens > tpw:
+                self.counts["rate_limited"] += 1
+                return max(self._log[0][0] + self.window - now, 0.01) if self._log else 0.01
+            self._log.append((now, tokens))
+            return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                provider = {"/customsearch/v1": "google", "/v7.0/search": "bing",
+                            "/search.json": "serpapi"}.get(parts.path.rstrip("/"))
+                if provider is None:
+                    return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                time.sleep(server.search_latency)
+                with server._lock:
+                    server.searches[provider] += 1
+                if provider in server.search_down:
+                    return self._send(503, {"error": {"message": "unavailable"}})
+                k = int(params.get("num") or params.get("count") or 5)
+                hits = server.search_results(params.get("q", ""), k)
+                if provider == "google":
+                    body = {"items": [{"title": t, "snippet": s, "link": u} for t, s, u in hits]}
+                elif provider == "bing":
+                    body = {"webPages": {"value": [{"name": t, "snippet": s, "url": u} for t, s, u in hits]}}
+                else:
+                    body = {"organic_results": [{"title": t, "snippet": s, "link": u} for t, s, u in hits]}
+                self._send(200, body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send(400, {"error": {"message": "invalid JSON"}})
+                path = self.path.rstrip("/")
+                if path == "/v1/chat/completions":
+                    return self._chat(payload)
+                if path != "/v1/embeddings":
+                    return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                inputs = payload.get("input", [])
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                tokens = sum(estimate_tokens(t) for t in inputs)
+                wait = server._admit(tokens)
+                if wait is not None:
+                    return self._send(429, {"error": {"message": "rate limit"}}, {"Retry-After": f"{wait:.3f}"})
+                with server._lock:
+                    fail = server._rng.random() < server.error_rate
+                time.sleep(server.latency)
+                if fail:
+                    with server._lock:
+                        server.counts["errors"] += 1
+                    return self._send(503, {"error": {"message": "unavailable"}})
+                data = [{"object": "embedding", "index": i, "embedding": server.vector(t)} for i, t in enumerate(inputs)]
+                with server._lock:
+                    now = time.monotonic()
+                    server.first = server.first if server.first is not None else now
+                    server.last = now
+                    server.counts["ok"] += 1
+                    server.counts["inputs"] += len(inputs)
+                    server.counts["tokens"] += tokens
+                self._send(200, {"object": "list", "data": data, "model": payload.get("model"),
+                                 "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+            def _chat(self, payload: dict):
+                prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+                tokens = estimate_tokens(prompt) + int(payload.get("max_tokens") or 0)
+                wait = server._admit(tokens)
+                if wait is not None:
+                    return self._send(429, {"error": {"message": "rate limit"}}, {"Retry-After": f"{wait:.3f}"})
+                with server._lock:
+                    fail = server._rng.random() < server.error_rate
+                    slow = server._rng.random() < server.slow_rate
+                time.sleep(server.slow if slow else server.chat_latency)
+                if fail:
+                    with server._lock:
+                        server.counts["errors"] += 1
+                    return self._send(503, {"error": {"message": "unavailable"}})
+                with server._lock:
+                    server.counts["chat"] += 1
+                text = server.completion(payload.get("messages", [{}])[-1].get("content", ""))
+                if payload.get("stream"):
+                    return self._stream(text)
+                self._send(200, {"object": "chat.completion", "model": payload.get("model"),
+                                 "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                              "finish_reason": "stop"}]})
+
+            def _stream(self, text: str, piece_chars: int = 4):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i in range(0, len(text), piece_chars):
+                    chunk = {"object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": text[i:i + piece_chars]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.token_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--tpm", type=float, default=200000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=None, help="Chat completion latency (default: --latency-ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of chat completions that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--search-latency-ms", type=float, default=100, help="Latency of web search answers")
+    parser.add_argument("--search-down", nargs="*", default=[], choices=["google", "bing", "serpapi"],
+                        help="Search providers that answer 503")
+    parser.add_argument("--token-delay-ms", type=float, default=5, help="Delay between streamed completion pieces")
+    parser.add_argument("--dim", type=int, default=64)
+    args = parser.parse_args()
+    server = StandinServer(args.host, args.port, rpm=args.rpm, tpm=args.tpm, latency_ms=args.latency_ms,
+                           error_rate=args.error_rate, dim=args.dim, chat_latency_ms=args.chat_latency_ms,
+                           token_delay_ms=args.token_delay_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                           search_latency_ms=args.search_latency_ms, search_down=args.search_down)
+    print(f"serving {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,324 @@
+"""Streaming ingestion: page -> chunk -> embed -> add, in micro-batches.
+
+PDF pages are extracted on a process pool (see
+src.utils.pdf_loader.iter_pdf_pages_parallel) and come back in page order. A
+reader thread walks the files one page (or text block) at a time, chunks
+the text as it streams past and groups chunks into micro-batches of
+`INGEST_BATCH_SIZE`. Batches go through a queue bounded by the bytes of text
+it holds (`INGEST_MEMORY_LIMIT_MB`): when the indexer falls behind the reader
+blocks (backpressure). The indexer adds one batch at a time; every batch is
+committed as its own local segment, so an interrupted ingest keeps everything
+up to the last batch and memory use does not grow with the corpus. With cloud
+embeddings, the next `INGEST_EMBED_AHEAD` batches are embedded while the
+current one is indexed, so the (rate-limited, concurrent) embedding requests
+never wait on the indexer.
+"""
 import os
-from typing import List
-from src.utils.pdf_loader import load_pdf_text, split_text_to_chunks
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_right
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from src.utils.fsio import file_lock
+from src.utils.manifest import IngestManifest, CHANGED, UNCHANGED, ingest_params
+from src.utils.pdf_loader import iter_pdf_pages_parallel, iter_text_chunks
 from src.utils.vectorstore import VectorStore
+from src.config import settings
 from langchain.schema import Document
 from tqdm import tqdm
 
-def ingest_files(file_paths: List[str], source_name: str = None, chunk_size: int = 1000, chunk_overlap: int = 200) -> dict:
+TEXT_BLOCK_CHARS = 1 << 20
+
+_DONE = object()
+
+
+class _ByteBoundedQueue:
+    """FIFO whose capacity is a byte budget instead of an item count.
+
+    An item larger than the whole budget is still accepted once the queue is
+    empty, so a single oversized batch cannot deadlock the pipeline.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def put(self, item, nbytes: int = 0) -> bool:
+        """Block until there is room; returns False if the consumer has gone away."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or not self._items or self._bytes + nbytes <= self.max_bytes)
+            if self.closed:
+                return False
+            self._items.append((item, nbytes))
+            self._bytes += nbytes
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._items)
+            item, nbytes = self._items.popleft()
+            self._bytes -= nbytes
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def _is_pdf(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == ".pdf"
+
+
+def iter_text_blocks(path: str) -> Iterator[str]:
+    """A (non-PDF) text file in fixed-size blocks."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while True:
+            block = f.read(TEXT_BLOCK_CHARS)
+            if not block:
+                break
+            yield block
+
+
+class _PageStream:
+    """Splits the single ordered page stream of all PDFs back into per-file runs."""
+    def __init__(self, pages: Iterator[Tuple[int, int, str]]):
+        self._pages = pages
+        self._next = None
+
+    def take(self, file_idx: int) -> Iterator[Tuple[int, str]]:
+        while True:
+            if self._next is None:
+                self._next = next(self._pages, None)
+                if self._next is None:
+                    return
+            idx, page, text = self._next
+            if idx != file_idx:
+                return
+            self._next = None
+            yield page, text
+
+
+def _chunk_file(path: str, pieces: Iterable[Tuple[Optional[int], str]], source_name: str,
+                chunk_size: int, chunk_overlap: int, counters: Optional[dict] = None) -> Iterator[Document]:
+    """Chunk one file's (page number, text) pieces; PDF chunks record the pages they span.
+    PDF pages read are counted in counters["pages"], if given."""
+    starts: List[int] = []  # text offset where each page begins
+    pages: List[int] = []
+
+    def texts():
+        offset = 0
+        for page, text in pieces:
+            if page is not None and counters is not None:
+                counters["pages"] = counters.get("pages", 0) + 1
+            if not text:
+                continue
+            if page is not None and offset:
+                # same text as load_pdf_text: pages joined by newlines
+                text = "\n" + text
+            starts.append(offset)
+            pages.append(page)
+            offset += len(text)
+            yield text
+
+    step = max(chunk_size - chunk_overlap, 1)
+    for i, chunk in enumerate(iter_text_chunks(texts(), chunk_size=chunk_size, overlap=chunk_overlap)):
+        metadata = {
+            "source": source_name or os.path.basename(path),
+            "path": path,
+            "chunk_index": i
+        }
+        if pages and pages[0] is not None:
+            # chunk i starts at offset i * step
+            metadata["page"] = pages[bisect_right(starts, i * step) - 1]
+            metadata["page_end"] = pages[bisect_right(starts, i * step + len(chunk) - 1) - 1]
+        yield Document(page_content=chunk, metadata=metadata)
+
+
+def iter_documents(file_paths: List[str], source_name: str = None, chunk_size: int = 1000, chunk_overlap: int = 200,
+                   pdf_workers: int = None, counters: Optional[dict] = None) -> Iterator[Document]:
+    # all PDFs share one extraction pool, so the next file is read while this one is chunked
+    pdf_paths = [p for p in file_paths if _is_pdf(p)]
+    pdf_pages = _PageStream(iter_pdf_pages_parallel(pdf_paths, workers=pdf_workers)) if pdf_paths else None
+    pdf_idx = 0
+    for path in file_paths:
+        if _is_pdf(path):
+            pieces = pdf_pages.take(pdf_idx)
+            pdf_idx += 1
+        else:
+            pieces = ((None, block) for block in iter_text_blocks(path))
+        yield from _chunk_file(path, pieces, source_name, chunk_size, chunk_overlap, counters)
+
+
+def _batch_bytes(batch: List[Document]) -> int:
+    return sum(len(d.page_content) for d in batch)
+
+
+# lock file in the store directory held by the ingest writing to it
+INGEST_LOCK = "ingest.lock"
+
+
+def ingest_files(file_paths: List[str], source_name: str = None, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 batch_size: int = None, memory_limit_mb: int = None, pdf_workers: int = None, vs: VectorStore = None,
+                 progress: Optional[Callable[[dict], None]] = None) -> dict:
     """
     Ingests files (PDF/TXT) into vectorstore.
     Returns a dict with ingested file names and total chunk count.
+
+    Files whose content hash and ingest parameters (chunking, retriever,
+    embedding model, source name) match the ingest manifest are skipped (`skipped_files`); files that changed have their old
+    chunks removed first (`replaced_files`).
+
+    `progress`, if given, is called (from the ingest threads) whenever a batch
+    has been read, embedded or committed, with the counts so far:
+    {"files": <files to ingest>, "pages": <PDF pages read>, "chunks_read": ...,
+    "embedded": <chunks with embeddings>, "chunks": <chunks committed>,
+    "batches": <batches committed>}.
+
+    Ingests into the same store are serialized by a lock file in the store
+    directory (across processes: API ingest jobs, CLI runs), held until this
+    ingest's segment merges are done.
     """
-    vs = VectorStore()
-    all_docs = []
+    persist_path = vs.persist_path if vs is not None else settings.VECTORSTORE_PATH
+    # taken before the store is loaded, so this ingest starts from everything committed before it
+    with file_lock(os.path.join(persist_path, INGEST_LOCK)):
+        vs = vs or VectorStore()
+        result = _ingest_files(file_paths, source_name, chunk_size, chunk_overlap, batch_size, memory_limit_mb,
+                               pdf_workers, vs, progress)
+        # background merges rewrite segments.json too; the next writer has to see their result
+        vs.wait_for_compaction()
+        return result
+
+
+def _ingest_files(file_paths: List[str], source_name: Optional[str], chunk_size: int, chunk_overlap: int,
+                  batch_size: Optional[int], memory_limit_mb: Optional[int], pdf_workers: Optional[int],
+                  vs: VectorStore, progress: Optional[Callable[[dict], None]]) -> dict:
+    manifest = IngestManifest(vs.persist_path)
+    embedding = vs.embedding_model if vs.embedding_client.provider != "local" else "local"
+    params = ingest_params(chunk_size, chunk_overlap, vs.retriever, embedding, source_name)
+    todo, skipped, replaced, prints, stale = [], [], [], {}, []
+    seen = set()
     for path in file_paths:
-        ext = os.path.splitext(path)[1].lower()
-        if ext == ".pdf":
-            text = load_pdf_text(path)
-        else:
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-        chunks = split_text_to_chunks(text, chunk_size=chunk_size, overlap=chunk_overlap)
-        for i, chunk in enumerate(chunks):
-            metadata = {
-                "source": source_name or os.path.basename(path),
-                "path": path,
-                "chunk_index": i
-            }
-            all_docs.append(Document(page_content=chunk, metadata=metadata))
-    if all_docs:
-        vs.add_documents(all_docs)
-    return {"ingested_files": [os.path.basename(p) for p in file_paths], "total_chunks": len(all_docs)}
\ No newline at end of file
+        # one file however its path is spelled; the first spelling and the input order win
+        if os.path.abspath(path) in seen:
+            continue
+        seen.add(os.path.abspath(path))
+        fp = manifest.fingerprint(path)
+        state = manifest.status(path, fp, params)
+        if state == UNCHANGED:
+            skipped.append(path)
+            continue
+        if state == CHANGED:
+            replaced.append(path)
+            # the same file may have been ingested under another spelling of its path
+            stale.append(manifest.recorded_path(path))
+        todo.append(path)
+        prints[path] = fp
+        # re-recorded only once the new chunks are committed
+        manifest.forget(path)
+    removed = 0
+    if todo:
+        manifest.save()
+        # also clears chunks left by an earlier ingest of these files that never got recorded
+        removed = vs.delete_paths(set(todo) | {p for p in stale if p})
+    file_paths = todo
+
+    batch_size = max(batch_size or settings.INGEST_BATCH_SIZE, 1)
+    limit = (memory_limit_mb or settings.INGEST_MEMORY_LIMIT_MB) * 1024 * 1024
+    queue = _ByteBoundedQueue(limit)
+    counts = {"files": len(file_paths), "pages": 0, "chunks_read": 0, "embedded": 0, "chunks": 0, "batches": 0}
+    counts_lock = threading.Lock()
+
+    def count(**deltas):
+        with counts_lock:
+            for key, n in deltas.items():
+                counts[key] += n
+            snapshot = dict(counts)
+        if progress is not None:
+            progress(snapshot)
+
+    def read():
+        pages = {"pages": 0}
+        try:
+            batch = []
+            for doc in iter_documents(file_paths, source_name, chunk_size, chunk_overlap, pdf_workers=pdf_workers,
+                                      counters=pages):
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    if not queue.put(batch, _batch_bytes(batch)):
+                        return
+                    count(pages=pages["pages"] - counts["pages"], chunks_read=len(batch))
+                    batch = []
+            if batch:
+                queue.put(batch, _batch_bytes(batch))
+                count(pages=pages["pages"] - counts["pages"], chunks_read=len(batch))
+            queue.put(_DONE)
+        except BaseException as e:
+            queue.put(e)
+
+    reader = threading.Thread(target=read, name="ingest-reader", daemon=True)
+    reader.start()
+    ahead = max(settings.INGEST_EMBED_AHEAD, 0)
+    embedder = ThreadPoolExecutor(max_workers=max(ahead, 1), thread_name_prefix="ingest-embed")
+    pending = deque()  # (batch, future of its dense vectors), in batch order
+    total = 0
+    batches = 0
+    per_file = {}
+    bar = tqdm(desc="ingest", unit="chunk", disable=None)
+
+    def embed(batch):
+        vectors = vs.embed_dense([d.page_content for d in batch])
+        if vectors is not None:
+            count(embedded=len(batch))
+        return vectors
+
+    def index(batch, vectors):
+        nonlocal total, batches
+        batches += 1
+        vs.add_documents(batch, persist=batches % max(settings.INGEST_COMMIT_EVERY, 1) == 0, vectors=vectors)
+        total += len(batch)
+        for doc in batch:
+            per_file[doc.metadata["path"]] = per_file.get(doc.metadata["path"], 0) + 1
+        bar.update(len(batch))
+        # without precomputed vectors the store embeds while adding
+        count(chunks=len(batch), batches=1, embedded=len(batch) if vectors is None else 0)
+
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            pending.append((item, embedder.submit(embed, item)))
+            while len(pending) > ahead:
+                batch, vectors = pending.popleft()
+                index(batch, vectors.result())
+        while pending:
+            batch, vectors = pending.popleft()
+            index(batch, vectors.result())
+    finally:
+        # stop the reader and pending embeddings if we bail out early, then save whatever was indexed
+        queue.close()
+        for _, vectors in pending:
+            vectors.cancel()
+        embedder.shutdown(wait=True)
+        bar.close()
+        vs.flush()
+    reader.join()
+    for path in file_paths:
+        manifest.record(path, prints[path], params, per_file.get(path, 0))
+    if file_paths:
+        manifest.save()
+    return {
+        "ingested_files": [os.path.basename(p) for p in file_paths],
+        "total_chunks": total,
+        "skipped_files": [os.path.basename(p) for p in skipped],
+        "replaced_files": [os.path.basename(p) for p in replaced],
+        "removed_chunks": removed,
+        "embedding_cache": vs.embedding_client.cache_stats() if vs.embedding_client.provider != "local" else None,
+    }
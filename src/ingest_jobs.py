@@ -0,0 +1,187 @@
+"""Background ingest jobs, as run by POST /ingest.
+
+`IngestJobs.submit` records a job and returns it right away. The ingest
+itself runs later in a fresh subprocess (spawned, so it shares no threads or
+locks with the API), one job at a time with the rest queued. Chunking and
+embedding never hold the API process's GIL, so queries keep their usual
+latency while a large ingest runs. The store has a single writer anyway:
+ingest_files holds the store's lock file for the whole ingest, which also
+serializes jobs from other API workers and CLI runs.
+
+The subprocess writes the store on disk like any other ingest does. Readers in
+the API process pick up the new chunks on their next poll, or right away if
+`on_done` refreshes them.
+
+ingest_files' progress counts (pages read, chunks read, embedded, committed)
+come back over a pipe and are kept on the job. Jobs live in this process's
+memory. Only the last `INGEST_JOB_HISTORY` finished jobs are kept.
+"""
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from src.config import settings
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class IngestJob:
+    def __init__(self, staged: List[str], dest_dir: str, source_name: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.staged = staged  # uploads waiting to be moved into dest_dir
+        self.dest_dir = dest_dir
+        self.source_name = source_name
+        self.files = [os.path.basename(p) for p in staged]
+        self.progress: Dict[str, int] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the job has finished (or `timeout` seconds); True if it has."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files": self.files,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+def _ingest_process(conn, paths: List[str], source_name: Optional[str], chunk_size: int, chunk_overlap: int):
+    """Subprocess body: ingest `paths`, streaming ("progress", counts) and then
+    ("done", result) or ("error", message) to `conn`."""
+    lock = threading.Lock()  # progress is reported from several ingest threads
+
+    def send(kind, payload):
+        with lock:
+            conn.send((kind, payload))
+
+    try:
+        from src.ingest import ingest_files
+        result = ingest_files(paths, source_name=source_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                              progress=lambda counts: send("progress", counts))
+        send("done", result)
+    except BaseException as e:
+        send("error", str(e) or type(e).__name__)
+    finally:
+        conn.close()
+
+
+class IngestJobs:
+    def __init__(self, history: int = None, on_done: Callable[[IngestJob], None] = None):
+        self.history = settings.INGEST_JOB_HISTORY if history is None else history
+        self.on_done = on_done
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+        self._ctx = multiprocessing.get_context("spawn")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._procs: Dict[str, multiprocessing.process.BaseProcess] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, staged: List[str], dest_dir: str, source_name: str = None) -> IngestJob:
+        """Queue an ingest of the files at `staged`. Each is moved into `dest_dir`
+        (keeping its name) only when the job starts, so a queued upload never
+        replaces a same-named file another job is still reading."""
+        job = IngestJob(staged, dest_dir, source_name)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: IngestJob):
+        job.status = RUNNING
+        job.started = time.time()
+        result, error = None, None
+        try:
+            paths = []
+            for path in job.staged:
+                dest = os.path.join(job.dest_dir, os.path.basename(path))
+                os.replace(path, dest)
+                paths.append(dest)
+            result, error = self._ingest(job, paths)
+        except Exception as e:
+            error = str(e)
+        finally:
+            for d in {os.path.dirname(p) for p in job.staged}:
+                shutil.rmtree(d, ignore_errors=True)
+            if error is None and self.on_done is not None:
+                try:
+                    self.on_done(job)
+                except Exception:
+                    pass
+            # published last, so a poll that sees "done" also sees the refreshed store
+            job.result, job.error, job.finished = result, error, time.time()
+            job.status = DONE if error is None else FAILED
+            job._done.set()
+            self._trim()
+
+    def _ingest(self, job: IngestJob, paths: List[str]):
+        """Run the subprocess, tracking its progress; (result, None) or (None, error)."""
+        recv, send = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=_ingest_process, name=f"ingest-{job.id[:8]}",
+                                 args=(send, paths, job.source_name, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP))
+        proc.start()
+        send.close()  # so recv sees EOF if the subprocess dies
+        with self._lock:
+            self._procs[job.id] = proc
+        outcome = None
+        try:
+            while True:
+                try:
+                    kind, payload = recv.recv()
+                except EOFError:
+                    break
+                if kind == "progress":
+                    job.progress = payload
+                else:
+                    outcome = (payload, None) if kind == "done" else (None, payload)
+        finally:
+            proc.join()
+            recv.close()
+            with self._lock:
+                self._procs.pop(job.id, None)
+        return outcome or (None, f"ingest process exited with code {proc.exitcode}")
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond `history`."""
+        with self._lock:
+            finished = [j.id for j in self._jobs.values() if j.status in (DONE, FAILED)]
+            for job_id in finished[:max(len(finished) - self.history, 0)]:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def close(self):
+        """Stop running ingests (their partial chunks are cleaned up by the next
+        ingest of the same files) and drop queued ones."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            procs = list(self._procs.values())
+        for proc in procs:
+            proc.terminate()
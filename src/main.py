@@ -1,48 +1,238 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import List
+import asyncio
+import json
 import shutil
 import os
-from src.ingest import ingest_files
+import tempfile
+import time
+from src.ingest_jobs import IngestJobs
 from src.report_generator import ReportGenerator
-from src.schemas import IngestResponse, QueryRequest, QueryResponse, RetrievedChunk
+from src.schemas import IngestJob, QueryRequest, QueryResponse, RetrievedChunk
 from src.config import settings
+from src.utils.shared_store import SharedVectorStore
+from src.models import llm_client
+from src.utils.query_cache import default_query_cache
+from src.utils.embedding_cache import default_cache
+from src.utils.response_cache import default_response_cache
+from src.utils.web_cache import default_web_cache
+from src.utils.stages import StageTimeout
+from src.utils.admission import AdmissionController, Overloaded
+from src.utils.single_flight import default_single_flight
 
 app = FastAPI(title="MedRAG: LLM-Powered Diagnostic Report Generation")
 
 TEMP_UPLOAD_DIR = "./tmp_uploads"
-os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
+# uploads are written here first, then moved into TEMP_UPLOAD_DIR when their job starts
+INCOMING_DIR = os.path.join(TEMP_UPLOAD_DIR, ".incoming")
+os.makedirs(INCOMING_DIR, exist_ok=True)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
-@app.post("/ingest", response_model=IngestResponse)
-async def ingest_endpoint(files: List[UploadFile] = File(...), source_name: str = None):
+# one store per process, created at startup and hot-reloaded after ingests
+shared_store: SharedVectorStore = None
+ingest_jobs: IngestJobs = None
+# report requests only; health, stats and ingest status calls are never queued
+admission = AdmissionController()
+
+
+def _refresh_store(job):
+    # make the new chunks visible to this worker right away; others pick them up on their next poll
+    if shared_store is not None:
+        shared_store.refresh()
+
+
+@app.on_event("startup")
+def open_store():
+    global shared_store, ingest_jobs
+    shared_store = SharedVectorStore()
+    shared_store.start()
+    ingest_jobs = IngestJobs(on_done=_refresh_store)
+
+
+@app.on_event("shutdown")
+def close_store():
+    if ingest_jobs is not None:
+        ingest_jobs.close()
+    if shared_store is not None:
+        shared_store.stop()
+    llm_client.close()
+
+
+def _save_upload(f: UploadFile, dest: str):
+    with open(dest, "wb") as out_f:
+        shutil.copyfileobj(f.file, out_f, UPLOAD_CHUNK_BYTES)
+
+
+@app.post("/ingest", response_model=IngestJob, status_code=202)
+async def ingest_endpoint(response: Response, files: List[UploadFile] = File(...), source_name: str = None,
+                          wait: bool = False):
     """
     Upload PDFs or text files to ingest into the vector store.
+
+    Returns a queued job at once (202); poll GET /ingest/{job_id} for its
+    progress and result. With `wait=true`, answers only once the job has finished.
     """
+    staging = tempfile.mkdtemp(dir=INCOMING_DIR)
     saved_paths = []
     try:
         for f in files:
-            dest = os.path.join(TEMP_UPLOAD_DIR, f.filename)
-            with open(dest, "wb") as out_f:
-                content = await f.read()
-                out_f.write(content)
+            name = os.path.basename(f.filename or "")
+            if not name:
+                raise HTTPException(status_code=400, detail="upload without a file name")
+            dest = os.path.join(staging, name)
+            # copied in chunks off the event loop, so a large upload doesn't stall other requests
+            await asyncio.to_thread(_save_upload, f, dest)
             saved_paths.append(dest)
-        result = ingest_files(saved_paths, source_name=source_name, chunk_size=settings.CHUNK_SIZE, chunk_overlap=settings.CHUNK_OVERLAP)
-        return IngestResponse(**result)
+    except HTTPException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
     except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
         raise HTTPException(status_code=500, detail=str(e))
+    job = ingest_jobs.submit(saved_paths, TEMP_UPLOAD_DIR, source_name=source_name)
+    if wait:
+        await asyncio.to_thread(job.wait)
+        if job.error is not None:
+            raise HTTPException(status_code=500, detail=job.error)
+        response.status_code = 200
+    return job.to_dict()
+
+
+@app.get("/ingest/{job_id}", response_model=IngestJob)
+def ingest_status(job_id: str):
+    """Status of an ingest job: queued, running (with pages, chunks and
+    embeddings done so far), done (with the ingest result) or failed."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown ingest job {job_id}")
+    return job.to_dict()
+
+async def _admit() -> dict:
+    """Wait for a report slot; the trace to pass on (with the time queued). 503 when shed."""
+    try:
+        waited = await admission.acquire(deadline=time.monotonic() + settings.REPORT_DEADLINE)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"stages": {"queue": waited}}
+
 
 @app.post("/query", response_model=QueryResponse)
-def query_endpoint(req: QueryRequest):
+async def query_endpoint(req: QueryRequest):
     """
     Query the vector store + LLM to generate diagnostic report.
+
+    Runs under admission control: past QUERY_MAX_CONCURRENCY reports, requests
+    wait in a bounded queue and are shed with 503 and a Retry-After header.
     """
+    trace = await _admit()
+    start = time.monotonic()
     try:
-        gen = ReportGenerator()
-        report, retrieved = gen.generate(patient=req.patient.dict(), question=req.question, top_k=req.top_k, llm_model=req.llm_model)
+        gen = ReportGenerator(vs=shared_store)
+        report, retrieved = await gen.agenerate(patient=req.patient.dict(), question=req.question, top_k=req.top_k, llm_model=req.llm_model,
+                                                use_web=req.use_web, structured=req.structured, trace=trace)
         retrieved_serializable = []
         for r in retrieved:
             retrieved_serializable.append(RetrievedChunk(content=r.page_content, metadata=r.metadata))
-        return QueryResponse(report=report, retrieved=retrieved_serializable)
+        return QueryResponse(report=report, retrieved=retrieved_serializable, stages=trace["stages"],
+                             dropped_stages=trace["dropped"])
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except (StageTimeout, llm_client.LLMTimeout) as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release(time.monotonic() - start)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def query_stream_endpoint(req: QueryRequest):
+    """
+    Same as /query, as Server-Sent Events: `retrieved` (the chunks, sent as soon
+    as retrieval is done), `token` (LLM output as it arrives), `section` (each
+    rendered Markdown section of a structured report once it is complete),
+    then `done` with the full report and stage timings, or `error`.
+    Admitted like /query; the slot is held until the stream ends.
+    """
+    trace = await _admit()
+    start = time.monotonic()
+    gen = ReportGenerator(vs=shared_store)
+    events = gen.astream(patient=req.patient.dict(), question=req.question, top_k=req.top_k, llm_model=req.llm_model,
+                         use_web=req.use_web, structured=req.structured, trace=trace)
+    # run retrieval before answering, so an empty store is still a plain 400
+    try:
+        try:
+            _, retrieved = await events.__anext__()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except StageTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    except BaseException:
+        admission.release(time.monotonic() - start)
+        raise
+
+    async def body():
+        try:
+            yield _sse("retrieved", [{"content": r.page_content, "metadata": r.metadata} for r in retrieved])
+            async for event, data in events:
+                if event == "token":
+                    yield _sse("token", {"text": data})
+                elif event == "section":
+                    yield _sse("section", data)
+                elif event == "done":
+                    yield _sse("done", {"report": data, "stages": trace["stages"], "dropped_stages": trace["dropped"]})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            admission.release(time.monotonic() - start)
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/health")
+def health():
+    """Liveness check; answered even when report requests are being shed."""
+    return {"status": "ok", "store_loaded": shared_store is not None}
+
+
+@app.get("/metrics")
+def metrics():
+    """Admission control (concurrency, queue depth, wait and service times,
+    shed counts), request coalescing and ingest job counts of this API process."""
+    single_flight = default_single_flight()
+    return {
+        "admission": admission.stats(),
+        "coalescing": single_flight.stats() if single_flight is not None else None,
+        "ingest_jobs": ingest_jobs.stats() if ingest_jobs is not None else None,
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit rates of the query-embedding and retrieval-result caches, and of the
+    persistent document-embedding, LLM response and web search caches when enabled."""
+    embedding_cache = default_cache() if settings.EMBEDDING_PROVIDER.lower() in ("openai", "hf") else None
+    response_cache = default_response_cache()
+    web_cache = default_web_cache()
+    return {
+        "query": default_query_cache().stats(),
+        "document_embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+        "responses": response_cache.stats() if response_cache is not None else None,
+        "web_search": web_cache.stats() if web_cache is not None else None,
+    }
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    """Per-provider call counters, rolling latency percentiles, circuit breaker
+    states and hedging counts of the shared LLM client."""
+    client = llm_client.default_client()
+    return {"providers": client.stats, "router": client.router.stats()}
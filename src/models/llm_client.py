@@ -0,0 +1,495 @@
+"""Async LLM client shared by the whole process.
+
+One pooled `httpx.AsyncClient` (keep-alive; HTTP/2 when the `h2` package is
+installed) talks to every OpenAI-compatible chat endpoint: OpenAI at
+`OPENAI_BASE_URL`, and Groq at `GROQ_API_URL` when `GROQ_API_KEY` is set.
+Without an explicit provider, calls go to the fastest healthy provider
+first and fall back to the others (see src.models.llm_router); with
+`LLM_HEDGE` a slow call is raced against the next provider. Each provider has a semaphore
+(`LLM_MAX_CONCURRENCY` calls in flight). Each call has a deadline
+(`LLM_DEADLINE` seconds, covering the wait for a slot and all retries).
+429, 5xx and transport errors are retried up to `LLM_MAX_RETRIES` times
+with jittered backoff, honouring Retry-After.
+
+The client lives on a dedicated event-loop thread, so it can be shared
+across event loops and threads alike. Use `achat` from async code (the
+FastAPI handlers): it awaits without holding a thread. Use `chat` from sync
+code (CLI, eval scripts, thread pools). `astream` yields the completion as
+it is generated (OpenAI-style server-sent events); it retries and falls
+back to the next provider only until the first piece has arrived.
+"""
+import asyncio
+import importlib.util
+import json
+import random
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from src.config import settings
+from src.models.llm_router import ProviderRouter
+
+# httpx speaks HTTP/2 when the optional h2 package is installed
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+SYSTEM_PROMPT = "You are a concise, clinically-aware assistant that writes diagnostic reports."
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class Provider:
+    """An OpenAI-compatible chat completions endpoint.
+
+    The model sent is `pinned_model` if set, else the one asked for, else
+    `default_model`.
+    """
+    def __init__(self, name: str, url: str, api_key: str, default_model: str, pinned_model: str = "",
+                 max_concurrency: int = None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.default_model = default_model
+        self.pinned_model = pinned_model
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+
+    def model_for(self, requested: Optional[str]) -> str:
+        return self.pinned_model or requested or self.default_model
+
+
+def configured_providers() -> List[Provider]:
+    """OpenAI first, then Groq, for whichever have keys."""
+    providers = []
+    if settings.OPENAI_API_KEY:
+        providers.append(Provider("openai", settings.OPENAI_BASE_URL.rstrip("/") + "/chat/completions",
+                                  settings.OPENAI_API_KEY, settings.LLM_MODEL))
+    if settings.GROQ_API_KEY:
+        providers.append(Provider("groq", settings.GROQ_API_URL, settings.GROQ_API_KEY, settings.LLM_MODEL,
+                                  pinned_model=settings.GROQ_MODEL))
+    return providers
+
+
+def _content(data: dict) -> str:
+    try:
+        return data["choices"][0]["message"]["content"]
+    except Exception:
+        return data.get("choices", [{}])[0].get("text") or str(data)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncLLMClient:
+    def __init__(self, providers: List[Provider] = None, max_retries: int = None, max_connections: int = None,
+                 request_timeout: float = None, router: ProviderRouter = None, hedge: bool = None):
+        self.providers: Dict[str, Provider] = {p.name: p for p in (configured_providers() if providers is None else providers)}
+        self.router = router or ProviderRouter()
+        self.hedge = settings.LLM_HEDGE if hedge is None else hedge
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.max_connections = max_connections or settings.LLM_MAX_CONNECTIONS
+        self.request_timeout = request_timeout or settings.LLM_REQUEST_TIMEOUT
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # per provider: calls, retries, failures, timeouts
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                http2=HTTP2,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+            )
+        return self._http
+
+    def _semaphore(self, provider: Provider) -> asyncio.Semaphore:
+        if provider.name not in self._semaphores:
+            self._semaphores[provider.name] = asyncio.Semaphore(provider.max_concurrency)
+        return self._semaphores[provider.name]
+
+    def _count(self, provider: Provider, what: str):
+        counts = self.stats.setdefault(provider.name, {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0})
+        counts[what] += 1
+
+    def payload(self, provider: Provider, prompt: str, model: str = None, temperature: float = 0.2,
+                max_tokens: int = 800) -> dict:
+        return {
+            "model": provider.model_for(model),
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    async def chat(self, prompt: str, model: str = None, provider: str = None, temperature: float = 0.2,
+                   max_tokens: int = 800, deadline: float = None) -> str:
+        """Completion text from one provider (default: the first configured).
+        `deadline` is in seconds from now (default LLM_DEADLINE)."""
+        p = self._provider(provider)
+        budget = settings.LLM_DEADLINE if deadline is None else deadline
+        if budget <= 0:
+            # spent before the call (queueing, retrieval, an earlier provider): nothing
+            # the provider did, so its breaker is left alone
+            self.router.release(p.name)
+            raise LLMTimeout(f"{p.name}: deadline expired before the call was sent")
+        payload = self.payload(p, prompt, model, temperature, max_tokens)
+        self._count(p, "calls")
+        start = time.monotonic()
+        try:
+            text = await asyncio.wait_for(self._post(p, payload, start + budget), timeout=budget)
+        except asyncio.TimeoutError:
+            self._count(p, "timeouts")
+            self.router.failure(p.name)
+            raise LLMTimeout(f"{p.name}: no answer within {budget:.1f}s") from None
+        except LLMError:
+            self._count(p, "failures")
+            self.router.release(p.name)
+            raise
+        except asyncio.CancelledError:
+            # e.g. the losing side of a hedged call
+            self.router.release(p.name)
+            raise
+        except Exception:
+            # a bug rather than the provider; free the half-open probe so it is not stuck claimed
+            self._count(p, "failures")
+            self.router.release(p.name)
+            raise
+        self.router.record(p.name, payload["model"], time.monotonic() - start)
+        return text
+
+    async def chat_with_fallback(self, prompt: str, model: str = None, temperature: float = 0.2,
+                                 max_tokens: int = 800, deadline: float = None) -> str:
+        """Completion from the preferred provider, falling back to the others in
+        the router's order within one shared deadline. Providers with an open
+        circuit breaker are skipped. With hedging, the next provider is also
+        called once the current one has taken longer than its p95; the first
+        answer wins and the other call is cancelled."""
+        if not self.providers:
+            raise LLMError("No LLM provider configured. Set OPENAI_API_KEY (or GROQ_API_KEY) to generate reports.")
+        end = time.monotonic() + (settings.LLM_DEADLINE if deadline is None else deadline)
+        waiting = self.router.order(list(self.providers.values()), model)
+        running: Dict[asyncio.Task, Provider] = {}
+        hedged = set()
+        last = None
+
+        def launch() -> Optional[asyncio.Task]:
+            while waiting:
+                p = waiting.pop(0)
+                if self.router.acquire(p.name):
+                    task = asyncio.ensure_future(self.chat(prompt, model, p.name, temperature, max_tokens,
+                                                           deadline=end - time.monotonic()))
+                    running[task] = p
+                    return task
+            return None
+
+        def hedge_at(task: asyncio.Task) -> Optional[float]:
+            p = running[task]
+            return time.monotonic() + self.router.hedge_delay(p.name, p.model_for(model)) if self.hedge else None
+
+        first = launch()
+        if first is None:
+            raise LLMError("Every LLM provider is unavailable (circuit breaker open); try again shortly.")
+        next_hedge = hedge_at(first)
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= end:
+                    break
+                timeout = end - now
+                if next_hedge is not None and waiting:
+                    timeout = min(timeout, max(0.0, next_hedge - now))
+                done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    running.pop(task)
+                    try:
+                        text = task.result()
+                    except LLMError as e:
+                        last = e
+                        continue
+                    if task in hedged:
+                        self.router.hedge_wins += 1
+                    return text
+                if not done:
+                    # the hedge timer fired: race the next provider against the slow one
+                    next_hedge = None
+                    task = launch()
+                    if task is not None:
+                        hedged.add(task)
+                        self.router.hedges += 1
+                elif not running:
+                    task = launch()
+                    if task is not None:
+                        next_hedge = hedge_at(task)
+        finally:
+            for task in running:
+                task.cancel()
+        raise last or LLMTimeout("LLM deadline expired before any provider answered")
+
+    async def stream(self, prompt: str, model: str = None, provider: str = None, temperature: float = 0.2,
+                     max_tokens: int = 800, deadline: float = None) -> AsyncIterator[str]:
+        """Completion text in pieces as the provider generates it."""
+        p = self._provider(provider)
+        end = time.monotonic() + (settings.LLM_DEADLINE if deadline is None else deadline)
+        if end <= time.monotonic():
+            # as in chat: an expired deadline is not the provider's failure
+            self.router.release(p.name)
+            raise LLMTimeout(f"{p.name}: deadline expired before the call was sent")
+        payload = dict(self.payload(p, prompt, model, temperature, max_tokens), stream=True)
+        headers = {"Authorization": f"Bearer {p.api_key}", "Content-Type": "application/json"}
+        self._count(p, "calls")
+        last = None
+        emitted = False
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore(p):
+                    async with self._client().stream("POST", p.url, json=payload, headers=headers) as r:
+                        if r.status_code == 200:
+                            self.router.success(p.name)
+                            lines = r.aiter_lines()
+                            while True:
+                                remaining = end - time.monotonic()
+                                if remaining <= 0:
+                                    raise asyncio.TimeoutError
+                                try:
+                                    line = await asyncio.wait_for(lines.__anext__(), timeout=remaining)
+                                except StopAsyncIteration:
+                                    return
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                try:
+                                    choice = json.loads(data)["choices"][0]
+                                except (ValueError, KeyError, IndexError):
+                                    continue
+                                piece = (choice.get("delta") or {}).get("content") or choice.get("text") or ""
+                                if piece:
+                                    emitted = True
+                                    yield piece
+                        await r.aread()
+                        last = LLMError(f"{p.name} call failed: {r.status_code} {r.text[:200]}")
+                        if r.status_code not in RETRY_STATUS:
+                            # not worth retrying (e.g. 401/404), but still a sign the provider is unusable
+                            self._count(p, "failures")
+                            self.router.failure(p.name)
+                            self.router.release(p.name)
+                            raise last
+                        retry_after = _retry_after(r)
+                        self.router.failure(p.name)
+            except asyncio.TimeoutError:
+                self._count(p, "timeouts")
+                self.router.failure(p.name)
+                raise LLMTimeout(f"{p.name}: stream did not finish within the deadline") from None
+            except httpx.TransportError as e:
+                self.router.failure(p.name)
+                if emitted:
+                    # part of the answer is already out; a retry would repeat it
+                    self._count(p, "failures")
+                    raise LLMError(f"{p.name} stream broke off: {e}") from e
+                last = e
+            except (asyncio.CancelledError, GeneratorExit):
+                # cancelled, or the consumer stopped reading
+                self.router.release(p.name)
+                raise
+            if attempt == self.max_retries or not self.router.available(p.name):
+                break
+            delay = max(random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt)),
+                        retry_after or 0.0)
+            if time.monotonic() + delay >= end:
+                break
+            self._count(p, "retries")
+            await asyncio.sleep(delay)
+        self._count(p, "failures")
+        raise LLMError(f"{p.name} call failed after {attempt + 1} attempts: {last}")
+
+    async def stream_with_fallback(self, prompt: str, model: str = None, temperature: float = 0.2,
+                                   max_tokens: int = 800, deadline: float = None) -> AsyncIterator[str]:
+        """stream() from each provider in the router's order until one starts
+        answering (no hedging: two streams cannot be merged once both have begun).
+        Providers with an open circuit breaker are skipped."""
+        if not self.providers:
+            raise LLMError("No LLM provider configured. Set OPENAI_API_KEY (or GROQ_API_KEY) to generate reports.")
+        end = time.monotonic() + (settings.LLM_DEADLINE if deadline is None else deadline)
+        last = None
+        tried = False
+        for p in self.router.order(list(self.providers.values()), model):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.router.acquire(p.name):
+                continue
+            tried = True
+            emitted = False
+            try:
+                async for piece in self.stream(prompt, model, p.name, temperature, max_tokens, deadline=remaining):
+                    emitted = True
+                    yield piece
+                return
+            except LLMError as e:
+                if emitted:
+                    raise
+                last = e
+        if not tried:
+            raise LLMError("Every LLM provider is unavailable (circuit breaker open); try again shortly.")
+        raise last or LLMTimeout("LLM deadline expired before any provider was tried")
+
+    def _provider(self, name: Optional[str]) -> Provider:
+        if name is None:
+            if not self.providers:
+                raise LLMError("No LLM provider configured. Set OPENAI_API_KEY (or GROQ_API_KEY) to generate reports.")
+            return next(iter(self.providers.values()))
+        try:
+            return self.providers[name]
+        except KeyError:
+            raise LLMError(f"LLM provider {name!r} is not configured") from None
+
+    async def _post(self, p: Provider, payload: dict, end: float) -> str:
+        headers = {"Authorization": f"Bearer {p.api_key}", "Content-Type": "application/json"}
+        last = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            # the slot is only held for the request itself, not during backoff
+            async with self._semaphore(p):
+                try:
+                    r = await self._client().post(p.url, json=payload, headers=headers)
+                except httpx.TransportError as e:
+                    last = e
+                else:
+                    if r.status_code == 200:
+                        try:
+                            return _content(r.json())
+                        except Exception:
+                            # e.g. a proxy's HTML error page sent with a 200
+                            self.router.failure(p.name)
+                            raise LLMError(f"{p.name} returned an unreadable response: {r.text[:200]}") from None
+                    last = LLMError(f"{p.name} call failed: {r.status_code} {r.text[:200]}")
+                    if r.status_code not in RETRY_STATUS:
+                        # not worth retrying (e.g. 401/404), but still a sign the provider is unusable
+                        self.router.failure(p.name)
+                        raise last
+                    retry_after = _retry_after(r)
+            self.router.failure(p.name)
+            if attempt == self.max_retries or not self.router.available(p.name):
+                # out of attempts, or the failures tripped the breaker: let the next provider answer
+                break
+            delay = random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+            delay = max(delay, retry_after or 0.0)
+            if time.monotonic() + delay >= end:
+                # would wake up past the deadline; fail now so a fallback still has time
+                break
+            self._count(p, "retries")
+            await asyncio.sleep(delay)
+        raise LLMError(f"{p.name} call failed after {attempt + 1} attempts: {last}")
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_CLIENT: Optional[AsyncLLMClient] = None
+_LOCK = threading.Lock()
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    """The event loop that owns the shared client, started on first use."""
+    global _LOOP
+    with _LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+def default_client() -> AsyncLLMClient:
+    global _CLIENT
+    with _LOCK:
+        if _CLIENT is None:
+            _CLIENT = AsyncLLMClient()
+        return _CLIENT
+
+
+def submit(coro):
+    """Schedule a coroutine on the client's loop; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _loop())
+
+
+async def achat(prompt: str, model: str = None, provider: str = None, deadline: float = None, **kwargs) -> str:
+    """Await a completion from any event loop (with provider fallback unless `provider` is given)."""
+    client = default_client()
+    if provider is None:
+        coro = client.chat_with_fallback(prompt, model, deadline=deadline, **kwargs)
+    else:
+        coro = client.chat(prompt, model, provider, deadline=deadline, **kwargs)
+    return await asyncio.wrap_future(submit(coro))
+
+
+def chat(prompt: str, model: str = None, provider: str = None, deadline: float = None, **kwargs) -> str:
+    """Blocking version of achat for sync callers."""
+    client = default_client()
+    if provider is None:
+        coro = client.chat_with_fallback(prompt, model, deadline=deadline, **kwargs)
+    else:
+        coro = client.chat(prompt, model, provider, deadline=deadline, **kwargs)
+    return submit(coro).result()
+
+
+async def astream(prompt: str, model: str = None, provider: str = None, deadline: float = None,
+                  **kwargs) -> AsyncIterator[str]:
+    """Completion pieces as they arrive, consumable from any event loop."""
+    client = default_client()
+    if provider is None:
+        pieces = client.stream_with_fallback(prompt, model, deadline=deadline, **kwargs)
+    else:
+        pieces = client.stream(prompt, model, provider, deadline=deadline, **kwargs)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        # runs on the client's loop and hands every piece over to the caller's loop
+        try:
+            async for piece in pieces:
+                loop.call_soon_threadsafe(queue.put_nowait, piece)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, end)
+
+    future = submit(pump())
+    try:
+        while True:
+            item = await queue.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # the consumer stopped early (e.g. the HTTP client went away): stop generating
+        future.cancel()
+
+
+def close():
+    """Close the pooled connections (e.g. on API shutdown)."""
+    if _CLIENT is not None and _LOOP is not None:
+        submit(_CLIENT.aclose()).result(timeout=10)
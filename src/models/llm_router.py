@@ -0,0 +1,183 @@
+"""Latency- and health-aware ordering of LLM providers.
+
+`ProviderRouter` keeps, per (provider, model), the latencies of the last
+`LLM_LATENCY_WINDOW` successful calls, and a circuit breaker per provider:
+
+- `order(providers, model)` puts the providers whose breaker is open last
+  (the client skips them while it stays open), and before them those that
+  failed since their last success. Among the rest, providers with fewer
+  than `min_samples` measurements come first, in configured order, so every
+  provider gets measured; then they are sorted by their rolling p50.
+- `hedge_delay(provider, model)` is how long to wait for a provider before
+  firing the next one as well: its rolling p95, or `LLM_HEDGE_DELAY` until
+  it has been measured.
+- A breaker opens after `LLM_BREAKER_ERRORS` failed attempts within
+  `LLM_BREAKER_WINDOW` seconds. After `LLM_BREAKER_COOLDOWN` seconds it lets
+  a single probe call through (half-open). The probe's outcome closes it or
+  opens it again.
+
+Failures are recorded per HTTP attempt (5xx, 429, transport errors, and
+non-retryable statuses such as 401/404), so a burst trips the breaker even
+while a call is still retrying, and a misconfigured provider is not tried first.
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import settings
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, errors: int = None, window: float = None, cooldown: float = None):
+        self.errors = settings.LLM_BREAKER_ERRORS if errors is None else errors
+        self.window = settings.LLM_BREAKER_WINDOW if window is None else window
+        self.cooldown = settings.LLM_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._failures: Deque[float] = deque()
+        self._probing = False
+
+    def _tick(self, now: float):
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._probing = False
+
+    def recent_failures(self, now: float) -> int:
+        """Failures within the window since the last success."""
+        while self._failures and now - self._failures[0] > self.window:
+            self._failures.popleft()
+        return len(self._failures)
+
+    def available(self, now: float) -> bool:
+        """Whether a call may be sent now (does not claim the half-open probe)."""
+        self._tick(now)
+        return self.state == CLOSED or (self.state == HALF_OPEN and not self._probing)
+
+    def acquire(self, now: float) -> bool:
+        """Claim the right to send a call: always when closed, once when half-open."""
+        self._tick(now)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """The claimed call was never completed (e.g. cancelled): free the probe."""
+        self._probing = False
+
+    def success(self):
+        self.state = CLOSED
+        self._probing = False
+        self._failures.clear()
+
+    def failure(self, now: float):
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        self._failures.append(now)
+        if self.state == CLOSED and self.recent_failures(now) >= self.errors:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._probing = False
+        self._failures.clear()
+
+
+class ProviderRouter:
+    def __init__(self, window: int = None, min_samples: int = 5, hedge_delay: float = None,
+                 breaker_errors: int = None, breaker_window: float = None, breaker_cooldown: float = None):
+        self.window = window or settings.LLM_LATENCY_WINDOW
+        self.min_samples = min_samples
+        self.default_hedge_delay = settings.LLM_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        self._breaker_args = (breaker_errors, breaker_window, breaker_cooldown)
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(*self._breaker_args)
+        return self._breakers[provider]
+
+    def _quantile(self, provider: str, model: str, q: float) -> Optional[float]:
+        samples = self._latencies.get((provider, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return float(np.quantile(np.fromiter(samples, dtype=float), q))
+
+    def order(self, providers: List, model: Optional[str]) -> List:
+        """`providers` (with .name and .model_for) from most to least preferred."""
+        now = time.monotonic()
+        with self._lock:
+            def key(item):
+                position, p = item
+                breaker = self._breaker(p.name)
+                healthy = breaker.available(now)
+                failing = breaker.recent_failures(now) > 0
+                p50 = self._quantile(p.name, p.model_for(model), 0.5)
+                return (not healthy, failing, p50 is not None, p50 or 0.0, position)
+            return [p for _, p in sorted(enumerate(providers), key=key)]
+
+    def acquire(self, provider: str) -> bool:
+        with self._lock:
+            return self._breaker(provider).acquire(time.monotonic())
+
+    def available(self, provider: str) -> bool:
+        with self._lock:
+            return self._breaker(provider).available(time.monotonic())
+
+    def hedge_delay(self, provider: str, model: str) -> float:
+        with self._lock:
+            p95 = self._quantile(provider, model, 0.95)
+        return self.default_hedge_delay if p95 is None else p95
+
+    def record(self, provider: str, model: str, latency: float):
+        """A successful call and how long it took."""
+        with self._lock:
+            samples = self._latencies.get((provider, model))
+            if samples is None:
+                samples = self._latencies[(provider, model)] = deque(maxlen=self.window)
+            samples.append(latency)
+            self._breaker(provider).success()
+
+    def release(self, provider: str):
+        with self._lock:
+            self._breaker(provider).release()
+
+    def success(self, provider: str):
+        with self._lock:
+            self._breaker(provider).success()
+
+    def failure(self, provider: str):
+        with self._lock:
+            self._breaker(provider).failure(time.monotonic())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            latency = {}
+            for (provider, model), samples in self._latencies.items():
+                values = np.fromiter(samples, dtype=float)
+                latency[f"{provider}:{model}"] = {
+                    "samples": len(values),
+                    "p50": float(np.quantile(values, 0.5)),
+                    "p95": float(np.quantile(values, 0.95)),
+                }
+            breakers = {}
+            for name, b in self._breakers.items():
+                b._tick(now)
+                breakers[name] = {"state": b.state, "trips": b.trips}
+            return {"latency": latency, "breakers": breakers, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
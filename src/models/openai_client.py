@@ -1,27 +1,14 @@
-import os
-from typing import Optional
 from src.config import settings
-import openai
+from src.models.llm_client import chat
 
-# Ensure the API key is set in environment before creating client
-if settings.OPENAI_API_KEY:
-    openai.api_key = settings.OPENAI_API_KEY
 
-def call_openai_chat(prompt: str, model: str = None, temperature: float = 0.2, max_tokens: int = 800) -> str:
+def call_openai_chat(prompt: str, model: str = None, temperature: float = 0.2, max_tokens: int = 800,
+                     deadline: float = None) -> str:
     """
-    Calls OpenAI ChatCompletion (chat-based LLM). Requires OPENAI_API_KEY in env.
+    Calls OpenAI chat completions (chat-based LLM). Requires OPENAI_API_KEY in env.
+    Goes through the shared pooled client (see src.models.llm_client).
     """
-    model = model or settings.LLM_MODEL
     # Basic safety: if no API key set, raise
-    if not getattr(openai, "api_key", None):
+    if not settings.OPENAI_API_KEY:
         raise RuntimeError("OpenAI API key not configured. Set OPENAI_API_KEY in environment to use OpenAI LLM.")
-    resp = openai.ChatCompletion.create(
-        model=model,
-        messages=[
-            {"role":"system","content":"You are a concise, clinically-aware assistant that writes diagnostic reports."},
-            {"role":"user","content": prompt}
-        ],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
-    return resp.choices[0].message.content
\ No newline at end of file
+    return chat(prompt, model=model, provider="openai", deadline=deadline, temperature=temperature, max_tokens=max_tokens)
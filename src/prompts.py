@@ -1,6 +1,18 @@
-def build_report_prompt(patient: dict, retrieved_snippets: list, question: str, extra_context: str = "") -> str:
+from typing import Optional
+
+from src.config import settings
+from src.utils.context_packer import count_tokens, pack_context
+
+
+def build_report_prompt(patient: dict, retrieved_snippets: list, question: str, extra_context: str = "",
+                        token_budget: Optional[int] = None, stats: Optional[dict] = None) -> str:
     """
     Composes a prompt for the LLM including patient info and retrieved evidence.
+
+    The evidence (chunks and web lines) is packed into `token_budget` tokens
+    (default PROMPT_CONTEXT_TOKENS; 0 pastes everything in full), see
+    src.utils.context_packer. If `stats` is a dict it receives the prompt's
+    token count with and without packing ("prompt_tokens_before/after").
     """
     patient_section = []
     if patient:
@@ -9,18 +21,43 @@ def build_report_prompt(patient: dict, retrieved_snippets: list, question: str,
                 patient_section.append(f"{k}: {v}")
     patient_text = "\n".join(patient_section) if patient_section else "N/A"
 
+    token_budget = settings.PROMPT_CONTEXT_TOKENS if token_budget is None else token_budget
+    full = _evidence(retrieved_snippets, extra_context)
+    if token_budget > 0 and (retrieved_snippets or extra_context):
+        packed, web, _ = pack_context(question, retrieved_snippets or [], extra_context, token_budget)
+        context_text = _evidence_text(packed, web)
+    else:
+        context_text = full
+
+    prompt = _render(patient_text, question, context_text)
+    if stats is not None:
+        stats["prompt_tokens_after"] = count_tokens(prompt)
+        stats["prompt_tokens_before"] = (count_tokens(_render(patient_text, question, full)) if context_text != full
+                                         else stats["prompt_tokens_after"])
+    return prompt
+
+
+def _evidence(retrieved_snippets: list, extra_context: str) -> str:
+    """Every retrieved chunk in full, then the web evidence."""
     context_text = ""
     if retrieved_snippets:
         context_text = "\n\n".join([
             f"Source: {getattr(r, 'metadata', {}).get('source','unknown')}\nSnippet:\n{getattr(r, 'page_content','')}"
             for r in retrieved_snippets
         ])
-    else:
+    return _evidence_text(context_text, extra_context)
+
+
+def _evidence_text(context_text: str, extra_context: str) -> str:
+    if not context_text:
         context_text = "No retrieved evidence."
 
     if extra_context:
         context_text = context_text + "\n\nAdditional web evidence:\n" + extra_context
+    return context_text
+
 
+def _render(patient_text: str, question: str, context_text: str) -> str:
     prompt = f"""
 You are a medical assistant that prepares a clinical diagnostic report. Use the evidence provided from research papers, books and other medical sources. The final report should contain: 1) Brief history and summary 2) Differential diagnosis (top likely diagnoses with reasoning) 3) Recommended diagnostic tests and justification 4) Suggested immediate management or next steps 5) Short list of references (source names).
 
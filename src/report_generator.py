@@ -1,27 +1,63 @@
-from typing import List, Tuple, Optional
+from typing import AsyncIterator, List, Tuple, Optional
+import asyncio
 import json
+import threading
 import datetime
-import os
+import time
 from src.utils.vectorstore import VectorStore
 from src.prompts import build_report_prompt
-from src.models.openai_client import call_openai_chat
-import requests
-import os
+from src.models.llm_client import achat, astream, chat
+from src.utils.json_stream import JSONFieldStream
+from src.utils.hybrid import doc_key
+from src.utils.response_cache import ResponseCache, default_response_cache, normalize_question, question_vector
+from src.utils.single_flight import LEAD, CoalesceTimeout, SingleFlight, default_single_flight
+from src.utils.stages import Stage, StageTimeout, run_stages
+from src.config import settings
 from src.utils.web_search import search_web
 from langchain.schema import Document
 
 
+_DEFAULT = object()
+
+# sampling parameters of report generation (part of the response cache key)
+LLM_TEMPERATURE = 0.2
+LLM_MAX_TOKENS = 800
+
+
 class ReportGenerator:
-    def __init__(self):
-        self.vs = VectorStore()
+    def __init__(self, vs=None, response_cache: Optional[ResponseCache] = _DEFAULT,
+                 single_flight: Optional[SingleFlight] = _DEFAULT):
+        # vs: a VectorStore or a SharedVectorStore (the API passes its process-wide one)
+        self.vs = vs if vs is not None else VectorStore()
+        # LLM answers are reused across requests (see src.utils.response_cache); None disables
+        self.response_cache = default_response_cache() if response_cache is _DEFAULT else response_cache
+        # identical concurrent requests share one computation (see src.utils.single_flight); None disables
+        self.single_flight = default_single_flight() if single_flight is _DEFAULT else single_flight
+        # prompt tokens with and without context packing, summed over requests
+        self._prompt_tokens = {"prompts": 0, "tokens_before": 0, "tokens_after": 0}
+        self._prompt_lock = threading.Lock()
+
+    def _store(self) -> VectorStore:
+        # a shared store hands out its current instance; keep that one for the whole request
+        return getattr(self.vs, "current", self.vs)
 
-    def retrieve(self, question: str, top_k: int = 6) -> List[Document]:
-        results = self.vs.similarity_search_with_scores(question, k=top_k)
+    def retrieve(self, question: str, top_k: int = 6, vs: VectorStore = None) -> List[Document]:
+        results = (vs or self._store()).similarity_search_with_scores(question, k=top_k)
         # results is list of (Document, score)
         return [r[0] for r in results]
 
-    def _render_markdown(self, structured: dict) -> str:
-        """Render a formal report in Markdown from a structured dict."""
+    # body sections of a structured report, in rendering order
+    SECTIONS = [
+        ("executive_summary", "Executive summary"),
+        ("background", "Background"),
+        ("methods", "Methods"),
+        ("findings", "Findings"),
+        ("recommendations", "Recommendations"),
+        ("references", "References"),
+    ]
+
+    def _render_header(self, structured: dict) -> str:
+        """Title and author/date lines of a structured report."""
         lines = []
         title = structured.get("title") or "Clinical Report"
         lines.append(f"# {title}\n")
@@ -30,104 +66,120 @@ class ReportGenerator:
         author = meta.get("author", "MedRAG Report Generator")
         date = meta.get("date", datetime.datetime.utcnow().isoformat())
         lines.append(f"**Prepared by:** {author}  \n**Date:** {date}\n")
+        return "\n".join(lines)
 
-        if structured.get("executive_summary"):
-            lines.append("## Executive summary\n")
-            lines.append(structured["executive_summary"].strip() + "\n")
-
-        if structured.get("background"):
-            lines.append("## Background\n")
-            lines.append(structured["background"].strip() + "\n")
-
-        if structured.get("methods"):
-            lines.append("## Methods\n")
-            lines.append(structured["methods"].strip() + "\n")
-
-        if structured.get("findings"):
-            lines.append("## Findings\n")
-            if isinstance(structured["findings"], list):
-                for f in structured["findings"]:
-                    lines.append(f"- {f.strip()}")
-            else:
-                lines.append(structured["findings"].strip())
-            lines.append("\n")
-
-        if structured.get("recommendations"):
-            lines.append("## Recommendations\n")
-            if isinstance(structured["recommendations"], list):
-                for r in structured["recommendations"]:
-                    lines.append(f"- {r.strip()}")
-            else:
-                lines.append(structured["recommendations"].strip())
-            lines.append("\n")
-
-        if structured.get("references"):
-            lines.append("## References\n")
-            if isinstance(structured["references"], list):
-                for ref in structured["references"]:
-                    lines.append(f"- {ref}")
-            else:
-                lines.append(structured["references"]) 
-            lines.append("\n")
-
+    def _render_section(self, key: str, value) -> Optional[str]:
+        """Markdown of one body section (None when the value is empty)."""
+        if not value:
+            return None
+        heading = dict(self.SECTIONS)[key]
+        lines = [f"## {heading}\n"]
+        if key in ("executive_summary", "background", "methods"):
+            lines.append(value.strip() + "\n")
+            return "\n".join(lines)
+        if isinstance(value, list):
+            for item in value:
+                lines.append(f"- {item.strip()}" if key != "references" else f"- {item}")
+        else:
+            lines.append(value.strip() if key != "references" else value)
+        lines.append("\n")
         return "\n".join(lines)
 
-    def generate(self, patient: dict, question: str, top_k: int = 6, llm_model: str = None, use_web: bool = False, output_path: Optional[str] = None, structured: bool = True) -> Tuple[str, List[Document]]:
-        """Generate a formal clinical report.
+    def _render_markdown(self, structured: dict) -> str:
+        """Render a formal report in Markdown from a structured dict."""
+        parts = [self._render_header(structured)]
+        for key, _ in self.SECTIONS:
+            section = self._render_section(key, structured.get(key))
+            if section is not None:
+                parts.append(section)
+        return "\n".join(parts)
 
-        If `structured` is True, the generator asks the LLM to return JSON with keys:
-        title, meta, executive_summary, background, methods, findings (list), recommendations (list), references (list).
+    def _web_context(self, question: str, top_k: int, timeout: float) -> str:
+        web_results = search_web(question, k=top_k, timeout=timeout)
+        extra_context_lines = []
+        for w in web_results:
+            extra_context_lines.append(f"{w.get('title','')}: {w.get('snippet','')} ({w.get('url','')})")
+        return "\n".join(extra_context_lines)
 
-        If `output_path` is provided, the report will be saved to that path (markdown).
-        """
-        if self.vs.is_empty():
-            raise ValueError("Vector store is empty. Ingest documents first.")
+    def _build_prompt(self, patient: dict, question: str, retrieved: List[Document], extra_context: str,
+                      structured: bool) -> str:
+        tokens = {}
+        prompt = build_report_prompt(patient, retrieved, question, extra_context=extra_context, stats=tokens)
+        with self._prompt_lock:
+            self._prompt_tokens["prompts"] += 1
+            self._prompt_tokens["tokens_before"] += tokens["prompt_tokens_before"]
+            self._prompt_tokens["tokens_after"] += tokens["prompt_tokens_after"]
+
+        if structured:
+            # Ask the model to return JSON structure for reliable parsing
+            prompt = prompt + "\n\nOUTPUT FORMAT INSTRUCTIONS:\nReturn a single JSON object with the following keys: title, meta (subkeys: author,date), executive_summary, background, methods, findings (array of strings), recommendations (array of strings), references (array of strings). Respond only with valid JSON."
+        return prompt
 
-        retrieved = self.retrieve(question, top_k=top_k)
+    def _prepare(self, patient: dict, question: str, top_k: int, use_web: bool, structured: bool,
+                 vs: VectorStore, end: float, trace: dict) -> Tuple[str, List[Document], str]:
+        """Retrieval, web context and prompt: everything before the LLM call, as
+        a stage graph (src.utils.stages). Retrieval and web search run
+        concurrently; web search is dropped (the report is written without web
+        evidence) if it takes longer than WEB_SEARCH_TIMEOUT or fails.
+        Everything must finish by `end` (time.monotonic()).
+        Returns (prompt, retrieved, web context)."""
+        if vs.is_empty():
+            raise ValueError("Vector store is empty. Ingest documents first.")
 
-        extra_context = ""
+        stages = [Stage("retrieval", lambda: self.retrieve(question, top_k=top_k, vs=vs))]
         if use_web:
-            try:
-                web_results = search_web(question, k=top_k)
-                extra_context_lines = []
-                for w in web_results:
-                    extra_context_lines.append(f"{w.get('title','')}: {w.get('snippet','')} ({w.get('url','')})")
-                extra_context = "\n".join(extra_context_lines)
-            except Exception:
-                extra_context = ""
+            slot = settings.WEB_SEARCH_TIMEOUT
+            stages.append(Stage("web_search", lambda: self._web_context(question, top_k, slot), optional=True, slot=slot))
+        stages.append(Stage(
+            "prompt",
+            lambda retrieval, web_search=None: self._build_prompt(patient, question, retrieval, web_search or "", structured),
+            deps=[stage.name for stage in stages],
+        ))
+        run = run_stages(stages, end)
+        trace.setdefault("stages", {}).update(run.timings)
+        trace.setdefault("dropped", {}).update(run.dropped)
+        return run.results["prompt"], run.results["retrieval"], run.results.get("web_search") or ""
 
-        prompt = build_report_prompt(patient, retrieved, question, extra_context=extra_context)
+    def prompt_token_stats(self) -> dict:
+        """Prompt tokens before/after context packing (without the JSON format
+        instructions), summed over the prompts built so far."""
+        with self._prompt_lock:
+            stats = dict(self._prompt_tokens)
+        stats["saved_ratio"] = 1 - stats["tokens_after"] / stats["tokens_before"] if stats["tokens_before"] else 0.0
+        return stats
 
-        if structured:
-            # Ask the model to return JSON structure for reliable parsing
-            prompt = prompt + "\n\nOUTPUT FORMAT INSTRUCTIONS:\nReturn a single JSON object with the following keys: title, meta (subkeys: author,date), executive_summary, background, methods, findings (array of strings), recommendations (array of strings), references (array of strings). Respond only with valid JSON."
+    def _cached(self, patient: dict, question: str, prompt: str, retrieved: List[Document], extra_context: str,
+                llm_model: Optional[str], structured: bool, vs: VectorStore):
+        """Look the request up in the response cache. Returns (entry, cached text):
+        `entry` identifies the request for _remember (None with the cache off)."""
+        if self.response_cache is None:
+            return None, None
+        model = llm_model or settings.LLM_MODEL
+        # the same normalized text for the embedding and the vector, so both tiers see one question
+        question = normalize_question(question)
+        dense = vs.query_embedding(question)
+        space, qvec = question_vector(dense, vs.embedding_model if dense is not None else None)
+        key = ResponseCache.exact_key(prompt, model, LLM_TEMPERATURE, LLM_MAX_TOKENS)
+        group = ResponseCache.group_key(space, model, LLM_TEMPERATURE, LLM_MAX_TOKENS, structured, patient,
+                                        [doc_key(d) for d in retrieved], extra_context)
+        text, _ = self.response_cache.get(key, group, qvec)
+        return (key, group, qvec), text
+
+    def _remember(self, entry, llm_text: str, latency: float):
+        if entry is not None and llm_text:
+            key, group, qvec = entry
+            self.response_cache.put(key, group, qvec, llm_text, latency)
 
-        # Call LLM (prefer OpenAI client; fallback to Groq HTTP API if OpenAI key not configured)
-        llm_text = None
-        try:
-            llm_text = call_openai_chat(prompt, model=llm_model)
-        except Exception:
-            # Fallback to Groq if GROQ_API_KEY is present
-            groq_url = os.environ.get("GROQ_API_URL") or "https://api.groq.com/openai/v1/chat/completions"
-            groq_key = os.environ.get("GROQ_API_KEY")
-            groq_model = os.environ.get("GROQ_MODEL") or llm_model or "gpt-4o-mini"
-            if groq_key:
-                headers = {"Authorization": f"Bearer {groq_key}", "Content-Type": "application/json"}
-                payload = {"model": groq_model, "messages": [{"role": "user", "content": prompt}], "temperature": 0.2, "max_tokens": 800}
-                r = requests.post(groq_url, json=payload, headers=headers, timeout=120)
-                try:
-                    r.raise_for_status()
-                    data = r.json()
-                    # Prefer assistant content
-                    try:
-                        llm_text = data["choices"][0]["message"]["content"]
-                    except Exception:
-                        llm_text = data.get("choices", [{}])[0].get("text") or str(data)
-                except Exception:
-                    raise RuntimeError(f"Groq call failed: {r.status_code} {r.text}")
-            else:
-                raise
+    def _prepare_cached(self, patient: dict, question: str, top_k: int, llm_model: Optional[str], use_web: bool,
+                        structured: bool, end: float, trace: dict):
+        """_prepare plus the response cache lookup: (cache entry, cached text or None, prompt, retrieved)."""
+        vs = self._store()
+        prompt, retrieved, extra_context = self._prepare(patient, question, top_k, use_web, structured, vs, end, trace)
+        entry, cached = self._cached(patient, question, prompt, retrieved, extra_context, llm_model, structured, vs)
+        return entry, cached, prompt, retrieved
 
+    def _finish(self, llm_text: str, structured: bool, output_path: Optional[str]) -> str:
+        """Parse/render the LLM answer and save it if requested."""
         report_text = llm_text
         if structured:
             # Try to extract JSON from the LLM response
@@ -152,4 +204,160 @@ class ReportGenerator:
             except Exception:
                 pass
 
-        return report_text, retrieved
\ No newline at end of file
+        return report_text
+
+    @staticmethod
+    def _start(trace: Optional[dict]) -> Tuple[float, dict]:
+        """(deadline of the whole request, trace dict to record stages in).
+        Time already spent waiting for admission (trace["stages"]["queue"]) counts."""
+        trace = {} if trace is None else trace
+        trace.setdefault("stages", {})
+        trace.setdefault("dropped", {})
+        return time.monotonic() + settings.REPORT_DEADLINE - trace["stages"].get("queue", 0.0), trace
+
+    @staticmethod
+    def _llm_deadline(end: float) -> float:
+        return max(0.0, min(settings.LLM_DEADLINE, end - time.monotonic()))
+
+    def _flight_key(self, patient: dict, question: str, top_k: int, llm_model: Optional[str], use_web: bool,
+                    structured: bool):
+        return SingleFlight.key(patient, question, top_k, llm_model or settings.LLM_MODEL, use_web, structured,
+                                getattr(self._store(), "version", None))
+
+    @staticmethod
+    def _shared(value, how: str, waited: float, trace: dict) -> Tuple[str, List[Document]]:
+        """(LLM text, retrieved) of a coalesced computation. A request that did not
+        run it records the time it waited as stages["coalesced"], and the stages
+        the shared answer was built without."""
+        llm_text, retrieved, dropped = value
+        if how != LEAD:
+            trace["stages"]["coalesced"] = waited
+            trace["dropped"].update(dropped)
+        return llm_text, retrieved
+
+    def generate(self, patient: dict, question: str, top_k: int = 6, llm_model: str = None, use_web: bool = False, output_path: Optional[str] = None, structured: bool = True, trace: Optional[dict] = None) -> Tuple[str, List[Document]]:
+        """Generate a formal clinical report.
+
+        If `structured` is True, the generator asks the LLM to return JSON with keys:
+        title, meta, executive_summary, background, methods, findings (list), recommendations (list), references (list).
+
+        If `output_path` is provided, the report will be saved to that path (markdown).
+
+        The LLM is called through the shared pooled client, which picks the
+        fastest healthy provider (OpenAI, or Groq when GROQ_API_KEY is set) and
+        falls back to the other (see src.models.llm_client).
+
+        The whole request has REPORT_DEADLINE seconds. Retrieval and web search
+        run concurrently, and web search is dropped when it is not back within
+        WEB_SEARCH_TIMEOUT. If `trace` is a dict it receives "stages" (seconds
+        per finished stage) and "dropped" (stage -> reason).
+
+        Identical requests (same patient, question, top_k, model, use_web and
+        structured) running at the same time, or shortly after one another,
+        share one retrieval and LLM call (see src.utils.single_flight).
+        """
+        end, trace = self._start(trace)
+
+        def compute():
+            entry, llm_text, prompt, retrieved = self._prepare_cached(patient, question, top_k, llm_model, use_web,
+                                                                      structured, end, trace)
+            if llm_text is None:
+                start = time.perf_counter()
+                llm_text = chat(prompt, model=llm_model, temperature=LLM_TEMPERATURE, max_tokens=LLM_MAX_TOKENS,
+                                deadline=self._llm_deadline(end))
+                trace["stages"]["llm"] = time.perf_counter() - start
+                self._remember(entry, llm_text, trace["stages"]["llm"])
+            return llm_text, retrieved, dict(trace["dropped"])
+
+        if self.single_flight is None:
+            llm_text, retrieved, _ = compute()
+        else:
+            key = self._flight_key(patient, question, top_k, llm_model, use_web, structured)
+            start = time.perf_counter()
+            try:
+                value, how = self.single_flight.do(key, compute, timeout=max(0.0, end - time.monotonic()))
+            except CoalesceTimeout as e:
+                raise StageTimeout(str(e))
+            llm_text, retrieved = self._shared(value, how, time.perf_counter() - start, trace)
+        return self._finish(llm_text, structured, output_path), retrieved
+
+    async def agenerate(self, patient: dict, question: str, top_k: int = 6, llm_model: str = None, use_web: bool = False, output_path: Optional[str] = None, structured: bool = True, trace: Optional[dict] = None) -> Tuple[str, List[Document]]:
+        """Same as generate, for async callers: retrieval runs on a worker
+        thread and the LLM call is awaited without holding a thread."""
+        end, trace = self._start(trace)
+
+        async def compute():
+            entry, llm_text, prompt, retrieved = await asyncio.to_thread(
+                self._prepare_cached, patient, question, top_k, llm_model, use_web, structured, end, trace)
+            if llm_text is None:
+                start = time.perf_counter()
+                llm_text = await achat(prompt, model=llm_model, temperature=LLM_TEMPERATURE,
+                                       max_tokens=LLM_MAX_TOKENS, deadline=self._llm_deadline(end))
+                trace["stages"]["llm"] = time.perf_counter() - start
+                await asyncio.to_thread(self._remember, entry, llm_text, trace["stages"]["llm"])
+            return llm_text, retrieved, dict(trace["dropped"])
+
+        if self.single_flight is None:
+            llm_text, retrieved, _ = await compute()
+        else:
+            key = self._flight_key(patient, question, top_k, llm_model, use_web, structured)
+            start = time.perf_counter()
+            try:
+                value, how = await self.single_flight.ado(key, compute, timeout=max(0.0, end - time.monotonic()))
+            except CoalesceTimeout as e:
+                raise StageTimeout(str(e))
+            llm_text, retrieved = self._shared(value, how, time.perf_counter() - start, trace)
+        return self._finish(llm_text, structured, output_path), retrieved
+
+    async def astream(self, patient: dict, question: str, top_k: int = 6, llm_model: str = None, use_web: bool = False, structured: bool = True, trace: Optional[dict] = None) -> AsyncIterator[Tuple[str, object]]:
+        """Report generation as a sequence of (event, data) pairs:
+
+        - ("retrieved", [Document, ...]) as soon as retrieval is done,
+        - ("token", str) for every piece of the LLM answer as it arrives,
+        - ("section", {"key": ..., "markdown": ...}) when `structured` and a
+          top-level field of the JSON answer has closed ("header" for the
+          title/author lines, then the body sections in the order they arrive),
+        - ("done", report) with the same report generate() would return.
+
+        `trace` is filled in as for generate (complete by the "done" event).
+        """
+        end, trace = self._start(trace)
+        entry, cached, prompt, retrieved = await asyncio.to_thread(
+            self._prepare_cached, patient, question, top_k, llm_model, use_web, structured, end, trace)
+        yield "retrieved", retrieved
+        start = time.perf_counter()
+        fields = JSONFieldStream() if structured else None
+        seen = {}
+        header_sent = False
+        pieces = []
+        stream = _replay(cached) if cached is not None else astream(
+            prompt, model=llm_model, temperature=LLM_TEMPERATURE, max_tokens=LLM_MAX_TOKENS,
+            deadline=self._llm_deadline(end))
+        async for piece in stream:
+            pieces.append(piece)
+            yield "token", piece
+            if fields is None:
+                continue
+            for key, value in fields.feed(piece):
+                seen[key] = value
+                body = key in dict(self.SECTIONS)
+                # the header waits for title and meta, or for the first body section
+                if not header_sent and (body or ("title" in seen and "meta" in seen)):
+                    header_sent = True
+                    yield "section", {"key": "header", "markdown": self._render_header(seen)}
+                if body:
+                    section = self._render_section(key, value)
+                    if section is not None:
+                        yield "section", {"key": key, "markdown": section}
+        if seen and not header_sent:
+            yield "section", {"key": "header", "markdown": self._render_header(seen)}
+        llm_text = "".join(pieces)
+        if cached is None:
+            trace["stages"]["llm"] = time.perf_counter() - start
+            await asyncio.to_thread(self._remember, entry, llm_text, trace["stages"]["llm"])
+        yield "done", self._finish(llm_text, structured, None)
+
+
+async def _replay(text: str) -> AsyncIterator[str]:
+    """A cached answer, as a stream of one piece."""
+    yield text
@@ -4,6 +4,21 @@ from pydantic import BaseModel
 class IngestResponse(BaseModel):
     ingested_files: List[str]
     total_chunks: int
+    skipped_files: List[str] = []  # unchanged since the last ingest
+    replaced_files: List[str] = []  # changed; their old chunks were removed
+    removed_chunks: int = 0
+    embedding_cache: Optional[Dict] = None  # hit/miss counters of the embedding cache
+
+class IngestJob(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    files: List[str]
+    progress: Dict[str, int] = {}  # files, pages, chunks_read, embedded, chunks (committed), batches
+    result: Optional[IngestResponse] = None  # once done
+    error: Optional[str] = None  # once failed
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
 
 class PatientInfo(BaseModel):
     name: Optional[str] = None
@@ -16,6 +31,8 @@ class QueryRequest(BaseModel):
     question: str
     top_k: Optional[int] = 6
     llm_model: Optional[str] = None
+    use_web: Optional[bool] = False
+    structured: Optional[bool] = True  # ask for a JSON report and render it as Markdown
 
 class RetrievedChunk(BaseModel):
     content: str
@@ -23,4 +40,6 @@ class RetrievedChunk(BaseModel):
 
 class QueryResponse(BaseModel):
     report: str
-    retrieved: List[RetrievedChunk]
\ No newline at end of file
+    retrieved: List[RetrievedChunk]
+    stages: Dict[str, float] = {}  # seconds taken by each stage that finished
+    dropped_stages: Dict[str, str] = {}  # stages left out of the report (e.g. a slow web search) and why
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Admission control for the report endpoints.
+
+At most `QUERY_MAX_CONCURRENCY` requests run at once (0 = no limit). Beyond
+that up to `QUERY_QUEUE_SIZE` wait, first come first served, each for at most
+`QUERY_QUEUE_TIMEOUT` seconds (or until its own deadline, if sooner). A
+request that finds the queue full, or whose wait runs out, is shed with
+`Overloaded`. The API turns that into a 503 with a Retry-After hint: the
+recent mean service time times the number of requests ahead, divided by the
+concurrency limit.
+
+All state lives on the event loop (no locks). The limits apply per API
+process, so with several uvicorn workers the service admits workers x limit.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Optional
+
+import numpy as np
+
+from src.config import settings
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"server overloaded ({reason}); retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, limit: int = None, queue_size: int = None, queue_timeout: float = None, window: int = 1000):
+        self.limit = settings.QUERY_MAX_CONCURRENCY if limit is None else limit
+        self.queue_size = settings.QUERY_QUEUE_SIZE if queue_size is None else queue_size
+        self.queue_timeout = settings.QUERY_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=window)  # seconds queued, admitted requests
+        self._service: Deque[float] = deque(maxlen=window)  # seconds a slot was held
+        self.admitted = 0
+        self.queued = 0  # admitted after waiting
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        service = float(np.mean(self._service)) if self._service else 1.0
+        ahead = self.depth + 1
+        return int(min(max(math.ceil(service * ahead / max(self.limit, 1)), 1), 120))
+
+    async def acquire(self, deadline: float = None) -> float:
+        """Wait for a slot; seconds spent queued. `deadline` is a time.monotonic()
+        value the request must be admitted by. Raises Overloaded when shed."""
+        if self.limit <= 0 or (self.active < self.limit and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            self._waits.append(0.0)
+            return 0.0
+        if len(self._waiters) >= self.queue_size:
+            self.shed_full += 1
+            raise Overloaded("queue full", self.retry_after())
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        try:
+            # release() hands its slot over by resolving the waiter (active stays the same)
+            await asyncio.wait_for(waiter, max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self.shed_timeout += 1
+            raise Overloaded("queue wait timed out", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot arrived just as the client went away
+            else:
+                self._forget(waiter)
+            raise
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.queued += 1
+        self._waits.append(waited)
+        return waited
+
+    def _forget(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, held: Optional[float] = None):
+        """Give the slot back (to the longest waiting request, if any).
+        `held` is how long it was used, for the Retry-After estimate."""
+        if held is not None:
+            self._service.append(held)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active = max(self.active - 1, 0)
+
+    def stats(self) -> dict:
+        waits = np.fromiter(self._waits, dtype=float) if self._waits else np.zeros(1)
+        service = np.fromiter(self._service, dtype=float) if self._service else np.zeros(1)
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_full,
+            "shed_timeout": self.shed_timeout,
+            "wait_p50": float(np.quantile(waits, 0.5)),
+            "wait_p95": float(np.quantile(waits, 0.95)),
+            "wait_max": float(waits.max()),
+            "service_p50": float(np.quantile(service, 0.5)),
+            "service_p95": float(np.quantile(service, 0.95)),
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1,143 @@
+"""FAISS index construction for the dense (cloud-embedding) path.
+
+`FAISS_INDEX` selects the index type:
+
+- ``flat``: exact IndexFlatL2 (LangChain's default)
+- ``ivf_flat``: inverted lists over `FAISS_NLIST` k-means cells, `FAISS_NPROBE`
+  cells scanned per query
+- ``ivf_pq``: as ivf_flat, but vectors are stored as product-quantised codes
+  of `FAISS_PQ_M` sub-vectors x `FAISS_PQ_NBITS` bits (e.g. 16 x 8 bits = 16
+  bytes per vector instead of 4 * dim)
+- ``hnsw``: HNSW graph with `FAISS_HNSW_M` links per node, `FAISS_EF_SEARCH`
+  candidates explored per query
+
+IVF indexes need a k-means training step. Until the corpus holds enough
+vectors to train on (`min_train_size`), ingest keeps an exact flat index; once
+it grows past that, `maybe_upgrade` trains the configured index on a random
+sample of up to `FAISS_TRAIN_SAMPLE` stored vectors and re-adds everything.
+"""
+from typing import Optional
+
+import numpy as np
+
+from src.config import settings
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def _faiss():
+    import faiss
+    return faiss
+
+
+def index_type(name: str = None) -> str:
+    name = (name or settings.FAISS_INDEX).lower()
+    if name not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS_INDEX {name!r}; expected one of {', '.join(INDEX_TYPES)}")
+    return name
+
+
+def min_train_size(name: str = None) -> int:
+    """Vectors needed before the configured index can be trained."""
+    name = index_type(name)
+    if name in ("flat", "hnsw"):
+        return 0
+    # faiss wants ~39 training points per centroid, for the coarse quantizer's
+    # nlist centroids and, with PQ, for each sub-quantizer's 2**nbits centroids
+    need = 39 * settings.FAISS_NLIST
+    if name == "ivf_pq":
+        need = max(need, 39 * 2 ** settings.FAISS_PQ_NBITS)
+    return need
+
+
+def build_index(dim: int, name: str = None, nlist: int = None, pq_m: int = None, pq_nbits: int = None, hnsw_m: int = None):
+    """Create an empty (untrained) index of the configured type."""
+    faiss = _faiss()
+    name = index_type(name)
+    nlist = nlist or settings.FAISS_NLIST
+    if name == "flat":
+        return faiss.IndexFlatL2(dim)
+    if name == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m or settings.FAISS_HNSW_M)
+        index.hnsw.efConstruction = settings.FAISS_EF_CONSTRUCTION
+        return index
+    quantizer = faiss.IndexFlatL2(dim)
+    if name == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    pq_m = pq_m or settings.FAISS_PQ_M
+    if dim % pq_m:
+        raise ValueError(f"FAISS_PQ_M={pq_m} must divide the embedding dimension {dim}")
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits or settings.FAISS_PQ_NBITS)
+
+
+def train_index(index, vectors: np.ndarray, sample: int = None, seed: int = 0):
+    """Train `index` on a random sample of `vectors` (no-op if not needed)."""
+    if index.is_trained:
+        return
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    sample = sample or settings.FAISS_TRAIN_SAMPLE
+    if len(vectors) > sample:
+        rows = np.random.default_rng(seed).choice(len(vectors), size=sample, replace=False)
+        vectors = vectors[np.sort(rows)]
+    index.train(vectors)
+
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """Apply query-time knobs (nprobe / efSearch) to a built or loaded index."""
+    faiss = _faiss()
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe or settings.FAISS_NPROBE
+    except Exception:
+        pass
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search or settings.FAISS_EF_SEARCH
+    return index
+
+
+def maybe_upgrade(index, name: str = None) -> Optional[object]:
+    """Return a trained index of the configured type holding the vectors of
+    flat `index`, once there are enough of them; None when nothing changes."""
+    faiss = _faiss()
+    name = index_type(name)
+    if name == "flat" or not isinstance(index, faiss.IndexFlat):
+        return None
+    if index.ntotal == 0 or index.ntotal < min_train_size(name):
+        return None
+    vectors = index.reconstruct_n(0, index.ntotal)
+    new = build_index(index.d, name)
+    train_index(new, vectors)
+    new.add(vectors)
+    return configure_search(new)
+
+
+def initial_index(vectors: np.ndarray, name: str = None):
+    """Index for the first ingest batch: the configured type when the batch is
+    big enough to train it, otherwise exact flat until `maybe_upgrade`."""
+    name = index_type(name)
+    dim = vectors.shape[1]
+    if len(vectors) < min_train_size(name):
+        return build_index(dim, "flat")
+    index = build_index(dim, name)
+    train_index(index, vectors)
+    return configure_search(index)
+
+
+def remove_rows(index, rows) -> object:
+    """Copy of `index` without the vectors at positions `rows`, renumbered
+    0..n-1 (the order LangChain's index_to_docstore_id expects). Cloning keeps
+    the IVF training and the PQ/HNSW parameters; vectors are re-added from
+    their stored (for PQ: reconstructed) values."""
+    faiss = _faiss()
+    keep = np.setdiff1d(np.arange(index.ntotal), np.asarray(rows, dtype=np.int64))
+    try:
+        # IVF indexes can only reconstruct through a direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+    except Exception:
+        pass
+    vectors = index.reconstruct_n(0, index.ntotal)[keep] if index.ntotal else np.zeros((0, index.d), np.float32)
+    new = faiss.clone_index(index)
+    new.reset()
+    if len(vectors):
+        new.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return configure_search(new)
@@ -0,0 +1,113 @@
+"""BM25 scoring over the local segments with MaxScore dynamic pruning.
+
+Uses the same segments as the TF-IDF scorer: raw term frequencies and chunk
+lengths come from the compressed postings, corpus statistics (document
+frequencies, chunk count, total tokens) from the hashing embedder.
+
+Query evaluation is term-at-a-time MaxScore. Every query term gets an upper
+bound on its contribution, ``idf * tf_part(max_tf, min_len)`` from per-term
+segment statistics. Terms are processed from the highest bound down. Once the
+bounds of the terms still to come cannot lift an unseen chunk over the current
+k-th best score, those terms become non-essential: they are only looked up for
+existing candidates (decoding just the blocks that can hold them) instead of
+adding new ones, and candidates that cannot reach the threshold are dropped.
+The threshold carries across segments, so later segments prune harder.
+"""
+import heapq
+from typing import List, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.config import settings
+from src.utils.local_store import search_segments_batch, top_k
+
+
+class BM25Scorer:
+    def __init__(self, embedder, k1: float = None, b: float = None):
+        self.embedder = embedder
+        self.k1 = settings.BM25_K1 if k1 is None else k1
+        self.b = settings.BM25_B if b is None else b
+
+    def _tf_part(self, tf: np.ndarray, dl: np.ndarray, avgdl: float) -> np.ndarray:
+        return tf * (self.k1 + 1.0) / (tf + self.k1 * (1.0 - self.b + self.b * dl / avgdl))
+
+    def _stats(self, cols: np.ndarray) -> Tuple[np.ndarray, float]:
+        """IDF of `cols` and the average chunk length, from corpus statistics."""
+        n = max(self.embedder.n_docs, 1)
+        avgdl = max(self.embedder.n_tokens / n, 1.0)
+        df = np.asarray(self.embedder.df[cols], dtype=np.float64)
+        return np.log(1.0 + (n - df + 0.5) / (df + 0.5)), avgdl
+
+    def search_batch(self, segments, query_counts, k: int) -> List[List[Tuple[float, object, int]]]:
+        """Exhaustive BM25 for many queries with one sparse product per segment
+        (no pruning; amortises decoding across the batch instead)."""
+        idf, avgdl = self._stats(np.asarray(query_counts.indices, dtype=np.int64))
+        weights = csr_matrix(
+            (np.asarray(query_counts.data, dtype=np.float64) * idf, query_counts.indices, query_counts.indptr),
+            shape=query_counts.shape,
+        )
+        values = lambda seg, docs, tfs: self._tf_part(tfs, seg.doc_len[docs], avgdl)
+        return search_segments_batch(segments, weights, k, values)
+
+    def search(self, segments, query_counts, k: int) -> List[Tuple[float, object, int]]:
+        """Top-k over `segments`; returns (score, segment, row) best first."""
+        cols = np.asarray(query_counts.indices, dtype=np.int64)
+        if len(cols) == 0 or k <= 0:
+            return []
+        idf, avgdl = self._stats(cols)
+        weights = np.asarray(query_counts.data, dtype=np.float64) * idf
+
+        heap: List[Tuple[float, int, object, int]] = []
+        seq = 0
+        for seg in segments:
+            theta = heap[0][0] if len(heap) == k else 0.0
+            for score, row in self._search_segment(seg, cols, weights, avgdl, k, theta):
+                item = (score, seq, seg, row)
+                seq += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+        return [(score, seg, row) for score, _, seg, row in sorted(heap, key=lambda h: (-h[0], h[1]))]
+
+    def _search_segment(self, seg, cols, weights, avgdl, k, theta) -> List[Tuple[float, int]]:
+        index = seg.postings_index
+        pos = index.find(cols)
+        hit = pos >= 0
+        pos, weights = pos[hit], weights[hit]
+        if len(pos) == 0:
+            return []
+        bounds = weights * self._tf_part(
+            np.asarray(index.max_tf[pos], dtype=np.float64), np.asarray(index.min_len[pos], dtype=np.float64), avgdl
+        )
+        order = np.argsort(-bounds)
+        pos, weights, bounds = pos[order], weights[order], bounds[order]
+        # remaining[i]: best total any chunk can still collect from terms i..end
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+
+        cand = np.zeros(0, dtype=np.int64)
+        acc = np.zeros(0, dtype=np.float64)
+        for i in range(len(pos)):
+            if remaining[i] > theta:
+                # essential term: every chunk in its list may still make the top k
+                docs, tfs, _ = index.decode_terms(pos[i:i + 1])
+                contrib = weights[i] * self._tf_part(tfs, seg.doc_len[docs], avgdl)
+                cand, inv = np.unique(np.concatenate([cand, docs]), return_inverse=True)
+                acc = np.bincount(inv, weights=np.concatenate([acc, contrib]), minlength=len(cand))
+            else:
+                # non-essential: score existing candidates only, skipping blocks without any
+                if len(cand) == 0:
+                    break
+                docs, tfs, _ = index.decode_blocks(index.candidate_blocks(int(pos[i]), cand))
+                if len(docs):
+                    at = np.minimum(np.searchsorted(docs, cand), len(docs) - 1)
+                    found = docs[at] == cand
+                    acc[found] += weights[i] * self._tf_part(tfs[at[found]], seg.doc_len[cand[found]], avgdl)
+            if len(acc) >= k:
+                # partial scores only grow, so the k-th best partial is a safe threshold
+                theta = max(theta, float(np.partition(acc, len(acc) - k)[len(acc) - k]))
+            keep = acc + remaining[i + 1] >= theta
+            cand, acc = cand[keep], acc[keep]
+        best = top_k(acc, k)
+        return [(float(acc[j]), int(cand[j])) for j in best]
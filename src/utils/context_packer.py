@@ -0,0 +1,164 @@
+"""Fit retrieved evidence into a fixed token budget for the report prompt.
+
+`pack_context` splits every retrieved chunk into sentences. Within each chunk
+it ranks them by how many of the question's terms they contain. A sentence
+that nearly repeats one already taken is dropped; overlapping chunks repeat
+a lot. "Nearly" means a word-set Jaccard of at least
+`PROMPT_DEDUP_SIMILARITY`, or the smaller word set lying that much inside
+the other (a sentence cut off at a chunk boundary). Sentences whose
+negation or modality words differ ("not", "never", "should", ...) are never
+duplicates, so contradicting evidence from another source is kept. Sentences are
+then taken greedily, best first, until `PROMPT_CONTEXT_TOKENS` is used up.
+Web evidence lines compete for the same budget as whole lines.
+
+The kept sentences are rendered in their original order under the
+"Source: ..." line of their chunk, so every piece of evidence keeps its
+attribution. A chunk with no sentence kept is left out entirely.
+
+Tokens are counted with tiktoken's encoding for LLM_MODEL when it can be
+loaded, else with a word/punctuation approximation. Counts of individual
+sentences are memoized, since the same chunks come back for many questions.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from src.config import settings
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*[-*•]|\s*\d+[.)]\s)")
+_WORD = re.compile(r"\w+")
+_PIECE = re.compile(r"\w+|[^\w\s]")
+# negation and modality words: sklearn counts them as stop words, but they flip or
+# hedge a clinical statement, so they stay in the dedup terms
+_POLARITY = frozenset({"no", "not", "nor", "never", "none", "neither", "nothing", "nobody", "nowhere", "cannot",
+                       "without", "except", "against", "only", "should", "must", "may", "might", "can", "could",
+                       "would", "rather", "less", "more", "few"})
+_STOP_WORDS = ENGLISH_STOP_WORDS - _POLARITY
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(settings.LLM_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # not installed, or its BPE files cannot be fetched
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # BPE tokenizers split long words, so words count a little over one token
+    pieces = _PIECE.findall(text)
+    return sum(1 + len(p) // 8 for p in pieces)
+
+
+_count = lru_cache(maxsize=65536)(count_tokens)
+
+
+def _terms(text: str) -> frozenset:
+    return frozenset(w for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in _STOP_WORDS)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in (part.strip() for part in _SENTENCE.split(text)) if s]
+
+
+def _near_duplicate(terms: frozenset, kept: List[frozenset], threshold: float) -> bool:
+    """Whether a sentence with `terms` repeats one already kept. Sentences that
+    differ in negation or modality are never duplicates, however much else they share:
+
+    >>> a = _terms("Beta blockers are recommended in patients with heart failure.")
+    >>> b = _terms("Beta blockers are not recommended in patients with heart failure.")
+    >>> _near_duplicate(b, [a], 0.8), _near_duplicate(a, [b], 0.8)
+    (False, False)
+    >>> _near_duplicate(_terms("Beta blockers are recommended in heart failure patients."), [a], 0.8)
+    True
+    """
+    if not terms:
+        return False
+    polarity = terms & _POLARITY
+    for other in kept:
+        if other & _POLARITY != polarity:
+            continue
+        common = len(terms & other)
+        if common / len(terms | other) >= threshold:
+            return True
+        smaller = min(len(terms), len(other))
+        # containment only for sentences long enough that a match is not a coincidence
+        if smaller >= 5 and common / smaller >= threshold:
+            return True
+    return False
+
+
+def _header(doc) -> str:
+    return f"Source: {getattr(doc, 'metadata', {}).get('source','unknown')}\nSnippet:\n"
+
+
+def pack_context(question: str, docs: list, extra_context: str = "", budget: int = None,
+                 dedup_similarity: float = None) -> Tuple[str, str, Dict[str, int]]:
+    """Returns (evidence text, web evidence text, stats). The texts use the same
+    layout as the unpacked prompt; stats has "tokens_before" and "tokens_after"
+    for the evidence, and sentence counts."""
+    budget = settings.PROMPT_CONTEXT_TOKENS if budget is None else budget
+    threshold = settings.PROMPT_DEDUP_SIMILARITY if dedup_similarity is None else dedup_similarity
+    query = _terms(question)
+    web_lines = [line for line in extra_context.splitlines() if line.strip()] if extra_context else []
+
+    # candidates: (score, source rank, position, text, terms); web lines come after the chunks
+    candidates = []
+    before = 0
+    for rank, doc in enumerate(docs):
+        content = getattr(doc, "page_content", "")
+        before += _count(_header(doc)) + _count(content)
+        for pos, sentence in enumerate(split_sentences(content)):
+            terms = _terms(sentence)
+            candidates.append((len(terms & query), rank, pos, sentence, terms))
+    for pos, line in enumerate(web_lines):
+        terms = _terms(line)
+        before += _count(line)
+        candidates.append((len(terms & query), len(docs), pos, line, terms))
+
+    # best first; ties go to the fuller sentence (so a cut-off copy is the one dropped),
+    # then to the higher ranked source and the earlier sentence
+    candidates.sort(key=lambda c: (-c[0], -len(c[4]), c[1], c[2]))
+    used = 0
+    kept_terms: List[frozenset] = []
+    chosen: Dict[int, List[Tuple[int, str]]] = {}
+    seen = set()
+    duplicates = 0
+    for score, rank, pos, text, terms in candidates:
+        normalized = " ".join(text.lower().split())
+        if normalized in seen or _near_duplicate(terms, kept_terms, threshold):
+            duplicates += 1
+            continue
+        cost = _count(text) + 1
+        if rank not in chosen and rank < len(docs):
+            cost += _count(_header(docs[rank]))
+        if used + cost > budget:
+            continue
+        used += cost
+        seen.add(normalized)
+        kept_terms.append(terms)
+        chosen.setdefault(rank, []).append((pos, text))
+
+    blocks = []
+    for rank, doc in enumerate(docs):
+        if rank in chosen:
+            blocks.append(_header(doc) + " ".join(text for _, text in sorted(chosen[rank])))
+    web = "\n".join(text for _, text in sorted(chosen.get(len(docs), [])))
+    stats = {
+        "tokens_before": before,
+        "tokens_after": used,
+        "sentences": len(candidates),
+        "sentences_kept": sum(len(v) for v in chosen.values()),
+        "duplicates_dropped": duplicates,
+    }
+    return "\n\n".join(blocks), web, stats
@@ -0,0 +1,192 @@
+"""Persistent cache of cloud embeddings, keyed by (model, sha256(text)).
+
+Backed by a single SQLite file (`EMBEDDING_CACHE_PATH`; empty disables the
+cache). Vectors are stored as raw float32 or float16 blobs
+(`EMBEDDING_CACHE_DTYPE`; float16 halves the size at ~1e-3 relative error).
+Every hit refreshes the entry's LRU stamp; once the blobs exceed
+`EMBEDDING_CACHE_MAX_MB`, the least recently used entries are evicted.
+
+`CachedEmbeddings` wraps a LangChain embeddings object so that only texts
+the cache has not seen are sent to the provider. `stats()` reports hits,
+misses and an estimate of the provider time the hits saved.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    vec BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (model, sha)
+);
+CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used);
+"""
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_mb: float = None, dtype: str = None):
+        self.path = path
+        self.max_bytes = int((settings.EMBEDDING_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_CACHE_DTYPE)
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"EMBEDDING_CACHE_DTYPE must be float32 or float16, not {self.dtype}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # provider time per embedded text, to estimate what hits save
+        self.provider_seconds = 0.0
+        self.provider_texts = 0
+        self.evictions = 0
+        self._bytes = int(self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0])
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        shas = [text_sha256(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(shas), 500):
+                part = list(dict.fromkeys(shas[i:i + 500]))
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT sha, dtype, vec FROM embeddings WHERE model = ? AND sha IN ({marks})", [model, *part]
+                ).fetchall()
+                for sha, dtype, blob in rows:
+                    found[sha] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+            if found:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND sha = ?",
+                    [(now, model, sha) for sha in found],
+                )
+                self._conn.commit()
+            out = [found.get(sha) for sha in shas]
+            hits = sum(v is not None for v in out)
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        now = time.time_ns()
+        rows = [
+            (model, text_sha256(t), self.dtype.name, np.asarray(v, dtype=self.dtype).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, sha, dtype, vec, last_used) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._bytes += sum(len(r[3]) for r in rows)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries down to 90% of the budget (caller holds the lock)."""
+        self._bytes = int(self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0])
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            drop = []
+            for rowid, size in rows:
+                if self._bytes <= target:
+                    break
+                drop.append((rowid,))
+                self._bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", drop)
+            self.evictions += len(drop)
+        self._conn.commit()
+
+    def record_provider_time(self, seconds: float, n_texts: int):
+        with self._lock:
+            self.provider_seconds += seconds
+            self.provider_texts += n_texts
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = int(self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0])
+            lookups = self.hits + self.misses
+            per_text = self.provider_seconds / self.provider_texts if self.provider_texts else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "provider_seconds": self.provider_seconds,
+                "estimated_saved_seconds": self.hits * per_text,
+            }
+
+
+class CachedEmbeddings:
+    """LangChain-style embeddings (embed_documents / embed_query) backed by
+    an EmbeddingCache. Documents go through the cache; queries are passed
+    straight to the provider."""
+
+    def __init__(self, inner, model: str, cache: EmbeddingCache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model, texts)
+        # embed each distinct missing text once
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            start = time.perf_counter()
+            fresh = self.inner.embed_documents(missing)
+            self.cache.record_provider_time(time.perf_counter() - start, len(missing))
+            self.cache.put_many(self.model, missing, fresh)
+            by_text = {t: np.asarray(v, dtype=np.float32) for t, v in zip(missing, fresh)}
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+
+_CACHES: Dict[str, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def default_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache at EMBEDDING_CACHE_PATH, or None when disabled."""
+    path = settings.EMBEDDING_CACHE_PATH
+    if not path:
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = _CACHES[path] = EmbeddingCache(path)
+        return cache
+
+
+def with_cache(inner, model: str):
+    """`inner` wrapped in the default cache (unchanged if caching is off)."""
+    cache = default_cache()
+    return CachedEmbeddings(inner, model, cache) if cache is not None else inner
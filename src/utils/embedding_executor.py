@@ -0,0 +1,176 @@
+"""Concurrent, rate-limited embedding requests for OpenAI-compatible APIs.
+
+`EmbeddingExecutor.embed_documents` splits the texts into request batches
+(at most `EMBED_BATCH_SIZE` inputs and about `EMBED_MAX_BATCH_TOKENS` tokens
+each) and sends up to `EMBED_CONCURRENCY` of them at once. Every request
+first takes its share of a request-per-minute and token-per-minute budget
+(`EMBED_RPM`, `EMBED_TPM`) from a shared `RateLimiter`. Responses with 429
+or 5xx, and connection errors, are retried with jittered exponential
+backoff, honouring Retry-After. Output order always matches input order.
+
+The endpoint is `<OPENAI_BASE_URL>/embeddings`, so the executor can be
+pointed at a local stand-in server (see src.eval.standin_server).
+
+`shared_executor` hands out one executor (and so one thread pool, session and
+rate budget) per endpoint and model for the whole process; EmbeddingClient
+uses it, so the budget holds across every VectorStore and store reload.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import requests
+
+from src.config import settings
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-ish estimate (~4 characters per token) for budgeting."""
+    return max(1, len(text) // 4 + 1)
+
+
+class RateLimiter:
+    """Two token buckets (requests and tokens per minute), refilled continuously.
+    They start full unless `full=False`, i.e. a minute's budget may go out at once."""
+
+    def __init__(self, rpm: float, tpm: float, full: bool = True):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self._requests = self.rpm if full else 0.0
+        self._tokens = self.tpm if full else 0.0
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens: int):
+        # a single request larger than the whole bucket waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        with self._cond:
+            while True:
+                self._refill()
+                if self._requests >= 1.0 and self._tokens >= tokens:
+                    self._requests -= 1.0
+                    self._tokens -= tokens
+                    return
+                wait = max((1.0 - self._requests) * 60.0 / self.rpm, (tokens - self._tokens) * 60.0 / self.tpm, 0.001)
+                self._cond.wait(wait)
+
+
+_LIMITERS = {}
+_EXECUTORS = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_limiter(url: str, model: str) -> RateLimiter:
+    """The process-wide EMBED_RPM/EMBED_TPM budget for `model` at `url`."""
+    with _SHARED_LOCK:
+        limiter = _LIMITERS.get((url, model))
+        if limiter is None:
+            limiter = _LIMITERS[(url, model)] = RateLimiter(settings.EMBED_RPM, settings.EMBED_TPM)
+        return limiter
+
+
+def shared_executor(model: str = None, base_url: str = None) -> "EmbeddingExecutor":
+    """The process-wide executor for `model` at `base_url` (defaults from settings)."""
+    model = model or settings.EMBEDDING_MODEL
+    url = (base_url or settings.OPENAI_BASE_URL).rstrip("/") + "/embeddings"
+    limiter = shared_limiter(url, model)
+    with _SHARED_LOCK:
+        executor = _EXECUTORS.get((url, model))
+        if executor is None:
+            executor = _EXECUTORS[(url, model)] = EmbeddingExecutor(model=model, base_url=base_url, limiter=limiter)
+        return executor
+
+
+class EmbeddingExecutor:
+    """Drop-in for LangChain's OpenAIEmbeddings (embed_documents / embed_query)."""
+
+    def __init__(self, model: str = None, api_key: str = None, base_url: str = None, concurrency: int = None,
+                 batch_size: int = None, max_batch_tokens: int = None, rpm: float = None, tpm: float = None,
+                 max_retries: int = None, timeout: float = None, limiter: Optional[RateLimiter] = None):
+        self.model = model or settings.EMBEDDING_MODEL
+        self.api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
+        self.url = (base_url or settings.OPENAI_BASE_URL).rstrip("/") + "/embeddings"
+        self.concurrency = max(concurrency or settings.EMBED_CONCURRENCY, 1)
+        self.batch_size = max(batch_size or settings.EMBED_BATCH_SIZE, 1)
+        self.max_batch_tokens = max_batch_tokens or settings.EMBED_MAX_BATCH_TOKENS
+        self.max_retries = settings.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or settings.EMBED_TIMEOUT
+        self.limiter = limiter or RateLimiter(rpm or settings.EMBED_RPM, tpm or settings.EMBED_TPM)
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        self.retries = 0
+        self.requests = 0
+
+    def _batches(self, texts: Sequence[str]) -> List[List[int]]:
+        batches, current, tokens = [], [], 0
+        for i, text in enumerate(texts):
+            n = estimate_tokens(text)
+            if current and (len(current) >= self.batch_size or tokens + n > self.max_batch_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    def _post(self, inputs: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in inputs)
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = {"model": self.model, "input": inputs}
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            retry_after = None
+            try:
+                r = self._session.post(self.url, json=payload, headers=headers, timeout=self.timeout)
+                self.requests += 1
+            except requests.RequestException as e:
+                last_error = e
+            else:
+                if r.status_code == 200:
+                    data = sorted(r.json()["data"], key=lambda d: d.get("index", 0))
+                    return [d["embedding"] for d in data]
+                if r.status_code not in RETRY_STATUS:
+                    raise RuntimeError(f"Embedding request failed: {r.status_code} {r.text[:200]}")
+                last_error = RuntimeError(f"Embedding request failed: {r.status_code} {r.text[:200]}")
+                try:
+                    retry_after = float(r.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    retry_after = None
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            # full jitter: spread retries of concurrent batches apart
+            backoff = random.uniform(0, min(settings.EMBED_BACKOFF_MAX, settings.EMBED_BACKOFF_BASE * 2 ** attempt))
+            time.sleep(max(backoff, retry_after or 0.0))
+        raise RuntimeError(f"Embedding request failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = self._batches(texts)
+        futures = [self._pool.submit(self._post, [texts[i] for i in batch]) for batch in batches]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, fut in zip(batches, futures):
+            for i, vec in zip(batch, fut.result()):
+                out[i] = vec
+        return out
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._post([text])[0]
@@ -1,40 +1,142 @@
+import json
+import os
 from typing import List
 from src.config import settings
+from src.utils.embedding_cache import default_cache, with_cache
+from src.utils.embedding_executor import shared_executor
 
 try:
-    # Prefer using LangChain wrappers when a cloud key is configured
-    from langchain.embeddings import OpenAIEmbeddings, HuggingFaceEmbeddings
+    # LangChain wrapper for local sentence-transformers models
+    from langchain.embeddings import HuggingFaceEmbeddings
 except Exception:
-    OpenAIEmbeddings = None
     HuggingFaceEmbeddings = None
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
 import numpy as np
 
 
+class HashingEmbedder:
+    """Streaming local TF-IDF embedder.
+
+    Terms are mapped to a fixed feature space with feature hashing, so there is
+    no vocabulary to refit and vectors from earlier batches stay valid. Document
+    frequencies are accumulated online as batches arrive.
+
+    Documents are stored as L2-normalised term-frequency rows (independent of
+    corpus statistics); IDF is applied on the query side only, using the
+    statistics of every chunk ingested so far:
+
+        score(q, d) = sum_t idf(t) * q_tfidf(t) * d_tf(t)
+    """
+    def __init__(self, n_features: int = None):
+        self.n_features = int(n_features or settings.LOCAL_HASH_FEATURES)
+        self._hasher = HashingVectorizer(n_features=self.n_features, alternate_sign=False, norm=None, dtype=np.float32)
+        self.df = np.zeros(self.n_features, dtype=np.int32)
+        self.n_docs = 0
+        self.n_tokens = 0
+
+    def counts(self, texts: List[str]):
+        """Raw hashed term counts, one CSR row per text."""
+        mat = self._hasher.transform(texts)
+        mat.sum_duplicates()
+        return mat
+
+    def partial_fit(self, counts):
+        """Update corpus statistics with a batch of raw count rows (see counts)."""
+        # each row holds a term at most once, so every index is one document hit
+        np.add.at(self.df, counts.indices, 1)
+        self.n_docs += counts.shape[0]
+        self.n_tokens += int(counts.sum())
+
+    def partial_unfit(self, counts):
+        """Take rows previously passed to partial_fit back out (deleted chunks)."""
+        np.subtract.at(self.df, counts.indices, 1)
+        self.n_docs = max(self.n_docs - counts.shape[0], 0)
+        self.n_tokens = max(self.n_tokens - int(counts.sum()), 0)
+
+    def partial_fit_transform(self, texts: List[str]):
+        """Update document frequencies with `texts` and return their vectors."""
+        mat = self.counts(texts)
+        self.partial_fit(mat)
+        return normalize(mat, norm="l2", copy=True)
+
+    def idf(self, cols: np.ndarray) -> np.ndarray:
+        """Smoothed IDF (same formula as sklearn) for the given feature columns."""
+        df = np.asarray(self.df[cols], dtype=np.float32)
+        return np.log((1.0 + self.n_docs) / (1.0 + df)) + 1.0
+
+    def transform_query(self, text: str):
+        return self.transform_queries([text])
+
+    def transform_queries(self, texts: List[str]):
+        """Query vectors (one row per text) weighted by the current IDF."""
+        mat = self.counts(texts)
+        idf = self.idf(mat.indices)
+        mat.data *= idf
+        mat = normalize(mat, norm="l2", copy=False)
+        mat.data *= idf
+        return mat
+
+    def save(self, path: str):
+        if isinstance(self.df, np.memmap):
+            # updated in place by partial_fit_transform; only dirty pages are written
+            self.df.flush()
+        else:
+            np.save(os.path.join(path, "df.tmp.npy"), self.df)
+            os.replace(os.path.join(path, "df.tmp.npy"), os.path.join(path, "df.npy"))
+            self.df = np.load(os.path.join(path, "df.npy"), mmap_mode="r+")
+        with open(os.path.join(path, "embedder.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"type": "hashing", "n_features": self.n_features, "n_docs": self.n_docs, "n_tokens": self.n_tokens}, f)
+        os.replace(os.path.join(path, "embedder.json.tmp"), os.path.join(path, "embedder.json"))
+
+    def load(self, path: str, read_only: bool = False) -> bool:
+        """Restore saved statistics. The DF array is memory-mapped for in-place
+        updates, or with `read_only` copied into memory, so later writes to the
+        file by an ingest don't show through."""
+        meta_path = os.path.join(path, "embedder.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if int(meta["n_features"]) != self.n_features:
+            raise ValueError(
+                f"Local store was built with {meta['n_features']} hash features, LOCAL_HASH_FEATURES is {self.n_features}"
+            )
+        self.df = np.load(os.path.join(path, "df.npy"), mmap_mode=None if read_only else "r+")
+        self.n_docs = int(meta["n_docs"])
+        self.n_tokens = int(meta.get("n_tokens", 0))
+        return True
+
+
 class EmbeddingClient:
     """Flexible embedding client.
 
-    - If settings.EMBEDDING_PROVIDER == 'openai' and OpenAIEmbeddings is
-      available, uses that (requires OPENAI_API_KEY).
+    - If settings.EMBEDDING_PROVIDER == 'openai' and OPENAI_API_KEY is set,
+      sends concurrent, rate-limited requests to OPENAI_BASE_URL (see
+      src.utils.embedding_executor).
     - Else if provider == 'hf' and HuggingFaceEmbeddings available, uses that.
-    - Otherwise falls back to a local TF-IDF embedder (fast, demo-only).
+    - Cloud document embeddings go through the persistent embedding cache
+      (see src.utils.embedding_cache).
+    - Otherwise falls back to a local hashed TF-IDF embedder (fast, demo-only)
+      that can be appended to without refitting (see HashingEmbedder).
     """
     def __init__(self):
         provider = settings.EMBEDDING_PROVIDER.lower()
         self.provider = "local"
-        self._vectorizer = None
+        # always available: the lexical retrievers use it even with a cloud provider
+        self.local_embedder = HashingEmbedder()
         # try cloud providers when requested and available
-        if provider == "openai" and OpenAIEmbeddings is not None:
+        if provider == "openai" and settings.OPENAI_API_KEY:
             try:
-                self._client = OpenAIEmbeddings(model=settings.EMBEDDING_MODEL)
+                self._client = with_cache(shared_executor(settings.EMBEDDING_MODEL), f"openai:{settings.EMBEDDING_MODEL}")
                 self.provider = "openai"
                 return
             except Exception:
                 self._client = None
         if provider == "hf" and HuggingFaceEmbeddings is not None:
             try:
-                self._client = HuggingFaceEmbeddings(model_name=settings.HF_EMBEDDING_MODEL)
+                self._client = with_cache(HuggingFaceEmbeddings(model_name=settings.HF_EMBEDDING_MODEL), f"hf:{settings.HF_EMBEDDING_MODEL}")
                 self.provider = "hf"
                 return
             except Exception:
@@ -47,15 +149,23 @@ class EmbeddingClient:
     def embed_documents(self, texts: List[str]):
         if self.provider in ("openai", "hf") and self._client is not None:
             return self._client.embed_documents(texts)
-        # local tf-idf dense vectors
-        self._vectorizer = TfidfVectorizer().fit(texts)
-        mat = self._vectorizer.transform(texts)
-        return mat
+        # local hashed tf vectors (sparse); document frequencies are updated in place
+        return self.local_embedder.partial_fit_transform(texts)
 
     def embed_query(self, text: str):
         if self.provider in ("openai", "hf") and self._client is not None:
             return self._client.embed_query(text)
-        if self._vectorizer is None:
-            # client must be fit on documents first
-            raise RuntimeError("Local embedder not fit; call embed_documents first")
-        return self._vectorizer.transform([text])
+        return self.local_embedder.transform_query(text)
+
+    def cache_stats(self):
+        """Hit/miss counters of the persistent embedding cache (None when disabled)."""
+        cache = default_cache()
+        return cache.stats() if cache is not None else None
+
+    def save_local(self, path: str):
+        """Persist the local embedder's document-frequency statistics under `path`."""
+        self.local_embedder.save(path)
+
+    def load_local(self, path: str, read_only: bool = False):
+        """Restore statistics written by save_local."""
+        self.local_embedder.load(path, read_only=read_only)
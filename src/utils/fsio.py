@@ -0,0 +1,44 @@
+"""Small file-system helpers shared by the stores."""
+import json
+import os
+from contextlib import contextmanager
+
+
+def write_json(path: str, obj):
+    """Write `obj` as JSON to `path` atomically (temp file + os.replace), so
+    readers see either the old or the new file, never a partial one."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive, cross-process lock on `path` (created if missing)
+    until the block exits; blocks until it is free. The lock goes with the
+    process, so a crashed holder never leaves it stuck."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
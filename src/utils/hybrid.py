@@ -0,0 +1,147 @@
+"""Hybrid retrieval: run several retrievers ("legs") in parallel and fuse them.
+
+Each leg is queried on a shared thread pool (one per leg name, so
+`HYBRID_WORKERS` threads each) with its own deadline. A leg that
+errors or misses its deadline is left out of the fusion, so the result
+degrades to whatever the other legs returned instead of failing or waiting.
+
+A timed-out leg keeps its thread until the search returns. Since the pools
+are per leg, a hanging dense backend never takes the threads the lexical leg
+needs; and the abandoned calls are counted, so once every thread of a leg is
+stuck that leg is skipped at once ("busy") instead of queueing new calls
+behind them.
+Fusion is reciprocal-rank fusion (RRF, the default) or a weighted sum of
+min-max normalised scores.
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Tuple
+
+from langchain.schema import Document
+
+from src.config import settings
+
+_POOLS: Dict[str, ThreadPoolExecutor] = {}
+_POOL_LOCK = threading.Lock()
+# leg name -> calls that missed their deadline and still hold a pool thread
+_ABANDONED: Dict[str, int] = {}
+_ABANDONED_LOCK = threading.Lock()
+
+
+def _pool(name: str) -> ThreadPoolExecutor:
+    with _POOL_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            pool = _POOLS[name] = ThreadPoolExecutor(max_workers=settings.HYBRID_WORKERS,
+                                                     thread_name_prefix=f"hybrid-{name}")
+        return pool
+
+
+def _abandon(leg: "Leg", fut):
+    """Count a timed-out call against `leg` until it returns."""
+    if fut.cancel():
+        # never started, so it holds no thread
+        return
+    with _ABANDONED_LOCK:
+        _ABANDONED[leg.name] = _ABANDONED.get(leg.name, 0) + 1
+
+    def release(_):
+        with _ABANDONED_LOCK:
+            _ABANDONED[leg.name] -= 1
+
+    # runs at once if the call finished in the meantime
+    fut.add_done_callback(release)
+
+
+def abandoned() -> Dict[str, int]:
+    """Timed-out leg calls still holding a pool thread, by leg name."""
+    with _ABANDONED_LOCK:
+        return dict(_ABANDONED)
+
+
+def doc_key(doc: Document) -> str:
+    """Identity of a chunk across legs (same text + metadata = same chunk)."""
+    raw = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Leg:
+    """One retriever taking part in the fusion.
+
+    `search(query, k)` returns (Document, score) pairs, best first. Set
+    `distance=True` when a lower score is better (e.g. FAISS L2 distances).
+    """
+    def __init__(self, name: str, search: Callable[[str, int], List[Tuple[Document, float]]],
+                 timeout: float, weight: float = 1.0, distance: bool = False):
+        self.name = name
+        self.search = search
+        self.timeout = timeout
+        self.weight = weight
+        self.distance = distance
+
+
+class HybridRetriever:
+    def __init__(self, legs: List[Leg], fusion: str = None, rrf_k: int = None, depth: int = None):
+        self.legs = legs
+        self.fusion = (fusion or settings.HYBRID_FUSION).lower()
+        self.rrf_k = settings.HYBRID_RRF_K if rrf_k is None else rrf_k
+        self.depth = settings.HYBRID_DEPTH if depth is None else depth
+        # per leg: answered / timed out / failed / skipped for lack of threads, for monitoring degraded answers
+        self.stats: Dict[str, Dict[str, int]] = {leg.name: {"ok": 0, "timeout": 0, "error": 0, "busy": 0}
+                                                 for leg in legs}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, leg: Leg, outcome: str):
+        with self._stats_lock:
+            self.stats[leg.name][outcome] += 1
+
+    def similarity_search_with_scores(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        return self.search(query, k)[0]
+
+    def search(self, query: str, k: int = 5) -> Tuple[List[Tuple[Document, float]], bool]:
+        """Fused hits plus whether every leg answered (False = degraded result)."""
+        depth = max(k, self.depth)
+        started = time.monotonic()
+        with _ABANDONED_LOCK:
+            busy = {leg.name for leg in self.legs if _ABANDONED.get(leg.name, 0) >= settings.HYBRID_WORKERS}
+        futures = [(leg, None if leg.name in busy else _pool(leg.name).submit(leg.search, query, depth))
+                   for leg in self.legs]
+        ranked: List[Tuple[Leg, List[Tuple[Document, float]]]] = []
+        for leg, fut in futures:
+            if fut is None:
+                self._count(leg, "busy")
+                continue
+            # every leg's deadline is measured from the common start
+            remaining = max(leg.timeout - (time.monotonic() - started), 0.0)
+            try:
+                ranked.append((leg, fut.result(timeout=remaining)))
+                self._count(leg, "ok")
+            except FutureTimeout:
+                # the thread finishes in the background; its result is discarded
+                _abandon(leg, fut)
+                self._count(leg, "timeout")
+            except Exception:
+                self._count(leg, "error")
+        return self._fuse(ranked, k), len(ranked) == len(self.legs)
+
+    def _fuse(self, ranked, k: int) -> List[Tuple[Document, float]]:
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for leg, hits in ranked:
+            if not hits:
+                continue
+            if self.fusion == "weighted":
+                raw = [(-s if leg.distance else s) for _, s in hits]
+                lo, hi = min(raw), max(raw)
+                contrib = [((r - lo) / (hi - lo) if hi > lo else 1.0) for r in raw]
+            else:
+                contrib = [1.0 / (self.rrf_k + rank) for rank in range(1, len(hits) + 1)]
+            for (doc, _), c in zip(hits, contrib):
+                key = doc_key(doc)
+                docs.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + leg.weight * c
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(docs[key], score) for key, score in best]
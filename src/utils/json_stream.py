@@ -0,0 +1,111 @@
+"""Incremental parsing of a JSON object that arrives in pieces (LLM tokens).
+
+`JSONFieldStream.feed(text)` returns the top-level fields that `text`
+completed, as (key, value) pairs, without waiting for the rest of the
+object. Anything before the first "{" (e.g. a markdown code fence) is
+skipped, like the final parse in ReportGenerator does. A field whose value
+is not valid JSON is skipped; the caller still parses the full text at the
+end.
+"""
+import json
+from typing import Any, List, Tuple
+
+_START, _KEY, _COLON, _VALUE, _AFTER, _DONE = range(6)
+
+
+class JSONFieldStream:
+    def __init__(self):
+        self._state = _START
+        self._buf: List[str] = []  # current key or value text
+        self._key = None
+        self._in_string = False
+        self._escape = False
+        self._level = 0  # nesting inside the current value
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def _emit(self, out: List[Tuple[str, Any]]):
+        raw = "".join(self._buf).strip()
+        self._buf = []
+        try:
+            out.append((self._key, json.loads(raw)))
+        except ValueError:
+            pass
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        for c in text:
+            state = self._state
+            if state == _DONE:
+                break
+            if state == _START:
+                if c == "{":
+                    self._state = _KEY
+            elif state == _KEY:
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                        try:
+                            self._key = json.loads('"' + "".join(self._buf) + '"')
+                        except ValueError:
+                            self._key = "".join(self._buf)
+                        self._buf = []
+                        self._state = _COLON
+                        continue
+                    self._buf.append(c)
+                elif c == '"':
+                    self._in_string = True
+                elif c == "}":
+                    self._state = _DONE
+            elif state == _COLON:
+                if c == ":":
+                    self._state = _VALUE
+            elif state == _VALUE:
+                if self._in_string:
+                    self._buf.append(c)
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                        if self._level == 0:
+                            # a top-level string value is complete at its closing quote
+                            self._emit(out)
+                            self._state = _AFTER
+                elif c == '"':
+                    self._in_string = True
+                    self._buf.append(c)
+                elif c in "{[":
+                    self._level += 1
+                    self._buf.append(c)
+                elif c in "}]":
+                    if self._level == 0:
+                        # end of the whole object right after a number/true/false/null
+                        if c == "}":
+                            if "".join(self._buf).strip():
+                                self._emit(out)
+                            self._state = _DONE
+                        continue
+                    self._level -= 1
+                    self._buf.append(c)
+                    if self._level == 0:
+                        self._emit(out)
+                        self._state = _AFTER
+                elif c == "," and self._level == 0:
+                    self._emit(out)
+                    self._state = _KEY
+                else:
+                    self._buf.append(c)
+            elif state == _AFTER:
+                if c == ",":
+                    self._state = _KEY
+                elif c == "}":
+                    self._state = _DONE
+        return out
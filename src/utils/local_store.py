@@ -0,0 +1,522 @@
+"""On-disk storage for the local (TF-IDF) vector store.
+
+The store is a list of immutable segments (LSM style). Every `add` writes the
+new chunks as a fresh segment, so ingest cost is proportional to the batch,
+and a background compactor merges runs of similarly sized segments into larger
+ones (size-tiered: `LOCAL_COMPACTION_FANOUT` adjacent segments of the same
+tier become one segment of the next tier, up to `LOCAL_MAX_SEGMENT_DOCS`
+chunks per segment).
+
+Everything lives under ``<VECTORSTORE_PATH>/local``:
+
+- ``segments.json``: the live segment list; replacing it is the commit point
+  for both ingests and compactions
+- ``seg_<id>/``: one segment
+  - ``data.npy``, ``indices.npy``, ``indptr.npy``: CSR arrays of the raw
+    hashed term counts of its chunks
+  - ``doc_len.npy``, ``doc_norm.npy``: per chunk token count and L2 norm
+  - ``post_*.npy``: block-compressed inverted index (see src.utils.postings),
+    so a query only decodes the postings of its own terms
+  - ``docs.bin`` + ``doc_offsets.npy``: chunk texts and metadata, one JSON
+    object per chunk, addressed by byte offset
+  - ``meta.json``: matrix shape and chunk count
+  - ``sources.json``: rows per source file path
+  - ``deleted_<n>.npy``: optional mask of deleted rows; the live one is named
+    in ``segments.json``, so deleting is a commit like any other
+- ``df.npy`` + ``embedder.json``: document-frequency statistics of the local
+  hashing embedder (see HashingEmbedder)
+
+Arrays are reopened with ``np.load(mmap_mode="r")`` (numpy.memmap), so loading
+an existing store only maps the files; pages are read lazily by the OS and
+documents are decoded only when they are returned from a search.
+"""
+import heapq
+import json
+import os
+import shutil
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from langchain.schema import Document
+
+from src.config import settings
+from src.utils.fsio import write_json
+from src.utils.postings import ARRAY_NAMES, CompressedPostings, encode_postings
+
+# bump when the on-disk segment layout changes; older stores are not loaded
+FORMAT_VERSION = 2
+
+LOAD_RETRIES = 5
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first, via partial selection."""
+    if k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def search_segments_batch(segments, queries: csr_matrix, k: int, values=None) -> List[List[Tuple[float, "Segment", int]]]:
+    """Score every row of `queries` against `segments`; per query, (score, segment, row) best first.
+
+    `values(segment, docs, tfs)` turns raw postings into per-posting weights
+    (default: the normalised tf used by the TF-IDF scorer).
+    """
+    merged = [[] for _ in range(queries.shape[0])]
+    for seg in segments:
+        for i, hits in enumerate(seg.search_batch(queries, k, values)):
+            merged[i].extend((score, seg, row) for score, row in hits)
+    return [heapq.nlargest(k, hits, key=lambda h: h[0]) for hits in merged]
+
+
+class Segment:
+    """One immutable, memory-mapped slice of the local store."""
+
+    def __init__(self, path: str, deleted_file: str = None):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs = int(meta["n_docs"])
+        # deletions never touch the segment files; a bool mask per row marks them
+        self.deleted_file = deleted_file
+        self.deleted = np.load(self._file(deleted_file), mmap_mode="r") if deleted_file else None
+        self.n_live = self.n_docs - (int(np.count_nonzero(self.deleted)) if self.deleted is not None else 0)
+        self._sources = None
+        data = np.load(self._file("data.npy"), mmap_mode="r")
+        indices = np.load(self._file("indices.npy"), mmap_mode="r")
+        indptr = np.load(self._file("indptr.npy"), mmap_mode="r")
+        # copy=False keeps the memmaps as the backing buffers of the matrix
+        self.matrix = csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+        self._offsets = np.load(self._file("doc_offsets.npy"), mmap_mode="r")
+        self._blob = np.memmap(self._file("docs.bin"), dtype=np.uint8, mode="r")
+        self.doc_len = np.load(self._file("doc_len.npy"), mmap_mode="r")
+        self.doc_norm = np.load(self._file("doc_norm.npy"), mmap_mode="r")
+        self.postings_index = CompressedPostings(
+            {name: np.load(self._file(f"post_{name}.npy"), mmap_mode="r") for name in ARRAY_NAMES},
+            deleted=self.deleted,
+        )
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def tier(self) -> int:
+        # integer steps: math.log(1000, 10) is 2.9999999999999996, which would put
+        # a full segment one tier too low
+        fanout = max(settings.LOCAL_COMPACTION_FANOUT, 2)
+        n, tier = max(self.n_docs, 1), 0
+        while n >= fanout:
+            n //= fanout
+            tier += 1
+        return tier
+
+    @staticmethod
+    def write(path: str, mat: csr_matrix, payload: List[bytes]) -> "Segment":
+        """Write a segment from a raw term-count matrix and pre-serialised documents."""
+        os.makedirs(path, exist_ok=True)
+        lengths = np.fromiter((len(p) for p in payload), dtype=np.int64, count=len(payload))
+        offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths)])
+        with open(os.path.join(path, "docs.bin"), "wb") as f:
+            for p in payload:
+                f.write(p)
+        doc_len = np.asarray(mat.sum(axis=1), dtype=np.float32).ravel()
+        doc_norm = np.sqrt(np.asarray(mat.multiply(mat).sum(axis=1), dtype=np.float32).ravel())
+        arrays = [
+            ("data", mat.data), ("indices", mat.indices), ("indptr", mat.indptr), ("doc_offsets", offsets),
+            ("doc_len", doc_len), ("doc_norm", np.maximum(doc_norm, 1e-12)),
+        ]
+        arrays += [(f"post_{name}", arr) for name, arr in encode_postings(mat, doc_len).items()]
+        for name, arr in arrays:
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(arr))
+        # rows per source file, so re-ingesting a file can find its old chunks
+        sources = {}
+        for i, p in enumerate(payload):
+            src = json.loads(p.decode("utf-8")).get("metadata", {}).get("path")
+            if src is not None:
+                sources.setdefault(str(src), []).append(i)
+        write_json(os.path.join(path, "sources.json"), sources)
+        write_json(os.path.join(path, "meta.json"), {"n_docs": mat.shape[0], "shape": list(mat.shape)})
+        return Segment(path)
+
+    def live_rows(self) -> np.ndarray:
+        if self.deleted is None:
+            return np.arange(self.n_docs)
+        return np.flatnonzero(~np.asarray(self.deleted))
+
+    def raw_documents(self, rows: np.ndarray = None) -> List[bytes]:
+        rows = range(self.n_docs) if rows is None else rows
+        return [bytes(self._blob[int(self._offsets[i]):int(self._offsets[i + 1])]) for i in rows]
+
+    def rows_for(self, paths) -> np.ndarray:
+        """Live rows whose chunk came from one of `paths` (metadata "path")."""
+        if self._sources is None:
+            try:
+                with open(self._file("sources.json"), "r", encoding="utf-8") as f:
+                    self._sources = json.load(f)
+            except FileNotFoundError:
+                # written before sources.json existed: derive it from the documents
+                sources = {}
+                for i, p in enumerate(self.raw_documents()):
+                    src = json.loads(p.decode("utf-8")).get("metadata", {}).get("path")
+                    if src is not None:
+                        sources.setdefault(str(src), []).append(i)
+                self._sources = sources
+        rows = np.asarray(sorted(r for p in paths for r in self._sources.get(str(p), ())), dtype=np.int64)
+        if self.deleted is not None and len(rows):
+            rows = rows[~np.asarray(self.deleted)[rows]]
+        return rows
+
+    def with_deleted(self, rows: np.ndarray) -> "Segment":
+        """A new view of this segment with `rows` also deleted (a new mask file;
+        snapshots holding the current view are unaffected)."""
+        mask = np.zeros(self.n_docs, dtype=bool) if self.deleted is None else np.array(self.deleted)
+        mask[rows] = True
+        gen = int(self.deleted_file.split("_")[1].split(".")[0]) + 1 if self.deleted_file else 1
+        name = f"deleted_{gen:06d}.npy"
+        np.save(self._file(name + ".tmp.npy"), mask)
+        os.replace(self._file(name + ".tmp.npy"), self._file(name))
+        return Segment(self.path, name)
+
+    def get_document(self, i: int) -> Document:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        item = json.loads(bytes(self._blob[start:end]).decode("utf-8"))
+        return Document(page_content=item["page_content"], metadata=item.get("metadata", {}))
+
+    def postings(self, cols: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Gather (doc, weight * normalised tf) for every posting of the given features."""
+        pos = self.postings_index.find(cols)
+        hit = pos >= 0
+        docs, tfs, lengths = self.postings_index.decode_terms(pos[hit])
+        if len(docs) == 0:
+            return docs, tfs
+        return docs, np.repeat(np.asarray(weights, dtype=np.float32)[hit], lengths) * tfs / self.doc_norm[docs]
+
+    def tfidf_values(self, docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        return tfs / self.doc_norm[docs]
+
+    def search_batch(self, queries: csr_matrix, k: int, values=None) -> List[List[Tuple[float, int]]]:
+        """Score many queries at once.
+
+        The postings of the union of the queries' terms become one sparse
+        (terms x chunks) matrix, so all queries are scored by a single
+        sparse-sparse product; each result row then gets a partial top-k.
+        """
+        values = values or Segment.tfidf_values
+        n_queries = queries.shape[0]
+        terms = np.unique(np.asarray(queries.indices, dtype=np.int64))
+        pos = self.postings_index.find(terms)
+        terms, pos = terms[pos >= 0], pos[pos >= 0]
+        if len(pos) == 0:
+            return [[] for _ in range(n_queries)]
+        docs, tfs, lengths = self.postings_index.decode_terms(pos)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        post = csr_matrix((values(self, docs, tfs), docs, indptr), shape=(len(pos), self.n_docs))
+        # remap query columns onto the touched terms, dropping terms this segment lacks
+        rows = np.repeat(np.arange(n_queries), np.diff(queries.indptr))
+        cols = np.minimum(np.searchsorted(terms, queries.indices), len(terms) - 1)
+        keep = terms[cols] == queries.indices
+        q = csr_matrix((queries.data[keep], (rows[keep], cols[keep])), shape=(n_queries, len(terms)))
+        scores = (q @ post).tocsr()
+        out = []
+        for i in range(n_queries):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            row_docs, row_scores = scores.indices[start:end], scores.data[start:end]
+            out.append([(float(row_scores[j]), int(row_docs[j])) for j in top_k(row_scores, k)])
+        return out
+
+    def search(self, qv, k: int) -> List[Tuple[float, int]]:
+        """Term-at-a-time scoring over the query's postings, then partial top-k.
+
+        Work and allocations are proportional to the postings touched; chunks
+        sharing no term with the query are never scored (nor returned).
+        """
+        docs, contrib = self.postings(np.asarray(qv.indices, dtype=np.int64), np.asarray(qv.data, dtype=np.float32))
+        if len(docs) == 0:
+            return []
+        uniq, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=contrib)
+        best = top_k(scores, k)
+        return [(float(scores[i]), int(uniq[i])) for i in best]
+
+
+_OPEN = {}
+_OPEN_LOCK = threading.Lock()
+
+
+def open_local_store(path: str, embedding_client) -> "LocalStore":
+    """The process-wide LocalStore for `path`.
+
+    Every VectorStore in a process shares it (and its embedder statistics),
+    so a new ingest never races the compactor of an earlier one over
+    segments.json. If another process has committed since, the shared store
+    is reloaded from disk first, in place; readers that must not see that
+    (SharedVectorStore) use snapshot_local_store instead.
+    """
+    key = os.path.abspath(path)
+    with _OPEN_LOCK:
+        store = _OPEN.get(key)
+        if store is None:
+            store = LocalStore(path)
+            store.load(embedding_client)
+            store.embedder = embedding_client.local_embedder
+            _OPEN[key] = store
+        else:
+            with store._lock:
+                if store.stale():
+                    store.load(embedding_client)
+                    store.embedder = embedding_client.local_embedder
+        return store
+
+
+def snapshot_local_store(path: str, embedding_client) -> "LocalStore":
+    """A private, read-only LocalStore for `path` as committed right now.
+
+    Unlike open_local_store, nothing is shared: a later reload or ingest in
+    this or another process never changes its segments or embedder
+    statistics. Used by reader instances that get replaced wholesale on
+    reload (see SharedVectorStore). Never write through it.
+    """
+    store = LocalStore(path, background_compaction=False)
+    store.load(embedding_client, read_only=True)
+    store.embedder = embedding_client.local_embedder
+    return store
+
+
+class LocalStore:
+    """Append-only set of segments plus a background size-tiered compactor.
+
+    Readers take a snapshot of the (immutable) segment tuple and never lock;
+    writers and the compactor swap in a new tuple under `_lock`.
+    """
+
+    def __init__(self, path: str, background_compaction: bool = True):
+        self.path = path
+        self._segments: Tuple[Segment, ...] = ()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._background = background_compaction
+        self._cond = threading.Condition()
+        self._pending = False
+        self._busy = False
+        self._compactor: Optional[threading.Thread] = None
+        # stat of segments.json as of our last load/commit (see stale)
+        self._sig = None
+
+    def __len__(self) -> int:
+        return sum(s.n_live for s in self._segments)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._file("segments.json"))
+
+    def _disk_sig(self):
+        try:
+            st = os.stat(self._file("segments.json"))
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def stale(self) -> bool:
+        """True when segments.json was replaced by someone other than us."""
+        return self._disk_sig() != self._sig
+
+    def load(self, embedding_client, read_only: bool = False) -> bool:
+        """Map a persisted store, returning False when nothing is on disk.
+        With `read_only` the embedder statistics are a private copy (see snapshot)."""
+        if not self.exists():
+            return False
+        for attempt in range(LOAD_RETRIES):
+            with open(self._file("segments.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format", 1) != FORMAT_VERSION:
+                raise ValueError(f"Local store at {self.path} uses an older segment format; re-ingest the documents")
+            deleted = manifest.get("deleted", {})
+            try:
+                segments = tuple(Segment(self._file(name), deleted.get(name)) for name in manifest["segments"])
+                break
+            except FileNotFoundError:
+                # a compaction in another process committed and removed a segment
+                # between reading the manifest and opening it; the new manifest is complete
+                if attempt == LOAD_RETRIES - 1:
+                    raise
+        self._next_id = int(manifest["next_id"])
+        self._segments = segments
+        self._sig = self._disk_sig()
+        embedding_client.load_local(self.path, read_only=read_only)
+        return len(self) > 0
+
+    def _commit(self, segments: Tuple[Segment, ...]):
+        """Publish a new segment list (caller holds `_lock`)."""
+        write_json(self._file("segments.json"), {
+            "format": FORMAT_VERSION,
+            "segments": [s.name for s in segments],
+            "deleted": {s.name: s.deleted_file for s in segments if s.deleted_file},
+            "next_id": self._next_id,
+        })
+        self._segments = segments
+        self._sig = self._disk_sig()
+
+    def _new_segment_path(self) -> str:
+        with self._lock:
+            name = f"seg_{self._next_id:06d}"
+            self._next_id += 1
+        return self._file(name)
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        """Current immutable snapshot, safe to search without locking."""
+        return self._segments
+
+    def add(self, docs: List[Document], counts, embedding_client):
+        """Write documents and their raw term-count rows as a new segment.
+
+        The caller has already folded `counts` into the embedder statistics.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        payload = [
+            json.dumps({"page_content": d.page_content, "metadata": d.metadata}, ensure_ascii=False).encode("utf-8")
+            for d in docs
+        ]
+        seg = Segment.write(self._new_segment_path(), csr_matrix(counts, dtype=np.float32), payload)
+        embedding_client.save_local(self.path)
+        with self._lock:
+            self._commit(self._segments + (seg,))
+        self._schedule_compaction()
+
+    def delete_paths(self, paths, embedding_client) -> int:
+        """Delete every chunk ingested from one of `paths`; returns how many.
+
+        Their term counts are taken back out of the embedder statistics; the
+        rows themselves disappear at the next compaction of their segment.
+        """
+        paths = set(paths)
+        if not paths:
+            return 0
+        removed = 0
+        stale = []
+        with self._lock:
+            segments = []
+            for seg in self._segments:
+                rows = seg.rows_for(paths)
+                if len(rows):
+                    embedding_client.local_embedder.partial_unfit(seg.matrix[rows])
+                    if seg.deleted_file:
+                        stale.append(seg._file(seg.deleted_file))
+                    seg = seg.with_deleted(rows)
+                    removed += len(rows)
+                segments.append(seg)
+            if removed:
+                embedding_client.save_local(self.path)
+                self._commit(tuple(segments))
+        for path in stale:
+            # snapshots still using the old mask keep their mapping
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return removed
+
+    def get_document(self, i: int) -> Document:
+        for seg in self._segments:
+            if i < seg.n_docs:
+                return seg.get_document(i)
+            i -= seg.n_docs
+        raise IndexError(i)
+
+    def search(self, qv, k: int) -> List[Tuple[Document, float]]:
+        """Fan the query out over a snapshot of the segments and merge their top-k."""
+        candidates = []
+        for seg in self._segments:
+            for score, i in seg.search(qv, k):
+                candidates.append((score, seg, i))
+        best = heapq.nlargest(k, candidates, key=lambda c: c[0])
+        return [(seg.get_document(i), score) for score, seg, i in best]
+
+    def search_batch(self, queries: csr_matrix, k: int) -> List[List[Tuple[Document, float]]]:
+        """TF-IDF top-k for every row of `queries` (see Segment.search_batch)."""
+        return [
+            [(seg.get_document(i), score) for score, seg, i in hits]
+            for hits in search_segments_batch(self._segments, queries, k)
+        ]
+
+    # -- compaction -------------------------------------------------------
+
+    def _pick_run(self, segments: Tuple[Segment, ...]) -> Optional[Tuple[int, int]]:
+        """Find `fanout` adjacent segments sharing a tier; returns a slice or None."""
+        fanout = max(settings.LOCAL_COMPACTION_FANOUT, 2)
+        start = 0
+        for i in range(1, len(segments) + 1):
+            if i == len(segments) or segments[i].tier != segments[start].tier:
+                # merges are built in memory, so stop growing segments past the cap
+                if i - start >= fanout and sum(s.n_docs for s in segments[start:start + fanout]) <= settings.LOCAL_MAX_SEGMENT_DOCS:
+                    return start, start + fanout
+                start = i
+        return None
+
+    def compact(self) -> bool:
+        """Run one merge step; returns False when no run qualifies."""
+        run = self._pick_run(self._segments)
+        if run is None:
+            return False
+        victims = self._segments[run[0]:run[1]]
+        # deleted rows are dropped here for good
+        live = [s.live_rows() for s in victims]
+        mat = vstack([s.matrix[rows] for s, rows in zip(victims, live)], format="csr")
+        payload = [p for s, rows in zip(victims, live) for p in s.raw_documents(rows)]
+        merged = Segment.write(self._new_segment_path(), mat, payload)
+        with self._lock:
+            # ingests may have appended segments meanwhile; replace the victims in place
+            current = self._segments
+            pos = next((i for i, s in enumerate(current) if s is victims[0]), None)
+            if pos is None or any(a is not b for a, b in zip(current[pos:pos + len(victims)], victims)):
+                # a delete replaced some victim meanwhile; merge again from the new views
+                shutil.rmtree(merged.path, ignore_errors=True)
+                return True
+            self._commit(current[:pos] + (merged,) + current[pos + len(victims):])
+        # open snapshots keep their mappings alive after the files are unlinked
+        for s in victims:
+            shutil.rmtree(s.path, ignore_errors=True)
+        return True
+
+    def _schedule_compaction(self):
+        if not self._background:
+            while self.compact():
+                pass
+            return
+        with self._cond:
+            self._pending = True
+            self._cond.notify_all()
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self._compaction_loop, name="local-store-compactor", daemon=True)
+                self._compactor.start()
+
+    def _compaction_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                self._pending = False
+                self._busy = True
+            try:
+                while self.compact():
+                    pass
+            except Exception:
+                # leave the current segments in place; the next add retries
+                pass
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def wait_for_compaction(self, timeout: float = None) -> bool:
+        """Block until pending merges are done (for scripts that exit right after ingest)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
@@ -0,0 +1,97 @@
+"""Ingest manifest: which files are in the store, by content hash.
+
+Stored as ``<VECTORSTORE_PATH>/ingest_manifest.json``, one entry per file,
+keyed by its absolute path (so "docs/a.pdf" and "./docs/a.pdf" are one file):
+
+    {"path": ..., "sha256": ..., "chunk_size": ..., "chunk_overlap": ...,
+     "retriever": ..., "embedding": ..., "source_name": ..., "chunks": ...,
+     "size": ..., "mtime_ns": ...}
+
+"path" is the path as given to that ingest, i.e. the chunks' metadata "path".
+
+A file is unchanged when both its content hash and the ingest parameters
+(chunking, retriever, embedding provider/model and source name; see
+ingest_params) match its entry, so re-ingesting with e.g. another embedding
+model re-indexes the file instead of skipping it. Size and mtime are only a shortcut: when they match, the
+recorded hash is reused instead of reading the file again, which is what
+lets a re-ingest of a mostly unchanged library finish quickly.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from src.utils.fsio import write_json
+
+MANIFEST_FILE = "ingest_manifest.json"
+
+UNCHANGED, CHANGED, NEW = "unchanged", "changed", "new"
+
+
+def ingest_params(chunk_size: int, chunk_overlap: int, retriever: str, embedding: str,
+                  source_name: Optional[str] = None) -> dict:
+    """The settings a file's chunks depend on; recorded with its entry."""
+    return {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "retriever": retriever,
+            "embedding": embedding, "source_name": source_name}
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestManifest:
+    def __init__(self, persist_path: str):
+        self.path = os.path.join(persist_path, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                # older manifests were keyed by the path as given
+                self.entries = {os.path.abspath(p): {"path": p, **e} for p, e in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def fingerprint(self, path: str) -> dict:
+        """Content hash plus stat info of `path`, reusing the recorded hash
+        when size and mtime have not moved."""
+        st = os.stat(path)
+        entry = self.entries.get(os.path.abspath(path))
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            sha = entry["sha256"]
+        else:
+            sha = file_sha256(path)
+        return {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def status(self, path: str, fingerprint: dict, params: dict) -> str:
+        """NEW, CHANGED or UNCHANGED; `params` as returned by ingest_params."""
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return NEW
+        # entries written before a parameter was recorded lack it, and count as changed
+        same = entry.get("sha256") == fingerprint["sha256"] and all(
+            key in entry and entry[key] == value for key, value in params.items()
+        )
+        return UNCHANGED if same else CHANGED
+
+    def record(self, path: str, fingerprint: dict, params: dict, chunks: Optional[int] = None):
+        with self._lock:
+            self.entries[os.path.abspath(path)] = {"path": path, **fingerprint, **params, "chunks": chunks}
+
+    def recorded_path(self, path: str) -> Optional[str]:
+        """The path string the file's chunks were stored under, if recorded."""
+        entry = self.entries.get(os.path.abspath(path))
+        return entry.get("path") if entry else None
+
+    def forget(self, path: str):
+        with self._lock:
+            self.entries.pop(os.path.abspath(path), None)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_json(self.path, self.entries)
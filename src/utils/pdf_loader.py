@@ -1,36 +1,114 @@
-from typing import List
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 import fitz  # PyMuPDF
+from src.config import settings
+
+def pdf_page_count(path: str) -> int:
+    doc = fitz.open(path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    Text of pages [start, end) of one PDF (0-based). Runs in pool workers.
+    """
+    doc = fitz.open(path)
+    try:
+        return [doc[i].get_text("text") or "" for i in range(start, min(end, doc.page_count))]
+    finally:
+        doc.close()
+
+def _page_ranges(paths: Sequence[str], pages_per_task: int) -> Iterator[Tuple[int, str, int, int]]:
+    for file_idx, path in enumerate(paths):
+        n = pdf_page_count(path)
+        for start in range(0, n, pages_per_task):
+            yield file_idx, path, start, min(start + pages_per_task, n)
+
+def iter_pdf_pages_parallel(paths: Sequence[str], workers: Optional[int] = None,
+                            pages_per_task: Optional[int] = None) -> Iterator[Tuple[int, int, str]]:
+    """
+    Extracts many PDFs on a process pool, split into (file, page range) tasks.
+
+    Yields (file index in `paths`, 1-based page number, text) for every page,
+    empty ones included, in file and page order. Only a bounded window of
+    tasks (2 per worker) is in flight, so results stream back to the caller
+    instead of piling up when it consumes them slowly.
+    """
+    workers = settings.PDF_WORKERS if workers is None else workers
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    pages_per_task = max(pages_per_task or settings.PDF_PAGES_PER_TASK, 1)
+    tasks = _page_ranges(paths, pages_per_task)
+    if workers == 1:
+        for file_idx, path, start, end in tasks:
+            for i, text in enumerate(extract_page_range(path, start, end)):
+                yield file_idx, start + i + 1, text
+        return
+    # spawn: the caller usually has threads running (ingest reader, compactor), which fork does not mix with
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        window = deque()
+        for task in tasks:
+            window.append((task, pool.submit(extract_page_range, *task[1:])))
+            if len(window) >= 2 * workers:
+                (file_idx, _, start, _), fut = window.popleft()
+                for i, text in enumerate(fut.result()):
+                    yield file_idx, start + i + 1, text
+        while window:
+            (file_idx, _, start, _), fut = window.popleft()
+            for i, text in enumerate(fut.result()):
+                yield file_idx, start + i + 1, text
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """
+    Yields the text of each non-empty page, one page in memory at a time.
+    """
+    doc = fitz.open(path)
+    try:
+        for page in doc:
+            text = page.get_text("text")
+            if text:
+                yield text
+    finally:
+        doc.close()
 
 def load_pdf_text(path: str) -> str:
     """
     Extracts text from a PDF using PyMuPDF.
     Returns the full text as a single string.
     """
-    doc = fitz.open(path)
-    texts = []
-    for page in doc:
-        text = page.get_text("text")
-        if text:
-            texts.append(text)
-    doc.close()
-    return "\n".join(texts)
+    return "\n".join(iter_pdf_pages(path))
+
+def iter_text_chunks(pieces: Iterable[str], chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+    """
+    Streaming version of split_text_to_chunks over a text given in pieces
+    (pages, file blocks). Yields the same chunks as splitting the concatenated
+    text, while only buffering about one chunk of it.
+    """
+    step = max(chunk_size - overlap, 1)
+    buf = ""
+    pos = 0
+    emitted_to_end = False  # last chunk ended exactly at the end of the buffer
+    for piece in pieces:
+        if not piece:
+            continue
+        buf = buf[pos:] + piece
+        pos = 0
+        emitted_to_end = False
+        while len(buf) - pos >= chunk_size:
+            yield buf[pos:pos + chunk_size]
+            emitted_to_end = len(buf) - pos == chunk_size
+            pos += step
+    # the tail is a chunk unless it is just the overlap of one already emitted
+    tail = buf[pos:]
+    if tail and not emitted_to_end:
+        yield tail
 
 def split_text_to_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     """
     Splits a long text into overlapping chunks for embedding.
     """
-    chunks = []
-    start = 0
-    text_len = len(text)
-    if text_len == 0:
-        return []
-    while start < text_len:
-        end = min(start + chunk_size, text_len)
-        chunks.append(text[start:end])
-        # advance start: keep overlap
-        start = end - overlap
-        if start < 0:
-            start = 0
-        if start >= text_len:
-            break
-    return chunks
\ No newline at end of file
+    return list(iter_text_chunks([text], chunk_size=chunk_size, overlap=overlap))
@@ -0,0 +1,169 @@
+"""Compressed postings lists for the local segments.
+
+Each segment stores, per hashed feature (term), the chunks containing it and
+the raw term frequency in each. Postings are cut into blocks of `BLOCK_SIZE`;
+inside a block doc ids are delta-encoded (the first one is absolute, so blocks
+decode independently) and both doc gaps and term frequencies are written as
+variable-byte integers. A skip table (`blk_last`, byte offsets) lets a scorer
+decode only the blocks that can contain the chunks it cares about.
+
+Arrays (all saved as ``post_<name>.npy`` in the segment directory):
+
+- ``terms``: sorted feature ids present in the segment
+- ``blk_ptr``: per term, its range of blocks (len = n_terms + 1)
+- ``blk_post``: per block, index of its first posting (len = n_blocks + 1)
+- ``blk_last``: per block, its last doc id
+- ``doc_off`` / ``tf_off``: per block, byte offset into ``doc_blob`` / ``tf_blob``
+- ``max_tf`` / ``min_len``: per term, largest tf and shortest chunk length in
+  its postings (inputs for score upper bounds)
+
+Deleted chunks are not rewritten out of the lists; a per-segment mask hides
+them when blocks are decoded (the bounds stay valid upper bounds).
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+BLOCK_SIZE = 128
+
+ARRAY_NAMES = ("terms", "blk_ptr", "blk_post", "blk_last", "doc_off", "tf_off", "doc_blob", "tf_blob", "max_tf", "min_len")
+
+
+def vbyte_encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode non-negative ints 7 bits per byte, high bit marking the last byte.
+
+    Returns the byte buffer and the number of bytes used by each value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.cumsum(nbytes) - nbytes
+    pos = np.arange(int(nbytes.sum()), dtype=np.int64) - np.repeat(starts, nbytes)
+    out = ((np.repeat(values, nbytes) >> (np.uint64(7) * pos.astype(np.uint64))) & np.uint64(0x7F)).astype(np.uint8)
+    out[starts + nbytes - 1] |= 0x80
+    return out, nbytes
+
+
+def vbyte_decode(buf: np.ndarray) -> np.ndarray:
+    """Inverse of vbyte_encode, vectorised over the whole buffer."""
+    buf = np.asarray(buf, dtype=np.uint8)
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.int64)
+    last = (buf & 0x80) != 0
+    ends = np.flatnonzero(last)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.cumsum(last) - last
+    shift = (np.arange(len(buf), dtype=np.int64) - starts[group]) * 7
+    parts = (buf & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+def gather_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Flat indices covering [starts[i], ends[i]) for every i, in order."""
+    lengths = np.asarray(ends, dtype=np.int64) - np.asarray(starts, dtype=np.int64)
+    total = int(lengths.sum())
+    run_starts = np.cumsum(lengths) - lengths
+    return np.arange(total, dtype=np.int64) + np.repeat(np.asarray(starts, dtype=np.int64) - run_starts, lengths)
+
+
+def encode_postings(counts: csr_matrix, doc_len: np.ndarray) -> Dict[str, np.ndarray]:
+    """Build the compressed inverted index of a raw term-count matrix."""
+    terms, cols = np.unique(counts.indices, return_inverse=True)
+    # remap to the features actually present so the transpose stays small
+    sub = csr_matrix((counts.data, cols.astype(np.int32), counts.indptr), shape=(counts.shape[0], len(terms))).tocsc()
+    sub.sort_indices()
+    term_ptr = sub.indptr.astype(np.int64)
+    docs = sub.indices.astype(np.int64)
+    tfs = np.maximum(np.rint(sub.data), 1).astype(np.int64)
+    n_post = np.diff(term_ptr)
+
+    n_blk = -(-n_post // BLOCK_SIZE)
+    blk_ptr = np.concatenate([[0], np.cumsum(n_blk)]).astype(np.int64)
+    blk_term = np.repeat(np.arange(len(terms)), n_blk)
+    blk_start = term_ptr[blk_term] + BLOCK_SIZE * (np.arange(int(blk_ptr[-1])) - blk_ptr[blk_term])
+    blk_post = np.concatenate([blk_start, [len(docs)]]).astype(np.int64)
+
+    gaps = docs.copy()
+    gaps[1:] -= docs[:-1]
+    gaps[blk_start] = docs[blk_start]
+    doc_blob, doc_nbytes = vbyte_encode(gaps)
+    tf_blob, tf_nbytes = vbyte_encode(tfs)
+    doc_off = np.concatenate([[0], np.cumsum(doc_nbytes)])[blk_post]
+    tf_off = np.concatenate([[0], np.cumsum(tf_nbytes)])[blk_post]
+
+    lens = np.asarray(doc_len, dtype=np.float32)[docs]
+    return {
+        "terms": terms.astype(np.int64),
+        "blk_ptr": blk_ptr,
+        "blk_post": blk_post,
+        "blk_last": docs[blk_post[1:] - 1].astype(np.int32),
+        "doc_off": doc_off.astype(np.int64),
+        "tf_off": tf_off.astype(np.int64),
+        "doc_blob": doc_blob,
+        "tf_blob": tf_blob,
+        "max_tf": np.maximum.reduceat(tfs, term_ptr[:-1]).astype(np.float32) if len(terms) else np.zeros(0, np.float32),
+        "min_len": np.minimum.reduceat(lens, term_ptr[:-1]).astype(np.float32) if len(terms) else np.zeros(0, np.float32),
+    }
+
+
+class CompressedPostings:
+    """Read-only view over the arrays produced by encode_postings."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], deleted: Optional[np.ndarray] = None):
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        # per doc: True once deleted; such postings are dropped while decoding
+        self.deleted = deleted
+
+    def find(self, cols: np.ndarray) -> np.ndarray:
+        """Positions of `cols` in `terms`, -1 where a feature is absent."""
+        cols = np.asarray(cols, dtype=np.int64)
+        if len(self.terms) == 0:
+            return np.full(len(cols), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.terms, cols), len(self.terms) - 1)
+        return np.where(self.terms[pos] == cols, pos, -1)
+
+    def term_blocks(self, pos: np.ndarray) -> np.ndarray:
+        """All block ids of the given term positions, in order."""
+        pos = np.asarray(pos, dtype=np.int64)
+        return gather_ranges(self.blk_ptr[pos], self.blk_ptr[pos + 1])
+
+    def candidate_blocks(self, pos: int, docs: np.ndarray) -> np.ndarray:
+        """Blocks of one term that may contain any of the (sorted) `docs`."""
+        first, end = int(self.blk_ptr[pos]), int(self.blk_ptr[pos + 1])
+        last = self.blk_last[first:end]
+        idx = np.searchsorted(last, docs)
+        return first + np.unique(idx[idx < len(last)])
+
+    def decode_blocks(self, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decode blocks into (doc ids, term frequencies, postings per block)."""
+        blocks = np.asarray(blocks, dtype=np.int64)
+        counts = self.blk_post[blocks + 1] - self.blk_post[blocks]
+        if len(blocks) == 0 or int(counts.sum()) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), counts
+        gaps = vbyte_decode(self.doc_blob[gather_ranges(self.doc_off[blocks], self.doc_off[blocks + 1])])
+        tfs = vbyte_decode(self.tf_blob[gather_ranges(self.tf_off[blocks], self.tf_off[blocks + 1])])
+        # undo the delta coding; every block restarts from an absolute doc id
+        cs = np.cumsum(gaps)
+        first = np.cumsum(counts) - counts
+        docs = cs - np.repeat(cs[first] - gaps[first], counts)
+        tfs = tfs.astype(np.float32)
+        if self.deleted is not None:
+            keep = ~self.deleted[docs]
+            block_of = np.repeat(np.arange(len(blocks)), counts)
+            counts = np.bincount(block_of[keep], minlength=len(blocks)).astype(np.int64)
+            docs, tfs = docs[keep], tfs[keep]
+        return docs, tfs, counts
+
+    def decode_terms(self, pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decode full postings lists; returns (docs, tfs, postings per term)."""
+        pos = np.asarray(pos, dtype=np.int64)
+        docs, tfs, counts = self.decode_blocks(self.term_blocks(pos))
+        n_blocks = self.blk_ptr[pos + 1] - self.blk_ptr[pos]
+        term_of = np.repeat(np.arange(len(pos)), n_blocks)
+        lengths = np.bincount(term_of, weights=counts, minlength=len(pos)).astype(np.int64)
+        return docs, tfs, lengths
@@ -0,0 +1,131 @@
+"""In-process caches for repeated questions.
+
+Two layers, each a bounded LRU whose entries also expire after
+`QUERY_CACHE_TTL` seconds:
+
+- embeddings: ("<provider>:<model>", normalized query) -> query embedding. Only
+  cloud query embeddings (a provider round trip) go here; they do not depend
+  on the store, so a store change leaves them valid.
+- results: (retriever, normalized query, k, store version) -> ranked hits.
+  Every VectorStore carries a version that changes whenever it is modified
+  (add_documents / delete_paths) or replaced by a reload, and the entries of
+  the old version are dropped at that point.
+
+Queries are normalized (Unicode NFKC, runs of whitespace collapsed, ends
+stripped) before being used as keys; the search itself also runs on the
+normalized text so cached and uncached answers are identical.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from src.config import settings
+
+_MISSING = object()
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class LRUTTLCache:
+    """Thread-safe LRU map with a per-entry time-to-live. `max_entries` <= 0 disables it."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+            if item is not _MISSING:
+                stored, value = item
+                if self.ttl <= 0 or time.monotonic() - stored < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._items[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`; returns how many."""
+        with self._lock:
+            stale = [key for key in self._items if predicate(key)]
+            for key in stale:
+                del self._items[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class QueryCache:
+    def __init__(self, embedding_entries: int = None, result_entries: int = None, ttl: float = None):
+        ttl = settings.QUERY_CACHE_TTL if ttl is None else ttl
+        self.embeddings = LRUTTLCache(
+            settings.QUERY_EMBEDDING_CACHE_SIZE if embedding_entries is None else embedding_entries, ttl)
+        self.results = LRUTTLCache(
+            settings.QUERY_RESULT_CACHE_SIZE if result_entries is None else result_entries, ttl)
+
+    def invalidate_version(self, version) -> int:
+        """Forget the ranked hits computed against `version` of a store."""
+        # result keys are (retriever, query, k, version)
+        return self.results.invalidate(lambda key: key[-1] == version)
+
+    def stats(self) -> dict:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
+
+
+_DEFAULT: Optional[QueryCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_query_cache() -> QueryCache:
+    """Process-wide query cache shared by every VectorStore."""
+    global _DEFAULT
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = QueryCache()
+        return _DEFAULT
@@ -0,0 +1,217 @@
+"""Persistent cache of LLM report responses, with an exact and a semantic tier.
+
+Backed by a single SQLite file (`RESPONSE_CACHE_PATH`; empty disables the
+cache), like the embedding cache.
+
+- exact: sha256 of (final prompt, model, temperature, max_tokens). A hit
+  means the LLM would be sent exactly the same request.
+- semantic: every other input of the report must be identical. That is
+  the model and sampling parameters, the output format, the patient, the
+  ids of the retrieved chunks (same set, same order) and any web context.
+  These inputs form the "group". Within a group, a stored answer is reused
+  when its question's embedding has cosine similarity >=
+  `RESPONSE_CACHE_SIMILARITY` with the new question. Question vectors are
+  the store's dense query embedding, and the embedding model is part of the
+  group. Without a dense embedding (local provider) the tier is off: hashed
+  word vectors score "is X indicated" and "is X contraindicated" as near
+  identical, which is not a risk worth a saved LLM call.
+
+The question is normalized (case, whitespace; see normalize_question) once,
+and that text is what gets embedded for the semantic tier.
+
+Entries expire after `RESPONSE_CACHE_TTL` seconds (0 = never). Once the
+stored text exceeds `RESPONSE_CACHE_MAX_MB`, the least recently used
+entries are evicted. `stats()` reports per-tier hits and the LLM latency
+the hits saved (the recorded latency of each answer that was reused).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from src.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    grp TEXT NOT NULL,
+    qvec BLOB,
+    response TEXT NOT NULL,
+    latency REAL NOT NULL,
+    created REAL NOT NULL,
+    last_used INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_grp ON responses (grp);
+CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used);
+"""
+
+def _sha256(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def question_vector(dense: Optional[Sequence[float]] = None, space: str = None) -> Tuple[str, Optional[np.ndarray]]:
+    """(vector space, unit vector) of a question's store embedding `dense`;
+    ("none", None) without one, which leaves only the exact tier."""
+    if dense is None:
+        return "none", None
+    vec = np.asarray(dense, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return space or f"dense:{vec.shape[0]}", vec / norm if norm else vec
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_mb: float = None, ttl: float = None, similarity: float = None):
+        self.path = path
+        self.max_bytes = int((settings.RESPONSE_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.ttl = settings.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.similarity = settings.RESPONSE_CACHE_SIMILARITY if similarity is None else similarity
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.evictions = 0
+        self.expirations = 0
+        self._bytes = int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0])
+
+    @staticmethod
+    def exact_key(prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        return _sha256(["exact", prompt, model, temperature, max_tokens])
+
+    @staticmethod
+    def group_key(space: str, model: str, temperature: float, max_tokens: int, structured: bool, patient: dict,
+                  chunk_ids: List[str], extra_context: str) -> str:
+        return _sha256(["group", space, model, temperature, max_tokens, structured, patient, chunk_ids, extra_context])
+
+    def _fresh(self, created: float, now: float) -> bool:
+        return self.ttl <= 0 or now - created < self.ttl
+
+    def get(self, key: str, group: str, qvec: Optional[np.ndarray]) -> Tuple[Optional[str], Optional[str]]:
+        """(response, tier) where tier is "exact" or "semantic"; (None, None) on a miss.
+        Without `qvec` only the exact tier is tried."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT key, response, latency, created FROM responses WHERE key = ?", (key,)).fetchone()
+            tier = "exact"
+            if row is not None and not self._fresh(row[3], now):
+                self._drop([row[0]])
+                self.expirations += 1
+                row = None
+            if row is None and qvec is not None:
+                tier = "semantic"
+                best = -1.0
+                for k, blob, response, latency, created in self._conn.execute(
+                    "SELECT key, qvec, response, latency, created FROM responses WHERE grp = ?", (group,)
+                ).fetchall():
+                    if blob is None or not self._fresh(created, now):
+                        continue
+                    stored = np.frombuffer(blob, dtype=np.float32)
+                    if stored.shape != qvec.shape:
+                        continue
+                    score = float(stored @ qvec)
+                    if score >= self.similarity and score > best:
+                        best, row = score, (k, response, latency, created)
+            if row is None:
+                self.misses += 1
+                return None, None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time_ns(), row[0]))
+            self._conn.commit()
+            if tier == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self.saved_seconds += row[2]
+            return row[1], tier
+
+    def put(self, key: str, group: str, qvec: Optional[np.ndarray], response: str, latency: float):
+        blob = np.asarray(qvec, dtype=np.float32).tobytes() if qvec is not None else None
+        size = len(response.encode("utf-8")) + (len(blob) if blob else 0)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, grp, qvec, response, latency, created, last_used, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, group, blob, response, latency, time.time(), time.time_ns(), size),
+            )
+            self._conn.commit()
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _drop(self, keys: List[str]):
+        """Delete entries (caller holds the lock)."""
+        for key in keys:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._bytes -= row[0]
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def _evict(self):
+        """Drop expired, then least recently used entries down to 90% of the budget (caller holds the lock)."""
+        if self.ttl > 0:
+            cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.expirations += cur.rowcount
+        self._bytes = int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0])
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 1000").fetchall()
+            if not rows:
+                break
+            drop = []
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                drop.append((key,))
+                self._bytes -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", drop)
+            self.evictions += len(drop)
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = int(self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0])
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "exact_hit_rate": self.exact_hits / lookups if lookups else 0.0,
+                "semantic_hit_rate": self.semantic_hits / lookups if lookups else 0.0,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "entries": entries,
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def default_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache at RESPONSE_CACHE_PATH, or None when disabled."""
+    path = settings.RESPONSE_CACHE_PATH
+    if not path:
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = _CACHES[path] = ResponseCache(path)
+        return cache
@@ -0,0 +1,105 @@
+"""Process-wide VectorStore for the API, reloaded when the persisted store changes.
+
+Building a VectorStore maps the local segments / loads the FAISS index and
+creates embedding clients, which is far too slow to do per request. The API
+keeps one `SharedVectorStore` instead. A watcher thread polls
+`persisted_version` every `VECTORSTORE_RELOAD_INTERVAL` seconds; when an
+ingest or compaction has committed a new version, it builds a fresh
+VectorStore off the request path and swaps the reference (read-copy-update).
+Requests grab `current` once and keep using that instance, so a swap never
+changes the store under a running query, and the old instance is freed when
+the last request holding it finishes.
+
+The instances are read-only snapshots (VectorStore(snapshot=True)): each has
+its own lexical segment list and embedder statistics, not the process-wide
+LocalStore that writers share, so loading a new version never touches the
+one in-flight requests are using.
+"""
+import threading
+from typing import Callable, Optional
+
+from src.config import settings
+from src.utils.vectorstore import VectorStore, persisted_version
+
+
+def _snapshot(persist_path: str = None, retriever: str = None) -> VectorStore:
+    return VectorStore(persist_path=persist_path, retriever=retriever, snapshot=True)
+
+
+class SharedVectorStore:
+    """Thread-safe holder of the current VectorStore.
+
+    Attribute access is forwarded to the current instance, so it can be passed
+    wherever a VectorStore is expected (e.g. ReportGenerator(vs=...)).
+    """
+
+    def __init__(self, persist_path: str = None, retriever: str = None, poll_interval: float = None,
+                 factory: Callable[..., VectorStore] = _snapshot):
+        self.persist_path = persist_path or settings.VECTORSTORE_PATH
+        self.retriever = retriever
+        self.poll_interval = settings.VECTORSTORE_RELOAD_INTERVAL if poll_interval is None else poll_interval
+        self._factory = factory
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloads = 0
+        self._version = persisted_version(self.persist_path)
+        self._current = self._factory(persist_path=self.persist_path, retriever=retriever)
+
+    @property
+    def current(self) -> VectorStore:
+        """The live instance; hold on to it for the duration of one request."""
+        return self._current
+
+    @property
+    def version(self):
+        return self._version
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._current, name)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Swap in a new VectorStore if the persisted version changed.
+
+        Returns True when a new instance was published.
+        """
+        with self._reload_lock:
+            version = persisted_version(self.persist_path)
+            if version == self._version and not force:
+                return False
+            fresh = self._factory(persist_path=self.persist_path, retriever=self.retriever)
+            if persisted_version(self.persist_path) != version:
+                # another commit landed while loading (e.g. compaction removed a
+                # segment we were opening); keep the old instance, retry next poll
+                return False
+            # a single reference assignment: readers see the old or the new store
+            old, self._current = self._current, fresh
+            # the hits cached against the old instance are never asked for again
+            old.query_cache.invalidate_version(old.version)
+            self._version = version
+            self.reloads += 1
+            return True
+
+    def start(self):
+        """Start the background watcher (no-op if the interval is <= 0)."""
+        if self.poll_interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="vectorstore-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1.0)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:
+                # keep serving the current store; the next poll retries
+                pass
@@ -0,0 +1,152 @@
+"""Single-flight coalescing of identical report requests.
+
+Requests with the same key (see `SingleFlight.key`) that arrive while one of
+them is being computed wait for that computation and share its result
+instead of running their own retrieval and LLM call. A finished result is also
+kept for `REPORT_COALESCE_TTL` seconds (at most `REPORT_COALESCE_MAX_ENTRIES`
+of them), so duplicates arriving just after it are served as well. Failures
+are passed to the requests waiting at the time, but are not kept.
+
+The key includes the store version, so nothing computed before an ingest is
+handed out after it. `stats()["coalescing_ratio"]` is the share of requests
+that did not compute their own result.
+
+Asynchronous computations (`ado`) run as their own task. A leader whose
+client goes away does not cancel the work the others are waiting for.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from src.config import settings
+from src.utils.query_cache import LRUTTLCache, normalize_query
+
+_MISSING = object()
+
+LEAD, JOINED, RECENT = "lead", "joined", "recent"
+
+
+class CoalesceTimeout(TimeoutError):
+    pass
+
+
+class SingleFlight:
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        ttl = settings.REPORT_COALESCE_TTL if ttl is None else ttl
+        max_entries = settings.REPORT_COALESCE_MAX_ENTRIES if max_entries is None else max_entries
+        # LRUTTLCache treats ttl <= 0 as "never expires"; here it means no result cache
+        self.recent = LRUTTLCache(max_entries if ttl > 0 else 0, ttl)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._tasks = set()  # running ado computations (the loop only keeps weak references)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.leaders = 0
+        self.joined = 0
+        self.recent_hits = 0
+
+    @staticmethod
+    def key(patient: dict, question: str, top_k: int, model: Optional[str], use_web: bool, structured: bool,
+            version=None) -> Hashable:
+        return (json.dumps(patient or {}, sort_keys=True, default=str), normalize_query(question), top_k, model,
+                bool(use_web), bool(structured), version)
+
+    def _claim(self, key: Hashable) -> Tuple[str, Any]:
+        """(RECENT, value), (JOINED, future of the computation in flight) or
+        (LEAD, future the caller must settle)."""
+        with self._lock:
+            self.requests += 1
+            value = self.recent.get(key, _MISSING)
+            if value is not _MISSING:
+                self.recent_hits += 1
+                return RECENT, value
+            future = self._inflight.get(key)
+            if future is not None:
+                self.joined += 1
+                return JOINED, future
+            future = self._inflight[key] = Future()
+            self.leaders += 1
+            return LEAD, future
+
+    def _settle(self, key: Hashable, future: Future, value: Any = None, error: BaseException = None):
+        with self._lock:
+            # cached before the in-flight entry goes, so no duplicate starts a new computation in between
+            if error is None:
+                self.recent.put(key, value)
+            self._inflight.pop(key, None)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float = None) -> Tuple[Any, str]:
+        """fn()'s result, computed once for concurrent callers with the same key,
+        and how it was obtained (LEAD, JOINED or RECENT). A caller that joined
+        raises CoalesceTimeout after `timeout` seconds."""
+        how, item = self._claim(key)
+        if how == RECENT:
+            return item, how
+        if how == JOINED:
+            try:
+                return item.result(timeout), how
+            except FutureTimeout:
+                raise CoalesceTimeout("coalesced report did not finish in time")
+        try:
+            value = fn()
+        except BaseException as e:
+            self._settle(key, item, error=e)
+            raise
+        self._settle(key, item, value)
+        return value, how
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: float = None) -> Tuple[Any, str]:
+        """Same as do, for a coroutine function."""
+        how, item = self._claim(key)
+        if how == RECENT:
+            return item, how
+        if how == LEAD:
+            task = asyncio.ensure_future(fn())
+            self._tasks.add(task)
+
+            def done(t: asyncio.Task):
+                self._tasks.discard(t)
+                if t.cancelled():
+                    self._settle(key, item, error=RuntimeError("coalesced report computation was cancelled"))
+                elif t.exception() is not None:
+                    self._settle(key, item, error=t.exception())
+                else:
+                    self._settle(key, item, t.result())
+
+            task.add_done_callback(done)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(item)), timeout), how
+        except asyncio.TimeoutError:
+            raise CoalesceTimeout("coalesced report did not finish in time")
+
+    def stats(self) -> dict:
+        with self._lock:
+            shared = self.joined + self.recent_hits
+            return {
+                "requests": self.requests,
+                "computed": self.leaders,
+                "joined_in_flight": self.joined,
+                "recent_hits": self.recent_hits,
+                "in_flight": len(self._inflight),
+                "coalescing_ratio": shared / self.requests if self.requests else 0.0,
+            }
+
+
+_DEFAULT: Optional[SingleFlight] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_single_flight() -> Optional[SingleFlight]:
+    """Process-wide coalescer for report requests, or None when REPORT_COALESCE is off."""
+    global _DEFAULT
+    if not settings.REPORT_COALESCE:
+        return None
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = SingleFlight()
+        return _DEFAULT
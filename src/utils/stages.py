@@ -0,0 +1,111 @@
+"""A small dependency graph of request stages run on a thread pool.
+
+Each `Stage` is a function of the results of the stages it depends on
+(passed as keyword arguments, by stage name). A stage starts as soon as all
+of its dependencies are finished, so independent stages run concurrently.
+
+Everything has to finish by one request-level `deadline` (a
+time.monotonic() value). An optional stage may also have a `slot`: seconds
+from its start after which it is no longer waited for. An optional stage
+that misses its slot or the deadline, or raises, is dropped. Its
+dependents get None in its place, and the drop is recorded in
+`StageRun.dropped`. A required stage that misses the deadline raises
+StageTimeout; one that raises propagates its exception.
+
+The thread of a dropped stage is not interrupted. Stages should bound their
+own I/O (e.g. pass the slot on as a timeout).
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+class StageTimeout(TimeoutError):
+    pass
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = (), optional: bool = False,
+                 slot: Optional[float] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.optional = optional
+        self.slot = slot
+
+
+class StageRun:
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}  # seconds each finished stage took
+        self.dropped: Dict[str, str] = {}  # stage -> "timeout" | "error: ..."
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="stage")
+        return _POOL
+
+
+def run_stages(stages: List[Stage], deadline: float, pool: ThreadPoolExecutor = None) -> StageRun:
+    pool = pool or _pool()
+    run = StageRun()
+    pending = {s.name: s for s in stages}
+    running: Dict[Future, Stage] = {}
+    started: Dict[str, float] = {}
+
+    def settled(name: str) -> bool:
+        return name in run.results or name in run.dropped
+
+    def drop(stage: Stage, reason: str):
+        run.dropped[stage.name] = reason
+        run.results[stage.name] = None
+
+    while pending or running:
+        for name, stage in list(pending.items()):
+            if all(settled(d) for d in stage.deps):
+                del pending[name]
+                kwargs = {d: run.results.get(d) for d in stage.deps}
+                started[name] = time.monotonic()
+                running[pool.submit(stage.fn, **kwargs)] = stage
+        if not running:
+            break  # only stages waiting on unknown names are left
+        now = time.monotonic()
+        # wake up at the deadline or the earliest slot end
+        until = deadline
+        for stage in running.values():
+            if stage.slot is not None:
+                until = min(until, started[stage.name] + stage.slot)
+        done, _ = wait(list(running), timeout=max(0.0, until - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            stage = running.pop(future)
+            try:
+                run.results[stage.name] = future.result()
+                run.timings[stage.name] = time.monotonic() - started[stage.name]
+            except Exception as e:
+                if not stage.optional:
+                    raise
+                drop(stage, f"error: {e}")
+        now = time.monotonic()
+        for future, stage in list(running.items()):
+            late = now >= deadline or (stage.slot is not None and now >= started[stage.name] + stage.slot)
+            if not late:
+                continue
+            if not stage.optional:
+                raise StageTimeout(f"stage {stage.name!r} did not finish before the request deadline")
+            del running[future]
+            future.cancel()
+            drop(stage, "timeout")
+    for name, stage in pending.items():
+        # dependencies that never ran (a misspelt name): nothing to wait for
+        if not stage.optional:
+            raise ValueError(f"stage {name!r} depends on unknown stages {stage.deps}")
+        drop(stage, "unresolved")
+    return run
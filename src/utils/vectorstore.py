@@ -1,29 +1,102 @@
+import itertools
+import json
 import os
-from typing import List, Tuple
+import shutil
+from typing import List, Optional, Tuple
 from langchain.schema import Document
 from src.utils.embeddings import EmbeddingClient
+from src.utils.embedding_cache import with_cache
+from src.utils.embedding_executor import shared_executor
+from src.utils.fsio import write_json
+from src.utils.local_store import LocalStore, open_local_store, snapshot_local_store
+from src.utils.query_cache import default_query_cache, normalize_query
+from src.utils.bm25 import BM25Scorer
+from src.utils.hybrid import HybridRetriever, Leg
+from src.utils import ann
 from src.config import settings
-import os
 import numpy as np
 
+RETRIEVERS = ("tfidf", "bm25", "faiss", "hybrid")
+
+# versions of stores modified in this process (see VectorStore._modified)
+_LOCAL_VERSIONS = itertools.count(1)
+
+# files whose replacement publishes a new version of the persisted store
+_VERSION_FILES = (os.path.join("local", "segments.json"), "dense.json", "index.faiss")
+
+
+def persisted_version(persist_path: str = None) -> Tuple:
+    """Cheap fingerprint of what is on disk under `persist_path`.
+
+    Every commit (local segment list, FAISS snapshot pointer) is an os.replace,
+    which gives the file a new inode, so comparing stat results is enough to
+    notice that an ingest or compaction has finished.
+    """
+    persist_path = persist_path or settings.VECTORSTORE_PATH
+    sig = []
+    for name in _VERSION_FILES:
+        try:
+            st = os.stat(os.path.join(persist_path, name))
+            sig.append((name, st.st_ino, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((name, None))
+    return tuple(sig)
+
 
 class VectorStore:
     """Wrapper that uses FAISS/langchain when cloud embeddings are available,
-    otherwise uses an in-memory TF-IDF-backed store for local demos."""
-    def __init__(self, persist_path: str = None):
+    otherwise uses a lexical store persisted under `<persist_path>/local`
+    for local demos.
+
+    The backend follows `retriever` (default settings.RETRIEVER): "tfidf" and
+    "bm25" score the same local segments, "faiss" needs a cloud embedding
+    provider, and "auto" picks FAISS when one is configured, else TF-IDF.
+    "hybrid" keeps both the lexical store and FAISS, queries them in parallel
+    and fuses the rankings (see src.utils.hybrid).
+
+    Query embeddings and ranked hits are cached per `version` (see
+    src.utils.query_cache).
+
+    With `snapshot`, the instance is a read-only view of the store as
+    committed at construction: its lexical segments and embedder statistics
+    are private (see snapshot_local_store), so they never change under its
+    queries. Writing through a snapshot raises.
+    """
+    def __init__(self, persist_path: str = None, retriever: str = None, snapshot: bool = False):
         self.persist_path = persist_path or settings.VECTORSTORE_PATH
+        self.snapshot = snapshot
+        # taken before loading: if a commit lands mid-load the label is older than the
+        # content, which only costs cache misses
+        self._version = ("disk", self.persist_path, persisted_version(self.persist_path))
+        self.query_cache = default_query_cache()
         self.embedding_client = EmbeddingClient()
-        self._docs: List[Document] = []
-        self._embs = None
-        self._is_local = self.embedding_client.provider == "local"
+        self.retriever = self._resolve_retriever(retriever or settings.RETRIEVER)
+        self._has_lexical = self.retriever in ("tfidf", "bm25", "hybrid")
+        self._has_dense = self.retriever in ("faiss", "hybrid") and self.embedding_client.provider != "local"
+        self.store = None
+        if self._has_lexical:
+            try:
+                if snapshot:
+                    # a private read-only copy: nothing changes under this instance's queries
+                    self._local = snapshot_local_store(os.path.join(self.persist_path, "local"), self.embedding_client)
+                else:
+                    self._local = open_local_store(os.path.join(self.persist_path, "local"), self.embedding_client)
+                # statistics are shared with every other user of this store in the process
+                self.embedding_client.local_embedder = self._local.embedder
+            except Exception:
+                # unreadable store: start empty rather than failing every query
+                self._local = LocalStore(os.path.join(self.persist_path, "local"))
+            self._bm25 = BM25Scorer(self.embedding_client.local_embedder)
         # If using a non-local (FAISS) store, try to load an existing persisted store
-        if not self._is_local:
+        if self._has_dense:
             try:
                 from langchain.vectorstores import FAISS
                 # load_local may raise if path not present; guard with exists
-                if os.path.exists(self.persist_path):
+                dense_dir = self._dense_dir()
+                if os.path.exists(dense_dir):
                     try:
-                        self.store = FAISS.load_local(self.persist_path, embeddings=self._get_langchain_embeddings())
+                        self.store = FAISS.load_local(dense_dir, embeddings=self._get_langchain_embeddings())
+                        ann.configure_search(self.store.index)
                     except Exception:
                         # fallback: no loaded store
                         self.store = None
@@ -33,60 +106,264 @@ class VectorStore:
                 # langchain/FAISS not available
                 self.store = None
 
-    def add_documents(self, docs: List[Document]):
+    @property
+    def version(self) -> Tuple:
+        """Identifies the indexed content; changes on every modification."""
+        return self._version
+
+    def _modified(self):
+        old, self._version = self._version, ("local", next(_LOCAL_VERSIONS))
+        self.query_cache.invalidate_version(old)
+
+    def _dense_dir(self) -> str:
+        """Directory of the current FAISS snapshot (see _save_dense)."""
+        try:
+            with open(os.path.join(self.persist_path, "dense.json"), "r", encoding="utf-8") as f:
+                return os.path.join(self.persist_path, json.load(f)["current"])
+        except Exception:
+            # stores saved before snapshots were introduced live in persist_path itself
+            return self.persist_path
+
+    def _save_dense(self):
+        """Write the FAISS store as a new snapshot directory, then switch the
+        `dense.json` pointer to it, so a concurrent reader loads either the old
+        or the new index, never a half-written one."""
+        os.makedirs(self.persist_path, exist_ok=True)
+        snapshots = sorted(n for n in os.listdir(self.persist_path) if n.startswith("dense_"))
+        last = int(snapshots[-1].split("_")[1]) if snapshots else 0
+        name = f"dense_{last + 1:06d}"
+        self.store.save_local(os.path.join(self.persist_path, name))
+        write_json(os.path.join(self.persist_path, "dense.json"), {"current": name})
+        # keep the previous snapshot for readers that picked it up just before the switch
+        for old in snapshots[:-1]:
+            shutil.rmtree(os.path.join(self.persist_path, old), ignore_errors=True)
+
+    def _resolve_retriever(self, name: str) -> str:
+        name = (name or "auto").lower()
+        if name == "auto":
+            return "tfidf" if self.embedding_client.provider == "local" else "faiss"
+        if name not in RETRIEVERS:
+            raise ValueError(f"Unknown retriever {name!r}; expected auto or one of {', '.join(RETRIEVERS)}")
+        if name == "faiss" and self.embedding_client.provider == "local":
+            # no cloud embeddings configured: FAISS has nothing to index with
+            return "tfidf"
+        return name
+
+    def _hybrid_retriever(self) -> HybridRetriever:
+        if getattr(self, "_hybrid", None) is None:
+            legs = [Leg("lexical", self._lexical_search, settings.HYBRID_LEXICAL_TIMEOUT_MS / 1000.0,
+                        weight=settings.HYBRID_LEXICAL_WEIGHT)]
+            if self._has_dense:
+                legs.append(Leg("dense", self._dense_search, settings.HYBRID_DENSE_TIMEOUT_MS / 1000.0,
+                                weight=1.0 - settings.HYBRID_LEXICAL_WEIGHT, distance=True))
+            self._hybrid = HybridRetriever(legs)
+        return self._hybrid
+
+    def embed_dense(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Cloud embeddings of `texts` for the FAISS index (None without one).
+        Lets ingest embed the next micro-batch while this one is indexed."""
+        if not self._has_dense:
+            return None
+        return np.asarray(self._get_langchain_embeddings().embed_documents(texts), dtype=np.float32)
+
+    def add_documents(self, docs: List[Document], persist: bool = True, vectors: Optional[np.ndarray] = None):
+        """Index `docs`. Lexical segments are committed on every call; the
+        FAISS snapshot (a full copy of the index) only when `persist` is set,
+        so streaming ingest can save it every few batches and `flush` at the end.
+        `vectors` are the docs' embeddings when already computed (see embed_dense)."""
+        self._check_writable()
         # store docs and compute embeddings
         texts = [d.page_content for d in docs]
-        if self._is_local:
-            mat = self.embedding_client.embed_documents(texts)
-            # mat is a sparse matrix
-            if self._embs is None:
-                self._embs = mat
-            else:
-                from scipy.sparse import vstack
-                self._embs = vstack([self._embs, mat])
-            base_idx = len(self._docs)
-            for i, d in enumerate(docs):
-                self._docs.append(d)
-        else:
+        if self._has_lexical:
+            # raw hashed term counts; both lexical scorers derive their weights from them
+            embedder = self.embedding_client.local_embedder
+            counts = embedder.counts(texts)
+            embedder.partial_fit(counts)
+            self._local.add(docs, counts, self.embedding_client)
+        if self._has_dense:
             # For cloud-backed embeddings we defer to langchain FAISS store
             try:
                 from langchain.vectorstores import FAISS
-                from langchain.embeddings import OpenAIEmbeddings, HuggingFaceEmbeddings
+                from langchain.docstore.in_memory import InMemoryDocstore
             except Exception:
                 raise RuntimeError("FAISS/langchain not available in this environment")
+            embeddings = self._get_langchain_embeddings()
+            if vectors is None:
+                vectors = self.embed_dense(texts)
             if getattr(self, "store", None) is None:
-                self.store = FAISS.from_documents(docs, embeddings=self._get_langchain_embeddings())
-            else:
-                self.store.add_documents(docs)
-            os.makedirs(self.persist_path, exist_ok=True)
+                # index type per FAISS_INDEX; IVF variants are trained on a sample of this batch
+                index = ann.initial_index(vectors)
+                self.store = FAISS(embeddings.embed_query, index, InMemoryDocstore({}), {})
+            self.store.add_embeddings(list(zip(texts, vectors.tolist())), metadatas=[d.metadata for d in docs])
+            # a flat index kept while the corpus was too small to train is replaced once it is big enough
+            upgraded = ann.maybe_upgrade(self.store.index)
+            if upgraded is not None:
+                self.store.index = upgraded
+            if persist:
+                self.flush()
+        self._modified()
+
+    def flush(self):
+        """Persist the in-memory FAISS store (no-op for the lexical store)."""
+        if getattr(self, "store", None) is not None:
             try:
-                self.store.save_local(self.persist_path)
+                self._save_dense()
             except Exception:
                 pass
 
+    def _check_writable(self):
+        if self.snapshot:
+            raise RuntimeError("this VectorStore is a read-only snapshot; write through VectorStore() instead")
+
+    def wait_for_compaction(self, timeout: float = None) -> bool:
+        """Block until the lexical store's pending segment merges are done."""
+        if self._has_lexical:
+            return self._local.wait_for_compaction(timeout)
+        return True
+
+    def delete_paths(self, paths) -> int:
+        """Remove every chunk whose metadata "path" is in `paths` (used when a
+        file is re-ingested); returns the number of chunks removed."""
+        self._check_writable()
+        paths = {str(p) for p in paths}
+        if not paths:
+            return 0
+        removed = 0
+        if self._has_lexical:
+            removed = self._local.delete_paths(paths, self.embedding_client)
+        if self._has_dense and getattr(self, "store", None) is not None:
+            ids = self.store.index_to_docstore_id
+            rows = [
+                i for i, doc_id in ids.items()
+                if str(getattr(self.store.docstore.search(doc_id), "metadata", {}).get("path")) in paths
+            ]
+            if rows:
+                gone = {ids[i] for i in rows}
+                self.store.index = ann.remove_rows(self.store.index, rows)
+                self.store.docstore.delete(list(gone))
+                self.store.index_to_docstore_id = dict(enumerate(d for _, d in sorted(ids.items()) if d not in gone))
+                self.flush()
+                removed = max(removed, len(rows))
+        if removed:
+            self._modified()
+        return removed
+
     def _get_langchain_embeddings(self):
+        # the cloud client already goes through the embedding cache; reuse it
+        # instead of creating a new provider client per call
+        if self.embedding_client.provider in ("openai", "hf") and self.embedding_client._client is not None:
+            return self.embedding_client._client
         if self.embedding_client.provider == "openai":
-            from langchain.embeddings import OpenAIEmbeddings
-            return OpenAIEmbeddings(model=settings.EMBEDDING_MODEL)
+            return with_cache(shared_executor(settings.EMBEDDING_MODEL), f"openai:{settings.EMBEDDING_MODEL}")
         else:
             from langchain.embeddings import HuggingFaceEmbeddings
-            return HuggingFaceEmbeddings(model_name=settings.HF_EMBEDDING_MODEL)
+            return with_cache(HuggingFaceEmbeddings(model_name=settings.HF_EMBEDDING_MODEL), f"hf:{settings.HF_EMBEDDING_MODEL}")
+
+    def _lexical_search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        if len(self._local) == 0:
+            return []
+        embedder = self.embedding_client.local_embedder
+        scorer = settings.HYBRID_LEXICAL if self.retriever == "hybrid" else self.retriever
+        if scorer == "bm25":
+            hits = self._bm25.search(self._local.segments, embedder.counts([query]), k)
+            return [(seg.get_document(i), score) for score, seg, i in hits]
+        # tf-idf dot-product similarity, fanned out over the store's segments
+        return self._local.search(embedder.transform_query(query), k)
+
+    @property
+    def embedding_model(self) -> str:
+        """"<provider>:<model>" of the cloud embeddings (what query_embedding returns)."""
+        client = self.embedding_client
+        model = settings.EMBEDDING_MODEL if client.provider == "openai" else settings.HF_EMBEDDING_MODEL
+        return f"{client.provider}:{model}"
+
+    def query_embedding(self, query: str) -> Optional[List[float]]:
+        """Cloud embedding of a query (cached), or None when there is no dense index."""
+        if not self._has_dense:
+            return None
+        key = (self.embedding_model, query)
+        vector = self.query_cache.embeddings.get(key)
+        if vector is None:
+            vector = self._get_langchain_embeddings().embed_query(query)
+            self.query_cache.embeddings.put(key, vector)
+        return vector
+
+    def _query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """query_embedding for many queries; the misses are embedded in one batch."""
+        keys = [(self.embedding_model, q) for q in queries]
+        vectors = [self.query_cache.embeddings.get(key) for key in keys]
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+        if missing:
+            client = self._get_langchain_embeddings()
+            # past the document-embedding cache: queries are not chunks and would only crowd it
+            fresh = dict(zip(missing, getattr(client, "inner", client).embed_documents(missing)))
+            for key, vector in fresh.items():
+                self.query_cache.embeddings.put((self.embedding_model, key), vector)
+            vectors = [v if v is not None else fresh[q] for q, v in zip(queries, vectors)]
+        return vectors
+
+    def _dense_search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        if getattr(self, "store", None) is None:
+            return []
+        return self.store.similarity_search_with_score_by_vector(self.query_embedding(query), k=k)
 
     def similarity_search_with_scores(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
-        if self._is_local:
-            if self._embs is None or len(self._docs) == 0:
-                return []
-            qv = self.embedding_client.embed_query(query)
-            # compute dot-product similarity
-            sims = (self._embs @ qv.T).toarray().ravel()
-            idxs = np.argsort(sims)[::-1][:k]
-            return [(self._docs[int(i)], float(sims[int(i)])) for i in idxs]
+        query = normalize_query(query)
+        key = (self.retriever, query, k, self._version)
+        hits = self.query_cache.results.get(key)
+        if hits is not None:
+            return list(hits)
+        complete = True
+        if self.retriever == "hybrid":
+            hits, complete = self._hybrid_retriever().search(query, k=k)
+        elif self._has_lexical:
+            hits = self._lexical_search(query, k)
         else:
-            if getattr(self, "store", None) is None:
-                return []
-            return self.store.similarity_search_with_score(query, k=k)
+            hits = self._dense_search(query, k)
+        # a hybrid answer missing a leg is not cached, the next ask may get the full one
+        if complete and key[-1] == self._version:
+            self.query_cache.results.put(key, list(hits))
+        return hits
+
+    def similarity_search_batch(self, queries: List[str], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        """Top-k for many queries at once; same results as calling
+        similarity_search_with_scores per query, without the per-query overhead."""
+        queries = [normalize_query(q) for q in queries]
+        if not queries:
+            return []
+        if self.retriever == "hybrid":
+            # legs have their own deadlines per query; fusion is cheap next to them
+            retriever = self._hybrid_retriever()
+            return [retriever.similarity_search_with_scores(q, k=k) for q in queries]
+        if self._has_lexical:
+            if len(self._local) == 0:
+                return [[] for _ in queries]
+            embedder = self.embedding_client.local_embedder
+            if self.retriever == "bm25":
+                batch = self._bm25.search_batch(self._local.segments, embedder.counts(queries), k)
+                return [[(seg.get_document(i), score) for score, seg, i in hits] for hits in batch]
+            return self._local.search_batch(embedder.transform_queries(queries), k)
+        if getattr(self, "store", None) is None:
+            return [[] for _ in queries]
+        # one index.search over the whole query matrix
+        vectors = np.asarray(self._query_embeddings(queries), dtype=np.float32)
+        distances, ids = self.store.index.search(vectors, k)
+        results = []
+        for dist_row, id_row in zip(distances, ids):
+            hits = []
+            for dist, i in zip(dist_row, id_row):
+                if i == -1:
+                    continue
+                doc = self.store.docstore.search(self.store.index_to_docstore_id[int(i)])
+                if isinstance(doc, Document):
+                    hits.append((doc, float(dist)))
+            results.append(hits)
+        return results
 
     def is_empty(self) -> bool:
-        if self._is_local:
-            return len(self._docs) == 0
-        return getattr(self, "store", None) is None
\ No newline at end of file
+        empty = True
+        if self._has_lexical:
+            empty = empty and len(self._local) == 0
+        if self._has_dense:
+            empty = empty and getattr(self, "store", None) is None
+        return empty
@@ -0,0 +1,162 @@
+"""Persistent cache of web search results, keyed by (provider, normalized query, k).
+
+Backed by a single SQLite file (`WEB_CACHE_PATH`; empty disables the cache),
+like the embedding and response caches. Entries expire after
+`WEB_CACHE_TTL` seconds. A provider that answered with no results is cached
+as well, but only for `WEB_CACHE_NEGATIVE_TTL` seconds.
+
+A failed provider call (error, timeout, bad status) stores a negative entry
+for the provider as a whole, also for `WEB_CACHE_NEGATIVE_TTL` seconds.
+While it is present, `provider_down()` is true and search_web does not call
+that provider.
+
+Past `WEB_CACHE_MAX_ENTRIES` entries, expired and then least recently used
+entries are evicted.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from src.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS web_results (
+    provider TEXT NOT NULL,
+    query TEXT NOT NULL,
+    k INTEGER NOT NULL,
+    results TEXT NOT NULL,
+    expires REAL NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (provider, query, k)
+);
+CREATE INDEX IF NOT EXISTS web_results_lru ON web_results (last_used);
+"""
+
+# query/k of a provider's "down" marker
+_DOWN = ("", -1)
+
+
+class WebSearchCache:
+    def __init__(self, path: str, ttl: float = None, negative_ttl: float = None, max_entries: int = None):
+        self.path = path
+        self.ttl = settings.WEB_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = settings.WEB_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.max_entries = settings.WEB_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0  # provider calls avoided because the provider was marked down
+        self.failures = 0
+        self.evictions = 0
+        self._entries = int(self._conn.execute("SELECT COUNT(*) FROM web_results").fetchone()[0])
+
+    def get(self, providers: Sequence[str], query: str, k: int) -> Dict[str, List[Dict]]:
+        """provider -> cached results (possibly empty) for every provider with a live entry."""
+        if not providers:
+            return {}
+        now = time.time()
+        marks = ",".join("?" * len(providers))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT provider, results FROM web_results WHERE provider IN ({marks}) AND query = ? AND k = ? "
+                f"AND expires > ?", [*providers, query, k, now]
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE web_results SET last_used = ? WHERE provider = ? AND query = ? AND k = ?",
+                    [(time.time_ns(), provider, query, k) for provider, _ in rows],
+                )
+                self._conn.commit()
+                self.hits += 1
+            else:
+                self.misses += 1
+        return {provider: json.loads(results) for provider, results in rows}
+
+    def put(self, provider: str, query: str, k: int, results: List[Dict]):
+        ttl = self.ttl if results else self.negative_ttl
+        self._store(provider, query, k, results, ttl)
+
+    def provider_down(self, provider: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM web_results WHERE provider = ? AND query = ? AND k = ? AND expires > ?",
+                (provider, *_DOWN, time.time()),
+            ).fetchone()
+            if row is not None:
+                self.skipped += 1
+            return row is not None
+
+    def mark_down(self, provider: str):
+        with self._lock:
+            self.failures += 1
+        self._store(provider, *_DOWN, [], self.negative_ttl)
+
+    def _store(self, provider: str, query: str, k: int, results: List[Dict], ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT 1 FROM web_results WHERE provider = ? AND query = ? AND k = ?", (provider, query, k)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO web_results (provider, query, k, results, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, query, k, json.dumps(results), time.time() + ttl, time.time_ns()),
+            )
+            self._conn.commit()
+            # a refresh of an existing key (re-fetch after expiry, provider marked down again) is not a new entry
+            if old is None:
+                self._entries += 1
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """Drop expired, then least recently used entries down to 90% of the cap (caller holds the lock)."""
+        self._conn.execute("DELETE FROM web_results WHERE expires <= ?", (time.time(),))
+        count = int(self._conn.execute("SELECT COUNT(*) FROM web_results").fetchone()[0])
+        target = int(self.max_entries * 0.9)
+        if count > target:
+            self._conn.execute(
+                "DELETE FROM web_results WHERE rowid IN (SELECT rowid FROM web_results ORDER BY last_used LIMIT ?)",
+                (count - target,),
+            )
+        self._conn.commit()
+        self._entries = int(self._conn.execute("SELECT COUNT(*) FROM web_results").fetchone()[0])
+        self.evictions += count - self._entries if count > self._entries else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "skipped_down_providers": self.skipped,
+                "provider_failures": self.failures,
+                "entries": self._entries,
+                "evictions": self.evictions,
+            }
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def default_web_cache() -> Optional[WebSearchCache]:
+    """Process-wide cache at WEB_CACHE_PATH, or None when disabled."""
+    path = settings.WEB_CACHE_PATH
+    if not path:
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = _CACHES[path] = WebSearchCache(path)
+        return cache
@@ -1,25 +1,69 @@
 """Web search helpers to fetch current context from the web.
 
-Provides a small wrapper around Bing Web Search (Azure/Bing) and SerpAPI
-for optional context enrichment. Returns a list of dicts: {title, snippet, url}.
+Provides a small wrapper around Google Custom Search, Bing Web Search
+(Azure/Bing) and SerpAPI for optional context enrichment. Returns a list of
+dicts: {title, snippet, url}. Every configured provider is queried at once
+and the first non-empty result set wins, so a slow or failing provider
+does not hold up the others.
+
+Each provider has its own pooled `requests.Session` (keep-alive). Answers,
+including empty ones, go to a persistent cache keyed by (provider,
+normalized query, k); a provider that fails is skipped for a while (see
+src.utils.web_cache). Late answers from providers that lost the race are
+cached too.
 
 Environment variables supported (see src.config.Settings):
+- GOOGLE_API_KEY, GOOGLE_CX, GOOGLE_ENDPOINT
 - BING_API_KEY, BING_ENDPOINT
-- SERPAPI_KEY
+- SERPAPI_KEY, SERPAPI_ENDPOINT
+- WEB_SEARCH_TIMEOUT (seconds to wait for an answer)
+- WEB_CACHE_PATH, WEB_CACHE_TTL, WEB_CACHE_NEGATIVE_TTL, WEB_CACHE_MAX_ENTRIES
+
+The endpoints can point at src.eval.standin_server for tests.
 
 Note: This is a lightweight helper for demo purposes. For production use,
 handle rate limits, retries, caching, and parsing more robustly.
 """
-from typing import List, Dict
-import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Dict, Tuple
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from src.config import settings
+from src.utils.query_cache import normalize_query
+from src.utils.web_cache import default_web_cache
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_SESSIONS: Dict[str, requests.Session] = {}
+
 
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="web-search")
+        return _POOL
 
-def _bing_search(query: str, k: int = 5) -> List[Dict]:
+
+def _session(provider: str) -> requests.Session:
+    """Keep-alive connection pool for one provider."""
+    with _POOL_LOCK:
+        session = _SESSIONS.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSIONS[provider] = session
+        return session
+
+
+def _bing_search(query: str, k: int = 5, timeout: float = 10) -> List[Dict]:
     headers = {"Ocp-Apim-Subscription-Key": settings.BING_API_KEY}
     params = {"q": query, "count": k}
-    resp = requests.get(settings.BING_ENDPOINT, headers=headers, params=params, timeout=10)
+    resp = _session("bing").get(settings.BING_ENDPOINT, headers=headers, params=params, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
     results = []
@@ -29,12 +73,11 @@ def _bing_search(query: str, k: int = 5) -> List[Dict]:
     return results
 
 
-def _serpapi_search(query: str, k: int = 5) -> List[Dict]:
+def _serpapi_search(query: str, k: int = 5, timeout: float = 10) -> List[Dict]:
     # SerpAPI simple JSON interface
     key = settings.SERPAPI_KEY
-    url = "https://serpapi.com/search.json"
     params = {"q": query, "api_key": key, "num": k}
-    resp = requests.get(url, params=params, timeout=10)
+    resp = _session("serpapi").get(settings.SERPAPI_ENDPOINT, params=params, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
     results = []
@@ -43,47 +86,82 @@ def _serpapi_search(query: str, k: int = 5) -> List[Dict]:
     return results
 
 
-def search_web(query: str, k: int = 5) -> List[Dict]:
-    """Search the web using available provider. Returns list of results.
+def _providers() -> List[Tuple[str, Callable[..., List[Dict]]]]:
+    """Configured providers, in order of preference for results that arrive together."""
+    providers = []
+    if getattr(settings, "GOOGLE_API_KEY", None) and getattr(settings, "GOOGLE_CX", None):
+        providers.append(("google", _google_search))
+    if settings.BING_API_KEY:
+        providers.append(("bing", _bing_search))
+    if settings.SERPAPI_KEY:
+        providers.append(("serpapi", _serpapi_search))
+    return providers
 
-    Provider selection order:
-    1. Bing (if BING_API_KEY present)
-    2. SerpAPI (if SERPAPI_KEY present)
-    3. Empty list if none configured
-    """
-    # Prefer Google Custom Search when configured
-    try:
-        if getattr(settings, "GOOGLE_API_KEY", None) and getattr(settings, "GOOGLE_CX", None):
-            return _google_search(query, k=k)
-    except Exception:
-        pass
 
-    # Next prefer Bing
+def _call(name: str, fn: Callable[..., List[Dict]], query: str, key: str, k: int, timeout: float) -> List[Dict]:
+    """One provider call; the outcome (results, or the provider being down) goes to the cache."""
+    cache = default_web_cache()
     try:
-        if settings.BING_API_KEY:
-            return _bing_search(query, k=k)
+        results = fn(query, k=k, timeout=timeout)
     except Exception:
-        pass
+        if cache is not None:
+            cache.mark_down(name)
+        raise
+    if cache is not None:
+        cache.put(name, key, k, results)
+    return results
 
-    # Fallback to SerpAPI
-    try:
-        if settings.SERPAPI_KEY:
-            return _serpapi_search(query, k=k)
-    except Exception:
-        pass
 
+def search_web(query: str, k: int = 5, timeout: float = None) -> List[Dict]:
+    """Search the web using every configured provider at once. Returns the
+    first non-empty result list, or an empty list when no provider is
+    configured, none answers with results, or `timeout` seconds (default
+    WEB_SEARCH_TIMEOUT) pass first.
+
+    Providers: Google Custom Search (GOOGLE_API_KEY and GOOGLE_CX), Bing
+    (BING_API_KEY) and SerpAPI (SERPAPI_KEY). Cached answers are used
+    without calling anyone; providers marked down are skipped.
+    """
+    timeout = settings.WEB_SEARCH_TIMEOUT if timeout is None else timeout
+    providers = _providers()
+    if not providers:
+        return []
+    key = normalize_query(query).lower()
+    cache = default_web_cache()
+    if cache is not None:
+        cached = cache.get([name for name, _ in providers], key, k)
+        for name, _ in providers:
+            if cached.get(name):
+                return cached[name]
+        # a provider that recently answered "nothing", or failed, is not asked again yet
+        providers = [(name, fn) for name, fn in providers if name not in cached and not cache.provider_down(name)]
+    end = time.monotonic() + timeout
+    preference = {name: i for i, (name, _) in enumerate(providers)}
+    pending = {_pool().submit(_call, name, fn, query, key, k, timeout): name for name, fn in providers}
+    while pending:
+        done, _ = wait(list(pending), timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in sorted(done, key=lambda f: preference[pending[f]]):
+            del pending[future]
+            try:
+                results = future.result()
+            except Exception:
+                continue
+            if results:
+                # the others finish in the background, bounded by their request timeout
+                return results
     return []
 
 
-def _google_search(query: str, k: int = 5) -> List[Dict]:
+def _google_search(query: str, k: int = 5, timeout: float = 10) -> List[Dict]:
     """Call Google Custom Search JSON API and return list of {title,snippet,url}."""
     key = settings.GOOGLE_API_KEY
     cx = settings.GOOGLE_CX
     if not key or not cx:
         return []
-    url = "https://www.googleapis.com/customsearch/v1"
     params = {"q": query, "key": key, "cx": cx, "num": k}
-    resp = requests.get(url, params=params, timeout=10)
+    resp = _session("google").get(settings.GOOGLE_ENDPOINT, params=params, timeout=timeout)
     resp.raise_for_status()
     data = resp.json()
     results = []